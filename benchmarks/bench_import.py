@@ -0,0 +1,123 @@
+"""Время импорта модулей сервисов в чистом интерпретаторе.
+
+Импорт не должен ходить в базу и во внешние API: модули проверяются с
+заведомо недоступной базой, упавший импорт считается ошибкой. Каждый модуль
+импортируется в отдельном процессе несколько раз, берется медиана.
+
+Запуск из корня репозитория:
+    uv run python -m benchmarks.bench_import --budget 1.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICE_MODULES = [
+    "scripts/cbrf/cbrf_data.py",
+    "scripts/moex_iss_indices/moex_iss_indices.py",
+    "scripts/moex_iss_dividends/moex_iss_dividends.py",
+    "scripts/t-pulse/automatization/parse_tpulse_daily.py",
+    "scripts/tinkoff/tinkoff_stock.py",
+    "scripts/tinkoff/tinkoff_intraday.py",
+    "scripts/tinkoff/tinkoff_stream.py",
+    "scripts/features/refresh_features.py",
+    "scripts/scheduler/run_scheduler.py",
+]
+
+# Импорт файла как модуля (в путях есть дефисы) и вывод времени в секундах
+IMPORT_SNIPPET = """
+import importlib.util, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("bench_target", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(time.perf_counter() - started)
+"""
+
+# База, до которой импорт не должен пытаться достучаться
+OFFLINE_ENV = {
+    "DB_HOST": "db.invalid",
+    "DB_PORT": "5432",
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+}
+
+
+def _env(root):
+    pythonpath = os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))
+    return {**os.environ, **OFFLINE_ENV, "PYTHONPATH": pythonpath}
+
+
+def import_once(path, root):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET, path],
+        cwd=root,
+        env=_env(root),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    if result.returncode:
+        return None, result.stderr.strip().splitlines()[-1]
+    return float(result.stdout.strip().splitlines()[-1]), None
+
+
+def slowest_imports(path, root, top=5):
+    """Самые тяжелые зависимости модуля по -X importtime (накопительное время)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET, path],
+        cwd=root,
+        env=_env(root),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Вложенность обозначается отступом имени, берем только прямые импорты
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="секунд на импорт модуля")
+    parser.add_argument("--details", action="store_true", help="тяжелые зависимости")
+    parser.add_argument("modules", nargs="*", default=SERVICE_MODULES)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    over_budget = False
+    print(f"{'модуль':<56}{'медиана, с':>12}{'макс, с':>10}")
+    for path in args.modules:
+        timings, error = [], None
+        for _ in range(args.repeat):
+            elapsed, error = import_once(path, root)
+            if error:
+                break
+            timings.append(elapsed)
+        if error:
+            over_budget = True
+            print(f"{path:<56}{'ошибка':>12}  {error}")
+            continue
+
+        median = statistics.median(timings)
+        mark = "" if median <= args.budget else "  > бюджета"
+        over_budget |= median > args.budget
+        print(f"{path:<56}{median:>12.3f}{max(timings):>10.3f}{mark}")
+        if args.details:
+            for cumulative, name in slowest_imports(path, root):
+                print(f"    {name:<52}{cumulative:>12.3f}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
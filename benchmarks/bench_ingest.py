@@ -0,0 +1,212 @@
+"""Пропускная способность сборщиков против локальных заглушек API.
+
+Заглушки из benchmarks.fake_servers поднимаются в этом же процессе,
+сборщики направляются на них через ISS_BASE_URL, CBR_BASE_URL,
+TPULSE_BASE_URL и TINKOFF_TARGET. По умолчанию меряется загрузка и разбор
+ответов без базы; с --write сценарии выполняют полную итерацию сервиса с
+записью в базу из DB_* (нужна подготовленная схема).
+
+Запуск из корня репозитория:
+    uv run python -m benchmarks.bench_ingest --latency 0.02 --rate-limit 200
+    uv run python -m benchmarks.bench_ingest iss_board tpulse --json bench.json
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.fake_servers import (
+    add_config_arguments,
+    config_from_args,
+    grpc_env,
+    http_env,
+    start_grpc,
+    start_http,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_service(path):
+    """Модуль сервиса по пути файла (в путях есть дефисы)"""
+    name = "bench_" + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Сценарий: args -> количество строк (None, если считает сам сервис); выполняется
+# после запуска заглушек
+
+
+def bench_iss_board(args):
+    """История всех индексов за args.days дней, board-запросами с пагинацией"""
+    module = load_service("scripts/moex_iss_indices/moex_iss_indices.py")
+    till = date.today()
+    if args.write:
+        module.backfill(till - timedelta(days=args.days - 1), till)
+        return None
+    return len(module.fetch_index_data_range(till - timedelta(days=args.days - 1), till))
+
+
+def bench_iss_codes(args):
+    """Данные за последний будний день отдельным запросом на каждый код индекса"""
+    module = load_service("scripts/moex_iss_indices/moex_iss_indices.py")
+    if args.write:
+        module.FETCH_MODE = "code"
+        module.collect()
+        return None
+    today = datetime.today()
+    weekday = today - timedelta(days=max(today.weekday() - 4, 0))
+    return len(module.fetch_today_all_codes(weekday))
+
+
+def bench_dividends(args):
+    module = load_service("scripts/moex_iss_dividends/moex_iss_dividends.py")
+    if args.write:
+        return module.collect()
+    from utils.iss import fetch_many
+
+    results, _ = fetch_many(module.fetch_index_data, module.tickers)
+    return sum(len(df) for df in results.values())
+
+
+def bench_cbrf(args):
+    module = load_service("scripts/cbrf/cbrf_data.py")
+    if args.write:
+        module.collect()
+        return None
+    return len(module.fetch_last_cbrf_data(date.today().year))
+
+
+def bench_tpulse(args):
+    """Посты за 28 дней по первым args.tickers тикерам с боевыми лимитами запросов"""
+    module = load_service("scripts/t-pulse/automatization/parse_tpulse_daily.py")
+    module.tickers = module.tickers[: args.tickers]
+    if args.write:
+        module.run_full()
+        return None
+    from utils.iss import fetch_many
+
+    results, _ = fetch_many(
+        lambda ticker: sum(
+            1 for _ in module.iter_last_twentyeight_days(ticker, limiter=module.rate_limiter)
+        ),
+        module.tickers,
+        max_workers=max(module.WORKERS, 1),
+    )
+    return sum(results.values())
+
+
+def bench_tinkoff(args):
+    """Дневные свечи за args.years лет по args.tickers инструментам через AsyncClient"""
+    if args.write:
+        module = load_service("scripts/tinkoff/tinkoff_stock.py")
+        return module.update_stock_data_async()
+    from utils.tinkoff_async import fetch_candles
+
+    end = datetime.utcnow()
+    jobs = [
+        (f"T{number:02d}", f"FAKE{number:08d}", end - timedelta(days=365 * args.years), end)
+        for number in range(args.tickers)
+    ]
+    candles, _ = fetch_candles(jobs, os.environ["TINKOFF_TOKEN"])
+    return sum(len(items) for items in candles.values())
+
+
+SCENARIOS = {
+    "iss_board": bench_iss_board,
+    "iss_codes": bench_iss_codes,
+    "dividends": bench_dividends,
+    "cbrf": bench_cbrf,
+    "tpulse": bench_tpulse,
+    "tinkoff": bench_tinkoff,
+}
+
+
+def run_scenario(name, args, stats):
+    before = stats.snapshot()
+    started = time.perf_counter()
+    rows = SCENARIOS[name](args)
+    elapsed = time.perf_counter() - started
+    after = stats.snapshot()
+    requests = sum(after["requests"].values()) - sum(before["requests"].values())
+    errors = sum(after["errors"].values()) - sum(before["errors"].values())
+    return {
+        "scenario": name,
+        "seconds": elapsed,
+        "rows": rows,
+        "requests": requests,
+        "errors": errors,
+        "rows_per_second": rows / elapsed if rows else None,
+        "requests_per_second": requests / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_config_arguments(parser)
+    parser.add_argument("--days", type=int, default=30, help="дней истории ISS")
+    parser.add_argument("--tickers", type=int, default=10, help="тикеров T-Пульса и Tinkoff")
+    parser.add_argument("--years", type=int, default=3, help="лет свечей Tinkoff")
+    parser.add_argument("--write", action="store_true", help="полная итерация с записью в базу")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("scenarios", nargs="*", help=f"по умолчанию все: {', '.join(SCENARIOS)}")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    # Каждый запрос httpx (клиент tpulse) пишется в лог на уровне INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    config = config_from_args(args)
+    http_server, base_url, http_stats = start_http(config)
+    os.environ.update(http_env(base_url))
+    grpc_stats = None
+    if "tinkoff" in args.scenarios:
+        try:
+            _, target, grpc_stats = start_grpc(config)
+            os.environ.update(grpc_env(target))
+        except ImportError as e:
+            print(f"Заглушка Tinkoff недоступна ({e}), сценарий tinkoff пропущен")
+            args.scenarios.remove("tinkoff")
+
+    print(
+        f"{'сценарий':<12}{'с':>8}{'строк':>10}{'запросов':>10}"
+        f"{'ошибок':>8}{'строк/с':>10}{'запр/с':>9}"
+    )
+    results = []
+    for name in args.scenarios:
+        stats = grpc_stats if name == "tinkoff" else http_stats
+        try:
+            result = run_scenario(name, args, stats)
+        except Exception as e:
+            print(f"{name:<12}  ошибка: {e}")
+            results.append({"scenario": name, "error": repr(e)})
+            continue
+        results.append(result)
+        rows = "-" if result["rows"] is None else result["rows"]
+        rate = "-" if result["rows_per_second"] is None else f"{result['rows_per_second']:.0f}"
+        print(
+            f"{name:<12}{result['seconds']:>8.2f}{rows:>10}{result['requests']:>10}"
+            f"{result['errors']:>8}{rate:>10}{result['requests_per_second']:>9.1f}"
+        )
+
+    http_server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(config), "results": results}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if any("error" in result for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Сравнение построчного SELECT-then-UPDATE/INSERT с пакетным upsert.
+
+Запуск из корня репозитория (нужна БД из .env):
+    uv run python -m benchmarks.bench_upsert --rows 5000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Date, MetaData, Numeric, String, Table
+
+from utils.upsert import ensure_unique_index, upsert_dataframe
+from utils.utils import connection
+
+KEY_COLUMNS = ["date", "index_code"]
+
+
+def make_table(name):
+    metadata = MetaData()
+    return Table(
+        name,
+        metadata,
+        Column("date", Date),
+        Column("index_code", String(20)),
+        Column("open", Numeric(15, 6)),
+        Column("close", Numeric(15, 6)),
+    )
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = [f"IDX{i:03d}" for i in range(max(1, rows // 1000))]
+    per_code = -(-rows // len(codes))
+    dates = pd.bdate_range("2000-01-03", periods=per_code).date
+    df = pd.DataFrame(
+        {
+            "date": np.tile(dates, len(codes))[:rows],
+            "index_code": np.repeat(codes, per_code)[:rows],
+        }
+    )
+    df["open"] = rng.uniform(100, 5000, rows).round(2)
+    df["close"] = rng.uniform(100, 5000, rows).round(2)
+    return df
+
+
+def legacy_update_db(conn, table, df):
+    """Старый путь: SELECT и затем UPDATE или INSERT на каждую запись"""
+    for record in df.to_dict(orient="records"):
+        condition = (table.c.date == record["date"]) & (
+            table.c.index_code == record["index_code"]
+        )
+        existing = conn.execute(table.select().where(condition)).first()
+        if existing:
+            conn.execute(
+                table.update()
+                .where(condition)
+                .values(open=record["open"], close=record["close"])
+            )
+        else:
+            conn.execute(table.insert().values(**record))
+
+
+def run_case(engine, table, df, writer):
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    with engine.begin() as conn:
+        ensure_unique_index(conn, table, KEY_COLUMNS)
+
+    timings = []
+    # Первый проход - вставка, второй - обновление существующих строк
+    for _ in range(2):
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            writer(conn, table, df)
+        timings.append(time.perf_counter() - started)
+    table.drop(engine, checkfirst=True)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine = connection()
+    df = make_frame(args.rows)
+    cases = {
+        "legacy": legacy_update_db,
+        "insert": lambda conn, table, frame: upsert_dataframe(
+            frame, table, KEY_COLUMNS, conn, method="insert"
+        ),
+        "copy": lambda conn, table, frame: upsert_dataframe(
+            frame, table, KEY_COLUMNS, conn, method="copy"
+        ),
+    }
+
+    print(f"Строк: {args.rows}")
+    print(f"{'метод':<10}{'вставка, с':>14}{'обновление, с':>16}")
+    for name, writer in cases.items():
+        inserted, updated = run_case(engine, make_table(f"bench_upsert_{name}"), df, writer)
+        print(f"{name:<10}{inserted:>14.3f}{updated:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
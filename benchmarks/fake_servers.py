@@ -0,0 +1,536 @@
+"""Локальные заглушки ISS MOEX, ЦБ, Т-Пульса и gRPC API Tinkoff для нагрузочных тестов.
+
+HTTP-заглушка отвечает в форматах, которые разбирают сборщики:
+    /iss/history/engines/stock/markets/index/securities.json        board-история с курсором
+    /iss/history/engines/stock/markets/index/securities/<код>.json  история одного индекса
+    /iss/securities/<тикер>/dividends.json                          дивиденды
+    /cbr/dataservice/data                                           RawData/headerData ЦБ
+    /tpulse/post/instrument/<тикер>                                 страницы постов с курсором
+gRPC-заглушка реализует GetCandles и Shares (нужен пакет tinkoff-investments).
+
+Задержка, доля ошибок, лимит запросов в секунду и объем данных задаются
+FakeConfig. Ответы детерминированы: одинаковый запрос дает одинаковые данные.
+
+Запуск заглушек для ручной проверки сервисов:
+    uv run python -m benchmarks.fake_servers --latency 0.05 --rate-limit 50
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+MONTHS = [
+    "Январь",
+    "Февраль",
+    "Март",
+    "Апрель",
+    "Май",
+    "Июнь",
+    "Июль",
+    "Август",
+    "Сентябрь",
+    "Октябрь",
+    "Ноябрь",
+    "Декабрь",
+]
+
+DEFAULT_INDEX_CODES = ["IMOEX", "IMOEX2", "RTSI", "MOEXBC", "MOEXOG", "MOEXFN", "RGBI"]
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.0  # секунд на ответ
+    jitter: float = 0.0  # случайная добавка к задержке, секунд
+    error_rate: float = 0.0  # доля ответов 503 / UNAVAILABLE
+    rate_limit: float = 0.0  # запросов в секунду на сервер, сверх - 429 / RESOURCE_EXHAUSTED
+    index_codes: list = field(default_factory=lambda: list(DEFAULT_INDEX_CODES))
+    iss_page_size: int = 100
+    dividends_per_ticker: int = 20
+    cbr_series: int = 1  # показателей в каждом наборе ЦБ
+    posts_per_ticker: int = 300
+    posts_page_size: int = 30
+    post_interval_minutes: int = 60  # шаг между постами одного тикера
+    shares: int = 80  # акций в ответе Shares
+    seed: int = 0
+
+
+class FakeStats:
+    """Счетчики запросов и ошибок по маршрутам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.errors = {}
+
+    def count(self, route, error=None):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+
+class _Limiter:
+    """Скользящее окно в одну секунду: сколько запросов сервер готов принять"""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._times = []
+
+    def allow(self):
+        if not self.per_second:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self._times = [t for t in self._times if now - t < 1.0]
+            if len(self._times) >= self.per_second:
+                return False
+            self._times.append(now)
+            return True
+
+
+def _rng(config, *key):
+    digest = hashlib.sha256(repr((config.seed, *key)).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _gate(config, stats, limiter, route):
+    """Общая часть обработчиков: задержка, лимит и случайные ошибки.
+    Возвращает None или код ошибки ('rate_limit' / 'unavailable')"""
+    delay = config.latency + (random.random() * config.jitter if config.jitter else 0.0)
+    if delay:
+        time.sleep(delay)
+    if not limiter.allow():
+        stats.count(route, "rate_limit")
+        return "rate_limit"
+    if config.error_rate and random.random() < config.error_rate:
+        stats.count(route, "unavailable")
+        return "unavailable"
+    stats.count(route)
+    return None
+
+
+def _trading_days(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def _price(rng, base=100.0):
+    return round(base * (1 + rng.uniform(-0.03, 0.03)), 2)
+
+
+# ----------------- Ответы HTTP -----------------
+
+ISS_HISTORY_COLUMNS = ["BOARDID", "SECID", "TRADEDATE", "OPEN", "CLOSE", "HIGH", "LOW"]
+
+
+def _history_row(config, code, day):
+    rng = _rng(config, "iss", code, day)
+    open_ = _price(rng, 1000 + len(code) * 100)
+    return ["SNDX", code, day.isoformat(), open_, _price(rng, open_), open_ * 1.02, open_ * 0.98]
+
+
+def iss_board_history(config, params):
+    day = date.fromisoformat(params.get("date", date.today().isoformat()))
+    start = int(params.get("start", 0))
+    rows = [] if day.weekday() >= 5 else [_history_row(config, c, day) for c in config.index_codes]
+    page = rows[start:start + config.iss_page_size]
+    return {
+        "history": {"columns": ISS_HISTORY_COLUMNS, "data": page},
+        "history.cursor": {
+            "columns": ["INDEX", "TOTAL", "PAGESIZE"],
+            "data": [[start, len(rows), config.iss_page_size]],
+        },
+    }
+
+
+def iss_index_history(config, code, params):
+    start = datetime.strptime(params["from"], "%Y%m%d").date()
+    till = datetime.strptime(params["till"], "%Y%m%d").date()
+    rows = [_history_row(config, code.upper(), day) for day in _trading_days(start, till)]
+    return {"history": {"columns": ISS_HISTORY_COLUMNS, "data": rows}}
+
+
+def iss_dividends(config, ticker):
+    rng = _rng(config, "dividends", ticker)
+    first = date.today().year - config.dividends_per_ticker
+    rows = [
+        [
+            ticker.upper(),
+            "RU000A0JXXXX",
+            date(first + i, 7, rng.randint(1, 28)).isoformat(),
+            round(rng.uniform(1, 50), 2),
+            "RUB",
+        ]
+        for i in range(config.dividends_per_ticker)
+    ]
+    metadata = {
+        "secid": {"type": "string"},
+        "isin": {"type": "string"},
+        "registryclosedate": {"type": "date"},
+        "value": {"type": "double"},
+        "currencyid": {"type": "string"},
+    }
+    return {"dividends": {"metadata": metadata, "columns": list(metadata), "data": rows}}
+
+
+def cbr_data(config, params):
+    dataset = params.get("datasetId", "0")
+    y1, y2 = int(params.get("y1", date.today().year)), int(params.get("y2", date.today().year))
+    header = [
+        # Первые три буквы слов названия становятся именем колонки в get_data
+        {"id": series, "elname": f"П{series:02d} набор{dataset}"}
+        for series in range(1, config.cbr_series + 1)
+    ]
+    raw = []
+    for year in range(y1, y2 + 1):
+        for month in range(1, 13):
+            if date(year, month, 1) > date.today():
+                break
+            for item in header:
+                rng = _rng(config, "cbr", dataset, item["id"], year, month)
+                raw.append(
+                    {
+                        "colId": item["id"],
+                        "dt": f"{MONTHS[month - 1]} {year}",
+                        "obs_val": round(rng.uniform(1, 100), 2),
+                    }
+                )
+    return {"RawData": raw, "headerData": header}
+
+
+def tpulse_posts(config, ticker, params):
+    cursor = int(params.get("cursor") or 0)
+    cursor = 0 if cursor >= config.posts_per_ticker else cursor  # курсор по умолчанию 999999999
+    newest = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    items = []
+    for number in range(cursor, min(cursor + config.posts_page_size, config.posts_per_ticker)):
+        rng = _rng(config, "tpulse", ticker, number)
+        inserted = newest - timedelta(minutes=config.post_interval_minutes * number)
+        items.append(
+            {
+                "id": f"{ticker}-{number}-{config.seed}",
+                "inserted": inserted.isoformat().replace("+00:00", "Z"),
+                "content": {"text": f"Пост {number} про {ticker}"},
+                "commentsCount": rng.randint(0, 20),
+                "reactions": {
+                    "totalCount": rng.randint(0, 100),
+                    "counters": [{"type": "like", "count": rng.randint(0, 100)}],
+                },
+            }
+        )
+    next_cursor = cursor + len(items)
+    return {
+        "status": "Ok",
+        "payload": {
+            "items": items,
+            "nextCursor": next_cursor if next_cursor < config.posts_per_ticker else None,
+            "hasNext": next_cursor < config.posts_per_ticker,
+        },
+    }
+
+
+# (шаблон пути, имя маршрута, функция ответа)
+HTTP_ROUTES = [
+    (
+        re.compile(r"^/iss/history/engines/stock/markets/index/securities\.json$"),
+        "iss_board",
+        lambda config, match, params: iss_board_history(config, params),
+    ),
+    (
+        re.compile(r"^/iss/history/engines/stock/markets/index/securities/([^/]+)\.json$"),
+        "iss_index",
+        lambda config, match, params: iss_index_history(config, match.group(1), params),
+    ),
+    (
+        re.compile(r"^/iss/securities/([^/]+)/dividends\.json$"),
+        "iss_dividends",
+        lambda config, match, params: iss_dividends(config, match.group(1)),
+    ),
+    (
+        re.compile(r"^/cbr/dataservice/data$"),
+        "cbr",
+        lambda config, match, params: cbr_data(config, params),
+    ),
+    (
+        re.compile(r"^/tpulse/post/instrument/([^/]+)$"),
+        "tpulse",
+        lambda config, match, params: tpulse_posts(config, match.group(1), params),
+    ),
+]
+
+
+def _make_handler(config, stats, limiter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих API
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+            for pattern, route, render in HTTP_ROUTES:
+                match = pattern.match(parts.path)
+                if match:
+                    break
+            else:
+                return self._send(404, {"error": "not found"})
+
+            error = _gate(config, stats, limiter, route)
+            if error == "rate_limit":
+                return self._send(429, {"error": "rate limit"})
+            if error:
+                return self._send(503, {"error": "unavailable"})
+            self._send(200, render(config, match, params))
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_http(config=None, host="127.0.0.1", port=0):
+    """HTTP-заглушка в фоновом потоке. Возвращает (server, base_url, stats)"""
+    config = config or FakeConfig()
+    stats = FakeStats()
+    handler = _make_handler(config, stats, _Limiter(config.rate_limit))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-http", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", stats
+
+
+def http_env(base_url):
+    """Переменные окружения, направляющие сборщики на HTTP-заглушку"""
+    return {
+        "ISS_BASE_URL": f"{base_url}/iss",
+        "CBR_BASE_URL": f"{base_url}/cbr/dataservice",
+        "TPULSE_BASE_URL": f"{base_url}/tpulse/",
+    }
+
+
+# ----------------- gRPC Tinkoff -----------------
+
+
+def _self_signed_cert(directory):
+    """Сертификат для localhost: SDK Tinkoff открывает только TLS-каналы"""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-keyout",
+            key,
+            "-out",
+            cert,
+            "-subj",
+            "/CN=localhost",
+            "-addext",
+            "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    with open(cert, "rb") as cert_file, open(key, "rb") as key_file:
+        return cert, cert_file.read(), key_file.read()
+
+
+def start_grpc(config=None, host="localhost", port=0, max_workers=32):
+    """gRPC-заглушка MarketDataService.GetCandles и InstrumentsService.Shares.
+
+    Возвращает (server, target, stats). Клиенты SDK в этом процессе и в
+    дочерних начинают доверять сертификату заглушки через
+    GRPC_DEFAULT_SSL_ROOTS_FILE_PATH. gRPC читает корневые сертификаты один
+    раз на процесс, поэтому переменная ставится до импорта grpc, а вызывать
+    заглушку нужно до первого TLS-канала в процессе.
+    """
+    directory = tempfile.mkdtemp(prefix="fake-tinkoff-")
+    cert_path, cert, key = _self_signed_cert(directory)
+    os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"] = cert_path
+
+    import grpc
+    from google.protobuf.timestamp_pb2 import Timestamp
+    from tinkoff.invest.grpc import (
+        common_pb2,
+        instruments_pb2,
+        instruments_pb2_grpc,
+        marketdata_pb2,
+        marketdata_pb2_grpc,
+    )
+
+    config = config or FakeConfig()
+    stats = FakeStats()
+    limiter = _Limiter(config.rate_limit)
+    # Значения CandleInterval: 1 мин, 5 мин, 15 мин, час, день
+    steps = {
+        1: timedelta(minutes=1),
+        2: timedelta(minutes=5),
+        3: timedelta(minutes=15),
+        4: timedelta(hours=1),
+        5: timedelta(days=1),
+    }
+
+    def quotation(value):
+        units = int(value)
+        return common_pb2.Quotation(units=units, nano=int(round((value - units) * 1e9)))
+
+    def gate(route, context):
+        error = _gate(config, stats, limiter, route)
+        if error == "rate_limit":
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "rate limit")
+        if error:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "unavailable")
+
+    class MarketData(marketdata_pb2_grpc.MarketDataServiceServicer):
+        def GetCandles(self, request, context):
+            gate("get_candles", context)
+            figi = request.instrument_id or request.figi
+            step = steps.get(request.interval, timedelta(days=1))
+            start = getattr(request, "from").ToDatetime()  # from - ключевое слово Python
+            end = request.to.ToDatetime()
+            if step >= timedelta(days=1):
+                # Дневная свеча открывается в 07:00 UTC
+                moment = start.replace(hour=7, minute=0, second=0, microsecond=0)
+            else:
+                moment = start.replace(second=0, microsecond=0)
+            if moment < start:
+                moment += step
+            candles = []
+            while moment < end:
+                # Выходные и ночь не торгуются, как на бирже
+                if moment.weekday() < 5 and (step >= timedelta(days=1) or 7 <= moment.hour < 19):
+                    rng = _rng(config, "candle", figi, moment)
+                    open_ = _price(rng)
+                    close = _price(rng, open_)
+                    timestamp = Timestamp()
+                    timestamp.FromDatetime(moment)
+                    candles.append(
+                        marketdata_pb2.HistoricCandle(
+                            open=quotation(open_),
+                            high=quotation(max(open_, close) * 1.01),
+                            low=quotation(min(open_, close) * 0.99),
+                            close=quotation(close),
+                            volume=rng.randint(100, 100000),
+                            time=timestamp,
+                            is_complete=True,
+                        )
+                    )
+                moment += step
+            return marketdata_pb2.GetCandlesResponse(candles=candles)
+
+    class Instruments(instruments_pb2_grpc.InstrumentsServiceServicer):
+        def Shares(self, request, context):
+            gate("shares", context)
+            return instruments_pb2.SharesResponse(
+                instruments=[
+                    instruments_pb2.Share(
+                        figi=f"FAKE{number:08d}",
+                        ticker=f"T{number:02d}",
+                        name=f"Компания {number}",
+                        currency="rub",
+                        lot=1,
+                        min_price_increment=quotation(0.01),
+                        buy_available_flag=True,
+                        sector="fake",
+                    )
+                    for number in range(config.shares)
+                ]
+            )
+
+    server = grpc.server(ThreadPoolExecutor(max_workers=max_workers))
+    marketdata_pb2_grpc.add_MarketDataServiceServicer_to_server(MarketData(), server)
+    instruments_pb2_grpc.add_InstrumentsServiceServicer_to_server(Instruments(), server)
+    bound = server.add_secure_port(
+        f"{host}:{port}", grpc.ssl_server_credentials([(key, cert)])
+    )
+    server.start()
+    return server, f"{host}:{bound}", stats
+
+
+def grpc_env(target):
+    return {
+        "TINKOFF_TARGET": target,
+        "TINKOFF_TOKEN": os.getenv("TINKOFF_TOKEN") or "fake",
+        "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": os.environ["GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"],
+    }
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="секунд на ответ")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="запросов в секунду")
+    parser.add_argument("--posts-per-ticker", type=int, default=300)
+    parser.add_argument("--dividends-per-ticker", type=int, default=20)
+    parser.add_argument("--shares", type=int, default=80)
+
+
+def config_from_args(args):
+    return FakeConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        posts_per_ticker=args.posts_per_ticker,
+        dividends_per_ticker=args.dividends_per_ticker,
+        shares=args.shares,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    add_config_arguments(parser)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--grpc-port", type=int, default=8801)
+    parser.add_argument("--no-grpc", action="store_true", help="без заглушки Tinkoff")
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    _, base_url, _ = start_http(config, port=args.port)
+    env = http_env(base_url)
+    if not args.no_grpc:
+        _, target, _ = start_grpc(config, port=args.grpc_port)
+        env.update(grpc_env(target))
+    print("Заглушки запущены, переменные для сервисов:")
+    for name, value in env.items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
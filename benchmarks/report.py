@@ -0,0 +1,101 @@
+"""Сравнение прогона набора benchmarks/suite с базовой линией.
+
+Прогон задается именем из --benchmark-save (берется последний сохраненный
+с таким именем в benchmarks/baselines) или путем к JSON. Бенчмарк,
+медленнее базовой линии больше чем на --threshold процентов по медиане,
+считается регрессией, и тогда код выхода 1.
+
+Запуск из корня репозитория:
+    uv run python -m benchmarks.report baseline current
+    uv run python -m benchmarks.report baseline --threshold 10
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+STORAGE = os.path.join("benchmarks", "baselines")
+
+
+def find_run(ref, storage=STORAGE):
+    """Путь к JSON прогона: сам путь, последний прогон с именем ref или
+    последний прогон вообще, если ref не задан"""
+    if ref and os.path.isfile(ref):
+        return ref
+    pattern = f"*_{ref}.json" if ref else "*.json"
+    runs = sorted(glob.glob(os.path.join(storage, "*", pattern)), key=os.path.basename)
+    if not runs:
+        raise FileNotFoundError(f"Нет сохраненных прогонов {pattern} в {storage}")
+    return runs[-1]
+
+
+def load_run(path, stat="median"):
+    with open(path) as f:
+        run = json.load(f)
+    stats = {bench["name"]: bench["stats"][stat] for bench in run["benchmarks"]}
+    return run, stats
+
+
+def compare(base, current, threshold):
+    """[(имя, база, текущий, изменение в %, пометка)]; время в секундах"""
+    rows = []
+    for name in sorted(set(base) | set(current)):
+        if name not in current:
+            rows.append((name, base[name], None, None, "нет в прогоне"))
+            continue
+        if name not in base:
+            rows.append((name, None, current[name], None, "новый"))
+            continue
+        change = (current[name] / base[name] - 1) * 100
+        if change > threshold:
+            mark = "РЕГРЕССИЯ"
+        elif change < -threshold:
+            mark = "быстрее"
+        else:
+            mark = ""
+        rows.append((name, base[name], current[name], change, mark))
+    return rows
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("base", help="имя или путь базовой линии")
+    parser.add_argument("current", nargs="?", help="имя или путь прогона, по умолчанию последний")
+    parser.add_argument("--threshold", type=float, default=20.0, help="допуск, %% медианы")
+    parser.add_argument("--stat", default="median", choices=["min", "median", "mean"])
+    parser.add_argument("--storage", default=STORAGE)
+    args = parser.parse_args()
+
+    base_path = find_run(args.base, args.storage)
+    current_path = find_run(args.current, args.storage)
+    base_run, base = load_run(base_path, args.stat)
+    current_run, current = load_run(current_path, args.stat)
+
+    print(f"база:    {base_path} ({base_run['commit_info'].get('id', '')[:10]})")
+    print(f"прогон:  {current_path} ({current_run['commit_info'].get('id', '')[:10]})")
+    if base_run["machine_info"].get("cpu") != current_run["machine_info"].get("cpu"):
+        print("⚠️ Прогоны сделаны на разных машинах, сравнение примерное")
+
+    rows = compare(base, current, args.threshold)
+    width = max(len(row[0]) for row in rows) + 2
+    print(f"\n{'бенчмарк':<{width}}{'база, мс':>12}{'сейчас, мс':>12}{'изменение':>12}")
+    for name, base_value, current_value, change, mark in rows:
+        change = "-" if change is None else f"{change:+.1f}%"
+        print(f"{name:<{width}}{_ms(base_value):>12}{_ms(current_value):>12}{change:>12}  {mark}")
+
+    regressions = [row[0] for row in rows if row[4] == "РЕГРЕССИЯ"]
+    if regressions:
+        print(f"\n❌ Медленнее базы больше чем на {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\n✅ Регрессий больше {args.threshold:g}% нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Расчет признаков на 10 годах дневных свечей"""
+from utils.features import build_features, compute_features
+from utils.utils import connection, data_from_ticker
+
+LEFT_DATE = "2000-01-01"
+RIGHT_DATE = "2030-01-01"
+
+
+def bench_compute_features(benchmark, candles):
+    """Только вычисления по кадру всех тикеров, без базы"""
+    result = benchmark(compute_features, candles)
+    assert result["ticker"].nunique() == candles["ticker"].nunique()
+
+
+def bench_data_from_ticker(benchmark, candles, seeded_candles):
+    """Один тикер: запрос свечей и признаки"""
+    ticker = seeded_candles[0]
+    result = benchmark(data_from_ticker, ticker, LEFT_DATE, RIGHT_DATE, connection())
+    assert 0 < len(result) <= (candles["ticker"] == ticker).sum()
+
+
+def bench_build_features(benchmark, seeded_candles):
+    """Все тикеры одним запросом"""
+    result = benchmark(build_features, seeded_candles, LEFT_DATE, RIGHT_DATE, connection())
+    assert result["ticker"].nunique() == len(seeded_candles)
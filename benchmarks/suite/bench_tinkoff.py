@@ -0,0 +1,55 @@
+"""Разбор и запись свечей полного сбора Tinkoff (scripts/tinkoff/script.py)"""
+import pytest
+
+pytest.importorskip("tinkoff.invest")  # иначе script.py при импорте ставит пакет через pip
+
+from tinkoff.invest import HistoricCandle, Quotation
+
+from benchmarks.bench_ingest import load_service
+
+script = load_service("scripts/tinkoff/script.py")
+
+
+def quotation(value):
+    units = int(value)
+    return Quotation(units=units, nano=int(round((value - units) * 1e9)))
+
+
+@pytest.fixture(scope="module")
+def db_manager(bench_db, seeded_candles):
+    manager = script.DatabaseManager(bench_db)
+    yield manager
+    manager.conn.close()
+
+
+@pytest.fixture(scope="module")
+def ticker_candles(candles):
+    """10 лет свечей одного тикера в формате _candles_to_dataframe"""
+    ticker = candles["ticker"].iloc[0]
+    frame = candles[candles["ticker"] == ticker].sort_values("datetime")
+    return ticker, frame[list(script.CANDLE_COLUMNS[1:])].reset_index(drop=True)
+
+
+def bench_candles_to_dataframe(benchmark, ticker_candles):
+    _, frame = ticker_candles
+    historic = [
+        HistoricCandle(
+            open=quotation(row.open),
+            high=quotation(row.high),
+            low=quotation(row.low),
+            close=quotation(row.close),
+            volume=int(row.volume),
+            time=row.datetime.to_pydatetime(),
+            is_complete=bool(row.is_complete),
+        )
+        for row in frame.itertuples(index=False)
+    ]
+    collector = script.CompleteDataCollector("TOKEN")
+    result = benchmark(collector._candles_to_dataframe, historic)
+    assert len(result) == len(historic)
+
+
+def bench_save_candles_batch(benchmark, db_manager, ticker_candles):
+    """Повторная запись 10 лет свечей тикера: COPY и слияние с существующими строками"""
+    ticker, frame = ticker_candles
+    assert benchmark(db_manager.save_candles_batch, ticker, frame)
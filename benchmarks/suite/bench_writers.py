@@ -0,0 +1,109 @@
+"""Запись сервисов ЦБ, индексов ISS и Т-Пульса в одноразовую базу.
+
+Перед замером данные записываются один раз: раунды меряют повторный
+upsert уже сохраненного периода, как на каждой итерации сервиса.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from benchmarks.bench_ingest import load_service
+from benchmarks.bench_upsert import make_frame, make_table
+from utils.utils import connection
+
+CBRF_SERIES = 40  # столбцов показателей в cbrf_data
+CBRF_MONTHS = 20 * 12
+INDEX_ROWS = 12_500  # около года истории по всем индексам
+POSTS = 5_000
+
+
+@pytest.fixture(scope="module")
+def cbrf(bench_db):
+    module = load_service("scripts/cbrf/cbrf_data.py")
+    series = ", ".join(f"series_{number:02d} DOUBLE PRECISION" for number in range(CBRF_SERIES))
+    with connection().begin() as conn:
+        conn.execute(text(f"CREATE TABLE cbrf_data (date TIMESTAMP, {series})"))
+    return module
+
+
+@pytest.fixture(scope="module")
+def indices(bench_db):
+    module = load_service("scripts/moex_iss_indices/moex_iss_indices.py")
+    make_table("moex_iss_indices").create(connection())
+    return module
+
+
+@pytest.fixture(scope="module")
+def tpulse(bench_db):
+    module = load_service("scripts/t-pulse/automatization/parse_tpulse_daily.py")
+    with connection().begin() as conn:
+        conn.execute(
+            text(f"""
+                CREATE TABLE {module.TABLE_NAME} (
+                    id TEXT,
+                    ticker TEXT,
+                    inserted DATE,
+                    text TEXT,
+                    commentscount INTEGER,
+                    reactioncount INTEGER,
+                    reactions_counters JSONB,
+                    PRIMARY KEY (id, ticker)
+                )
+            """)
+        )
+    return module
+
+
+def cbrf_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        rng.uniform(0, 100, (CBRF_MONTHS, CBRF_SERIES)).round(4),
+        columns=[f"Показатель {number}" for number in range(CBRF_SERIES)],
+    )
+    df.insert(0, "date", pd.date_range("2006-01-01", periods=CBRF_MONTHS, freq="MS"))
+    return df
+
+
+def post_rows(count, seed=0):
+    """Строки t_pulse_data в порядке POST_COLUMNS, как их отдает post_to_row"""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    return [
+        (
+            f"post-{number:07d}",
+            f"BN{number % 50:03d}",
+            today - timedelta(days=int(rng.integers(0, 28))),
+            "Текст поста " * int(rng.integers(5, 60)),
+            int(rng.integers(0, 50)),
+            int(rng.integers(0, 200)),
+            [{"type": "like", "count": int(rng.integers(0, 100))}],
+        )
+        for number in range(count)
+    ]
+
+
+def bench_cbrf_update_db(benchmark, cbrf):
+    df = cbrf_frame()
+    cbrf.update_db(df)
+    benchmark(cbrf.update_db, df)
+
+
+def bench_indices_update_db(benchmark, indices):
+    df = make_frame(INDEX_ROWS)
+    indices.update_db(df)
+    benchmark(indices.update_db, df)
+
+
+def bench_tpulse_write_rows(benchmark, tpulse):
+    rows = post_rows(POSTS)
+    engine = connection()
+
+    def write():
+        with engine.begin() as conn:
+            return tpulse.write_rows(conn, rows)
+
+    write()
+    assert benchmark(write) == POSTS
@@ -0,0 +1,153 @@
+"""Фикстуры набора бенчмарков: одноразовая база и синтетические свечи.
+
+База создается на сервере из DB_* под случайным именем на всю сессию и
+удаляется в конце, рабочие таблицы не затрагиваются. Без доступного
+Postgres бенчмарки с базой пропускаются, остальные выполняются.
+"""
+import os
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import pytest
+
+from utils.candles import copy_candle_lines, values_to_line
+from utils.schema import create_candles
+from utils.utils import dispose_engines
+
+BENCH_TICKERS = int(os.getenv("BENCH_TICKERS", "20"))
+BENCH_YEARS = 10
+TRADING_DAYS = 252  # торговых дней в году
+HISTORY_END = datetime(2025, 12, 31)  # фиксированная дата: данные одинаковы между запусками
+
+COMPANIES_DDL = """
+    CREATE TABLE IF NOT EXISTS companies (
+        id SERIAL PRIMARY KEY,
+        ticker VARCHAR(20) UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        figi VARCHAR(50) UNIQUE NOT NULL,
+        currency VARCHAR(10),
+        lot INTEGER,
+        min_price_increment DECIMAL(10,6),
+        sector TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def db_config(dbname):
+    return {
+        "dbname": dbname,
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+    }
+
+
+def bench_tickers(count=BENCH_TICKERS):
+    return [f"BN{number:03d}" for number in range(count)]
+
+
+def make_candles(tickers, years=BENCH_YEARS, seed=0) -> pd.DataFrame:
+    """Дневные свечи случайного блуждания в формате load_candles:
+    отсортированы по (ticker, datetime DESC)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=HISTORY_END, periods=years * TRADING_DAYS)
+    frames = []
+    for ticker in tickers:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(dates)))
+        spread = np.abs(rng.normal(0, 0.01, len(dates)))
+        frames.append(
+            pd.DataFrame(
+                {
+                    "ticker": ticker,
+                    "datetime": dates,
+                    "open": open_.round(6),
+                    "high": (np.maximum(open_, close) * (1 + spread)).round(6),
+                    "low": (np.minimum(open_, close) * (1 - spread)).round(6),
+                    "close": close.round(6),
+                    "volume": rng.integers(1_000, 1_000_000, len(dates)),
+                    "is_complete": True,
+                }
+            )
+        )
+    candles = pd.concat(frames, ignore_index=True)
+    candles = candles.sort_values(["ticker", "datetime"], ascending=[True, False])
+    candles.insert(0, "id", np.arange(1, len(candles) + 1))
+    candles["created_at"] = HISTORY_END
+    return candles.reset_index(drop=True)
+
+
+@pytest.fixture(scope="session")
+def bench_db():
+    """Параметры psycopg2 одноразовой базы; на время сессии DB_NAME указывает на нее,
+    так что connection() и сервисы пишут туда же"""
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    try:
+        admin = psycopg2.connect(**db_config(os.getenv("DB_NAME")))
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres из DB_* недоступен: {e}")
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(f'CREATE DATABASE "{name}"')
+
+    previous = os.environ.get("DB_NAME")
+    os.environ["DB_NAME"] = name
+    dispose_engines()  # engine процесса мог быть создан для прежней базы
+    try:
+        config = db_config(name)
+        conn = psycopg2.connect(**config)
+        with conn.cursor() as cursor:
+            cursor.execute(COMPANIES_DDL)
+        conn.commit()
+        conn.close()
+        yield config
+    finally:
+        dispose_engines()
+        if previous is None:
+            os.environ.pop("DB_NAME", None)
+        else:
+            os.environ["DB_NAME"] = previous
+        with admin.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        admin.close()
+
+
+@pytest.fixture(scope="session")
+def candles():
+    """10 лет дневных свечей BENCH_TICKERS тикеров"""
+    return make_candles(bench_tickers())
+
+
+@pytest.fixture(scope="session")
+def seeded_candles(bench_db, candles):
+    """Компании и свечи фикстуры candles в одноразовой базе; возвращает тикеры"""
+    tickers = list(candles["ticker"].unique())
+    conn = psycopg2.connect(**bench_db)
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO companies (ticker, name, figi) VALUES (%s, %s, %s)",
+                [(ticker, ticker, f"FIGI{ticker}") for ticker in tickers],
+            )
+        create_candles(conn)
+        copy_candle_lines(
+            conn,
+            (
+                values_to_line(*values)
+                for values in candles[
+                    ["ticker", "datetime", "open", "high", "low", "close", "volume", "is_complete"]
+                ].itertuples(index=False, name=None)
+            ),
+        )
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE candles")
+        conn.commit()
+    finally:
+        conn.close()
+    return tickers
@@ -1,13 +1,14 @@
 import logging
+import os
 import sys
 import pandas as pd
-import requests
 from datetime import datetime
-from sqlalchemy import Table, MetaData, insert, select, update
 import time
 import warnings
 
-from utils.utils import connection
+from utils.http_session import TIMEOUT, get_session
+from utils.upsert import ensure_unique_index, upsert_dataframe
+from utils.utils import connection, reflect_table
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,9 +20,11 @@ logger = logging.getLogger(__name__)
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+CBR_BASE_URL = os.getenv("CBR_BASE_URL", "https://cbr.ru/dataservice")
+
 
 def get_data(url, name):
-    response = requests.get(url)
+    response = get_session("cbr", pool_size=1).get(url, timeout=TIMEOUT)
     response.raise_for_status()
 
     data = response.json()
@@ -67,11 +70,11 @@ def get_data(url, name):
 def fetch_last_cbrf_data(cur_year):
     total_df = pd.DataFrame()
 
-    url_1 = f"https://cbr.ru/dataservice/data?y1={cur_year}&y2={cur_year}&publicationId=14&datasetId=27&measureId=2"
-    url_2 = f"https://cbr.ru/dataservice/data?y1={cur_year}&y2={cur_year}&publicationId=18&datasetId=37&measureId=2"
-    url_3 = f"https://cbr.ru/dataservice/data?y1={cur_year}&y2={cur_year}&publicationId=20&datasetId=41&measureId=22"
-    url_4 = f"https://cbr.ru/dataservice/data?y1={cur_year}&y2={cur_year}&publicationId=5&datasetId=8&measureId="
-    url_5 = f"https://cbr.ru/dataservice/data?y1={cur_year}&y2={cur_year}&publicationId=33&datasetId=127&measureId="
+    url_1 = f"{CBR_BASE_URL}/data?y1={cur_year}&y2={cur_year}&publicationId=14&datasetId=27&measureId=2"
+    url_2 = f"{CBR_BASE_URL}/data?y1={cur_year}&y2={cur_year}&publicationId=18&datasetId=37&measureId=2"
+    url_3 = f"{CBR_BASE_URL}/data?y1={cur_year}&y2={cur_year}&publicationId=20&datasetId=41&measureId=22"
+    url_4 = f"{CBR_BASE_URL}/data?y1={cur_year}&y2={cur_year}&publicationId=5&datasetId=8&measureId="
+    url_5 = f"{CBR_BASE_URL}/data?y1={cur_year}&y2={cur_year}&publicationId=33&datasetId=127&measureId="
 
     url_list = [url_1, url_2, url_3, url_4, url_5]
     names_list = [
@@ -92,46 +95,36 @@ def fetch_last_cbrf_data(cur_year):
     return total_df
 
 
+def cbrf_table():
+    """Таблица cbrf_data, отражается при первой записи, а не при импорте"""
+    return reflect_table("cbrf_data")
+
+
 def update_db(df):
-    orm_columns = cbrf_data.columns.keys()
-    df.columns = orm_columns
+    cbrf_data = cbrf_table()
+    df.columns = cbrf_data.columns.keys()
 
     with connection().begin() as conn:
-        for record in df.to_dict(orient="records"):
-            # Check if record exists
-            existing = conn.execute(
-                select(cbrf_data).where(cbrf_data.c.date == record["date"])
-            ).first()
-            
-            if existing:
-                # Update existing record
-                update_stmt = (
-                    update(cbrf_data)
-                    .where(cbrf_data.c.date == record["date"])
-                    .values(**{k: v for k, v in record.items() if k != "date"})
-                )
-                conn.execute(update_stmt)
-            else:
-                # Insert new record
-                insert_stmt = insert(cbrf_data).values(**record)
-                conn.execute(insert_stmt)
+        ensure_unique_index(conn, cbrf_data, ["date"])
+        upsert_dataframe(df, cbrf_data, ["date"], conn)
+
+
+def collect():
+    """Одна итерация сбора: данные ЦБ за текущий год"""
+    full_df = fetch_last_cbrf_data(datetime.now().year)
+    if len(full_df) > 0:
+        update_db(full_df)
+        logger.info("Данные собраны и обновлены в БД.")
+    else:
+        logger.info("Данные за текущий год пока отсутствуют.")
 
 
 def main():
     while True:
-        cur_year = datetime.now().year
-        full_df = fetch_last_cbrf_data(cur_year)
-        if len(full_df) > 0:
-            update_db(full_df)
-            logger.info("Данные собраны и обновлены в БД.")
-        else:
-            logger.info("Данные за текущий год пока отсутствуют.")
+        collect()
         logger.info("Следующая итерация будет запущена через 14 дней.")
         time.sleep(14 * 24 * 3600)
 
 
-metadata = MetaData()
-cbrf_data = Table("cbrf_data", metadata, autoload_with=connection())
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,48 @@
+import argparse
+import logging
+import sys
+import time
+
+from utils.feature_store import FEATURE_SET_HASH, rebuild_features, refresh_features
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 6 * 3600  # свечи приходят раз в сутки, запас на сдвиг ingest
+
+
+def run_once(tickers=None, rebuild=False):
+    with connection().begin() as conn:
+        if rebuild:
+            written = rebuild_features(conn, tickers)
+        else:
+            written = refresh_features(conn, tickers)
+    logger.info(f"Набор признаков {FEATURE_SET_HASH}: записано {written} строк")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обновление candle_features")
+    parser.add_argument("--once", action="store_true", help="один проход без цикла")
+    parser.add_argument("--rebuild", nargs="+", metavar="TICKER", help="полный пересчет тикеров")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        run_once(args.rebuild, rebuild=True)
+        return
+    while True:
+        run_once()
+        if args.once:
+            return
+        logger.info("Следующее обновление признаков через 6 часов.")
+        time.sleep(REFRESH_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
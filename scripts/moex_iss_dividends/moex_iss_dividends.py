@@ -1,12 +1,13 @@
 import logging
 import sys
-import requests
 import time
 import pandas as pd
 from datetime import datetime
-from requests.exceptions import ConnectTimeout
 import warnings
+from sqlalchemy import Column, Date, Float, MetaData, Table, Text, func, select, text
 
+from utils.iss import fetch_many, iss_get
+from utils.upsert import ensure_unique_index, upsert_dataframe
 from utils.utils import connection
 
 logging.basicConfig(
@@ -19,16 +20,14 @@ logger = logging.getLogger(__name__)
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+# Окно от последней registryclosedate, в котором ISS еще может поправить значения
+REWRITE_WINDOW_DAYS = 365
+
 
 def fetch_index_data(ticker):
-    url = f"https://iss.moex.com/iss/securities/{ticker.lower()}/dividends.json"
-    try:
-        response = requests.get(url, timeout=10)
-    except ConnectTimeout:
-        time.sleep(60)
-        response = requests.get(url, timeout=10)
-    columns = list(response.json()["dividends"]["metadata"].keys())
-    rows = response.json()["dividends"]["data"]
+    data = iss_get(f"securities/{ticker.lower()}/dividends.json")
+    columns = list(data["dividends"]["metadata"].keys())
+    rows = data["dividends"]["data"]
     df = pd.DataFrame(rows, columns=columns)
     df_filtered = df[["secid", "registryclosedate", "value"]].copy()
     df_filtered["secid"] = ticker.upper()
@@ -40,27 +39,126 @@ def fetch_index_data(ticker):
         },
         inplace=True,
     )
+    df_filtered["date"] = pd.to_datetime(df_filtered["date"], errors="coerce").dt.date
+    # Несколько выплат с одной датой закрытия реестра (например, обычный и
+    # специальный дивиденд) складываются, а не затирают друг друга по ключу
+    df_filtered = (
+        df_filtered.dropna(subset=["date"])
+        .groupby(["ticker", "date"], as_index=False, sort=False)["dividedends_rub_per_share"]
+        .sum(min_count=1)
+    )
     df_filtered["updated_date"] = datetime.today().date()
     return df_filtered
 
 
+def ensure_date_type(conn) -> bool:
+    """Переводит колонку date из текста (наследие to_sql) в DATE.
+
+    Возвращает True, если таблица была мигрирована: тогда нужна полная
+    пересинхронизация, чтобы восстановить суммы выплат, схлопнутые по ключу.
+    """
+    data_type = conn.execute(
+        text(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = to_regclass(:table) AND attname = 'date'"
+        ),
+        {"table": dividends.name},
+    ).scalar()
+    if data_type != "text":
+        return False
+    conn.execute(
+        text(
+            f'ALTER TABLE "{dividends.name}" ALTER COLUMN date TYPE DATE '
+            "USING NULLIF(date, '')::date"
+        )
+    )
+    logger.info("🛠 moex_iss_dividends.date переведена из TEXT в DATE")
+    return True
+
+
+def load_watermarks(conn):
+    """Водяные знаки синхронизации: последняя registryclosedate по каждому тикеру"""
+    rows = conn.execute(
+        select(dividends.c.ticker, func.max(dividends.c.date)).group_by(dividends.c.ticker)
+    ).all()
+    return {ticker: last_date for ticker, last_date in rows}
+
+
+def _rows_to_sync(df, watermark):
+    """Новые строки и строки в окне перезаписи от водяного знака.
+
+    Более старая история неизменна, поэтому даже не отправляется в БД.
+    """
+    if watermark is None:
+        return df
+    since = (pd.Timestamp(watermark) - pd.Timedelta(days=REWRITE_WINDOW_DAYS)).date()
+    return df[df["date"] >= since]
+
+
+def sync_dividends():
+    """Инкрементальная синхронизация: upsert только новых и изменившихся строк
+    по ключу (ticker, date), схема и индексы таблицы не пересоздаются.
+    Значение по ключу - сумма всех выплат с этой датой закрытия реестра."""
+    results, failed = fetch_many(fetch_index_data, tickers)
+    if failed:
+        logger.warning(f"Не удалось получить дивиденды: {', '.join(failed)}")
+
+    with connection().begin() as conn:
+        dividends.create(conn, checkfirst=True)
+        migrated = ensure_date_type(conn)
+        ensure_unique_index(conn, dividends, ["ticker", "date"], dedupe=True)
+        watermarks = {} if migrated else load_watermarks(conn)
+
+        frames = [
+            _rows_to_sync(df, watermarks.get(ticker))
+            for ticker, df in results.items()
+            if not df.empty
+        ]
+        if not frames:
+            return 0
+        changed = upsert_dataframe(
+            pd.concat(frames, ignore_index=True),
+            dividends,
+            ["ticker", "date"],
+            conn,
+            only_changed=["dividedends_rub_per_share"],
+        )
+    return changed
+
+
+def changed_since(since, conn=None) -> pd.DataFrame:
+    """Строки, добавленные или изменившиеся начиная с даты since"""
+    query = (
+        select(dividends)
+        .where(dividends.c.updated_date >= pd.Timestamp(since).date())
+        .order_by(dividends.c.ticker, dividends.c.date)
+    )
+    if conn is None:
+        with connection().connect() as conn:
+            return pd.read_sql(query, conn)
+    return pd.read_sql(query, conn)
+
+
+def changed_tickers_since(since, conn=None):
+    """Тикеры, по которым нужно пересчитать признаки после изменений с даты since"""
+    return sorted(changed_since(since, conn)["ticker"].unique())
+
+
+def collect():
+    """Одна итерация синхронизации дивидендов"""
+    changed = sync_dividends()
+    if changed:
+        logger.info(
+            f"Дивиденды синхронизированы {datetime.today().date()}: {changed} новых или измененных строк."
+        )
+    else:
+        logger.info("Новых или измененных дивидендов нет.")
+    return changed
+
+
 def main():
     while True:
-        all_data = []
-        for ticker in tickers:
-            df = fetch_index_data(ticker)
-            if not df.empty:
-                all_data.append(df)
-        if all_data:
-            full_df = pd.concat(all_data, ignore_index=True)
-            full_df.to_sql(
-                "moex_iss_dividends", con=connection(), if_exists="replace", index=False
-            )
-            logger.info(
-                f"Данные  успешно собраны и обновлены в БД {datetime.today().date()}."
-            )
-        else:
-            logger.info("Данные за сегодня пока отсутствуют.")
+        collect()
         logger.info("Ждем 30 дней до следующей итерации.")
         time.sleep(30 * 24 * 60 * 60)
 
@@ -142,4 +240,17 @@ tickers = [
     "VSEH",
 ]
 
-main()
+# Схема таблицы, которую раньше создавал to_sql(if_exists="replace"), но с
+# датой типа DATE: текстовые даты сравнивались как строки
+metadata = MetaData()
+dividends = Table(
+    "moex_iss_dividends",
+    metadata,
+    Column("ticker", Text),
+    Column("date", Date),
+    Column("dividedends_rub_per_share", Float),
+    Column("updated_date", Date),
+)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,16 @@
+import argparse
 import logging
+import os
 import sys
 import pandas as pd
-import requests
 from datetime import datetime
-from sqlalchemy import Table, MetaData
-from requests.exceptions import ConnectTimeout
 import time
 import warnings
 
 
-from utils.utils import connection
+from utils.iss import fetch_many, iss_get, iss_get_paged
+from utils.upsert import ensure_unique_index, upsert_dataframe
+from utils.utils import connection, reflect_table
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,16 +22,16 @@ logger = logging.getLogger(__name__)
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+# board - одна постраничная выборка по всем индексам, code - запрос на каждый код
+FETCH_MODE = os.getenv("ISS_INDICES_FETCH_MODE", "board")
+
 
 def fetch_today_index_data(index_code, today_date):
     today_date_str = today_date.strftime("%Y%m%d")
-    url = f"https://iss.moex.com/iss/history/engines/stock/markets/index/securities/{index_code.lower()}.json?from={today_date_str}&till={today_date_str}"
-    try:
-        response = requests.get(url, timeout=10)
-    except ConnectTimeout:
-        time.sleep(60)
-        response = requests.get(url, timeout=10)
-    data = response.json()
+    data = iss_get(
+        f"history/engines/stock/markets/index/securities/{index_code.lower()}.json",
+        params={"from": today_date_str, "till": today_date_str},
+    )
     history = data.get("history")
     if history is None:
         return pd.DataFrame()
@@ -45,54 +46,113 @@ def fetch_today_index_data(index_code, today_date):
     return df_filtered
 
 
-def update_db(df):
-    records = df.to_dict(orient="records")
+def _history_to_frame(columns, rows):
+    """История ISS в формате таблицы moex_iss_indices, только коды из moex_indices_codes"""
+    df = pd.DataFrame(rows, columns=columns)
+    if df.empty:
+        return pd.DataFrame(columns=["date", "open", "close", "index_code"])
+    df = df[df["SECID"].str.upper().isin(moex_indices_codes)]
+    df_filtered = df[["TRADEDATE", "OPEN", "CLOSE", "SECID"]].copy()
+    df_filtered["SECID"] = df_filtered["SECID"].str.upper()
+    df_filtered.rename(
+        columns={
+            "TRADEDATE": "date",
+            "OPEN": "open",
+            "CLOSE": "close",
+            "SECID": "index_code",
+        },
+        inplace=True,
+    )
+    return df_filtered.reset_index(drop=True)
+
+
+def fetch_board_index_data(date):
+    """Все индексы за дату: board-level история с пагинацией вместо запроса на каждый код"""
+    columns, rows = iss_get_paged(
+        "history/engines/stock/markets/index/securities.json",
+        params={"date": date.strftime("%Y-%m-%d")},
+    )
+    return _history_to_frame(columns, rows)
+
+
+def fetch_index_data_range(from_date, till_date):
+    """Данные всех индексов за период (для дозаполнения пропусков), даты грузятся параллельно"""
+    dates = list(pd.date_range(from_date, till_date, freq="D"))
+    results, failed = fetch_many(fetch_board_index_data, dates)
+    if failed:
+        logger.warning(
+            f"Не удалось получить данные за даты: {', '.join(d.strftime('%Y-%m-%d') for d in failed)}"
+        )
+    frames = [df for df in results.values() if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
 
+
+def indices_table():
+    """Таблица moex_iss_indices, отражается при первой записи, а не при импорте"""
+    return reflect_table("moex_iss_indices")
+
+
+def update_db(df):
+    indices_prices = indices_table()
     with connection().begin() as conn:
-        for record in records:
-            # Check if record exists
-            existing = conn.execute(
-                indices_prices.select().where(
-                    (indices_prices.c.date == record["date"])
-                    & (indices_prices.c.index_code == record["index_code"])
-                )
-            ).first()
-
-            if existing:
-                # Update existing record
-                update_stmt = (
-                    indices_prices.update()
-                    .where(
-                        (indices_prices.c.date == record["date"])
-                        & (indices_prices.c.index_code == record["index_code"])
-                    )
-                    .values(open=record["open"], close=record["close"])
-                )
-                conn.execute(update_stmt)
-            else:
-                # Insert new record
-                insert_stmt = indices_prices.insert().values(**record)
-                conn.execute(insert_stmt)
+        ensure_unique_index(conn, indices_prices, ["date", "index_code"])
+        upsert_dataframe(
+            df,
+            indices_prices,
+            ["date", "index_code"],
+            conn,
+            update_columns=["open", "close"],
+        )
+
+
+def fetch_today_all_codes(today):
+    """Данные за сегодня по одному запросу на каждый код индекса"""
+    results, failed = fetch_many(
+        lambda idx: fetch_today_index_data(idx, today), moex_indices_codes
+    )
+    if failed:
+        logger.warning(f"Не удалось получить данные по индексам: {', '.join(failed)}")
+    all_data = []
+    for idx, df in results.items():
+        if not df.empty:
+            df["index_code"] = idx
+            all_data.append(df)
+    return pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
+
+
+def collect():
+    """Одна итерация сбора: значения индексов за сегодня"""
+    today = datetime.today()
+    if FETCH_MODE == "board":
+        full_df = fetch_board_index_data(today)
+    else:
+        full_df = fetch_today_all_codes(today)
+    if not full_df.empty:
+        update_db(full_df)
+        logger.info("Данные за сегодня успешно собраны и обновлены в БД.")
+    else:
+        logger.info("Данные за сегодня пока отсутствуют.")
 
 
 def main():
     while True:
-        all_data = []
-        for idx in moex_indices_codes:
-            df = fetch_today_index_data(idx, datetime.today())
-            if not df.empty:
-                df["index_code"] = idx
-                all_data.append(df)
-        if all_data:
-            full_df = pd.concat(all_data, ignore_index=True)
-            update_db(full_df)
-            logger.info("Данные за сегодня успешно собраны и обновлены в БД.")
-        else:
-            logger.info("Данные за сегодня пока отсутствуют.")
+        collect()
         logger.info("Ждем 3 часа до следующей итерации.")
         time.sleep(3 * 3600)
 
 
+def backfill(from_date, till_date):
+    """Дозаполнение пропусков за период"""
+    df = fetch_index_data_range(from_date, till_date)
+    if df.empty:
+        logger.info(f"Нет данных за период {from_date} - {till_date}.")
+        return
+    update_db(df)
+    logger.info(f"Загружено {len(df)} строк за период {from_date} - {till_date}.")
+
+
 moex_indices_codes = [
     "IMOEX",  # Индекс МосБиржи
     "IMOEX2",  # Индекс МосБиржи с дополнительными сессиями
@@ -168,8 +228,16 @@ moex_indices_codes = [
     "RUSFARC1WR",
 ]
 
-metadata = MetaData()
-indices_prices = Table("moex_iss_indices", metadata, autoload_with=connection())
-
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backfill",
+        nargs=2,
+        metavar=("FROM", "TILL"),
+        help="дозаполнить период YYYY-MM-DD YYYY-MM-DD и выйти",
+    )
+    args = parser.parse_args()
+    if args.backfill:
+        backfill(*args.backfill)
+    else:
+        main()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import sys
+
+from utils.scheduler import CronTrigger, IntervalTrigger, Job, Scheduler
+from utils.utils import connection, dispose_engines
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _service(path, func):
+    return f"{os.path.join(ROOT, path)}:{func}"
+
+
+# Расписания повторяют паузы бывших sleep-циклов сервисов
+JOBS = [
+    Job(
+        "cbrf_data",
+        _service("scripts/cbrf/cbrf_data.py", "collect"),
+        IntervalTrigger(days=14),
+    ),
+    Job(
+        "moex_iss_indices",
+        _service("scripts/moex_iss_indices/moex_iss_indices.py", "collect"),
+        IntervalTrigger(hours=3),
+        group="moex",
+    ),
+    Job(
+        "moex_iss_dividends",
+        _service("scripts/moex_iss_dividends/moex_iss_dividends.py", "collect"),
+        IntervalTrigger(days=30),
+        group="moex",
+    ),
+    Job(
+        "t_pulse",
+        _service("scripts/t-pulse/automatization/parse_tpulse_daily.py", "collect"),
+        IntervalTrigger(days=1),
+    ),
+    # Дневная свеча закрывается в полночь по Москве
+    Job(
+        "tinkoff_stock",
+        _service("scripts/tinkoff/tinkoff_stock.py", "collect"),
+        CronTrigger(os.getenv("SCHEDULER_TINKOFF_CRON", "30 0 * * *")),
+        group="tinkoff",
+    ),
+    Job(
+        "tinkoff_intraday",
+        _service("scripts/tinkoff/tinkoff_intraday.py", "update_intraday"),
+        IntervalTrigger(hours=1),
+        group="tinkoff",
+    ),
+    Job(
+        "features",
+        _service("scripts/features/refresh_features.py", "run_once"),
+        IntervalTrigger(hours=6),
+    ),
+]
+
+# Задачи одной группы ходят в один API и не запускаются параллельно:
+# квота Tinkoff делится между дневными и внутридневными свечами
+GROUPS = {"tinkoff": 1, "moex": 1}
+
+
+def main():
+    only = set(filter(None, os.getenv("SCHEDULER_JOBS", "").split(",")))
+    jobs = [job for job in JOBS if not only or job.name in only]
+    scheduler = Scheduler(jobs, connection(), groups=GROUPS)
+    logger.info(f"🚀 Планировщик запущен: {', '.join(job.name for job in jobs)}")
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        logger.error("🛑 Остановлено")
+    finally:
+        scheduler.shutdown()
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+import logging
+import sys
+
+from utils.schema import PARTITION_GRANULARITY, migrate_candles
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевод candles на партиции по datetime")
+    parser.add_argument(
+        "--granularity", choices=["year", "month"], default=PARTITION_GRANULARITY
+    )
+    parser.add_argument(
+        "--drop-legacy", action="store_true", help="удалить candles_legacy после переноса"
+    )
+    args = parser.parse_args()
+    migrate_candles(connection(), args.granularity, args.drop_legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import argparse
+import logging
+import sys
+
+from utils.schema import migrate_tpulse_reactions
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Перевод t_pulse_data.reactions_counters из str(dict) в JSONB"
+    )
+    parser.add_argument("--table", default="t_pulse_data")
+    args = parser.parse_args()
+    migrate_tpulse_reactions(connection(), args.table)
+
+
+if __name__ == "__main__":
+    main()
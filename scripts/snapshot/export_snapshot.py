@@ -0,0 +1,27 @@
+import argparse
+import logging
+import sys
+
+from utils.snapshot import SNAPSHOT_DIR, SNAPSHOT_TABLES, export_snapshot
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка таблиц в Parquet-снимок")
+    parser.add_argument("--tables", nargs="+", choices=list(SNAPSHOT_TABLES), help="по умолчанию все")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="каталог снимка")
+    parser.add_argument("--full", action="store_true", help="перевыгрузить целиком")
+    args = parser.parse_args()
+
+    with connection().connect() as conn:
+        export_snapshot(conn, args.tables, args.dir, args.full)
+
+
+if __name__ == "__main__":
+    main()
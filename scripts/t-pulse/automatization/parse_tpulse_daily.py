@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import logging
+import os
 import sys
 import pandas as pd
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import Json, execute_values
 from sqlalchemy import text
-from tpulse import TinkoffPulse
 
 
+from utils.http_cache import caching_transport
+from utils.rate_limit import TokenBucket
 from utils.utils import connection
 
 logging.basicConfig(
@@ -20,15 +26,41 @@ logger = logging.getLogger(__name__)
 
 
 TABLE_NAME = "t_pulse_data"
+POST_COLUMNS = (
+    "id",
+    "ticker",
+    "inserted",
+    "text",
+    "commentscount",
+    "reactioncount",
+    "reactions_counters",
+)
 
 # ----------------- Настройки парсинга -----------------
-KEYS = ["id", "inserted", "commentsCount"]
-pulse = TinkoffPulse()
 MAX_RETRIES = 3
 SLEEP_BETWEEN_PAGES = 0.5  # пауза между страницами
 SLEEP_BETWEEN_TICKERS = 2  # пауза между тикерами
 SLEEP_ON_ERROR = 5  # пауза перед повторной попыткой
 
+# ----------------- Инкрементальный режим -----------------
+MODE = os.getenv("TPULSE_MODE", "incremental")  # incremental | full
+BASE_URL = os.getenv("TPULSE_BASE_URL")  # другой адрес API, например локальная заглушка
+CHECKPOINT_TABLE = "t_pulse_checkpoints"
+HOT_WINDOW_DAYS = int(os.getenv("TPULSE_HOT_WINDOW_DAYS", "3"))  # обновляем счетчики
+LOOKBACK_DAYS = 28  # глубина первого прохода для тикера без контрольной точки
+
+# ----------------- Параллельный режим -----------------
+WORKERS = int(os.getenv("TPULSE_WORKERS", "4"))  # 1 - последовательно с паузами
+REQUESTS_PER_SECOND = float(os.getenv("TPULSE_REQUESTS_PER_SECOND", "4"))
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)  # общий бюджет запросов всех потоков
+_local = threading.local()
+POSTS_PAGE_SIZE = 1000  # строк в одном INSERT при пакетной записи
+
+# ----------------- Потоковая запись -----------------
+FLUSH_BATCH_SIZE = int(os.getenv("TPULSE_FLUSH_BATCH_SIZE", "2000"))  # строк в транзакции
+QUEUE_SIZE = FLUSH_BATCH_SIZE  # очередь между парсингом и записью ограничена
+PUT_TIMEOUT = 0.5  # как часто производитель, ждущий места в очереди, проверяет остановку
+
 # ----------------- Список тикеров -----------------
 
 tickers = [
@@ -119,123 +151,394 @@ tickers = [
 # ----------------- Функции -----------------
 
 
-def parsing_tpulse_last_twentyeight_days(ticker, KEYS):
-    """Парсим посты Т-пульса за последние 2 недели по тикеру с паузами и повторными попытками"""
-    cursor = None
-    raw_data = []
-    twentyeight_days_ago = pd.Timestamp.now() - pd.Timedelta(days=28)
+class PulseFetchError(Exception):
+    """Страница постов не получена после всех повторных попыток"""
+
+
+class PipelineStopped(Exception):
+    """Запись остановлена после ошибки, строки больше некуда класть"""
+
 
+def _pause(delay, stop=None):
+    """Пауза, которую прерывает событие stop конвейера"""
+    if stop is None:
+        time.sleep(delay)
+    elif stop.wait(delay):
+        raise PipelineStopped
+
+
+def iter_ticker_posts(ticker, client=None, limiter=None, stop=None):
+    """Посты тикера от новых к старым, страница за страницей, с повторными попытками.
+
+    С limiter (общий TokenBucket) каждый запрос ждет токен вместо фиксированной паузы.
+    Паузы прерываются событием stop.
+    """
+    client = client or worker_client()
+    cursor = None
     while True:
         for attempt in range(MAX_RETRIES):
+            if limiter is not None:
+                limiter.acquire()
             try:
-                response = pulse.get_posts_by_ticker(ticker, cursor)
-                cursor = response.get("nextCursor")
-                posts = response.get("items", [])
-
-                for post in posts:
-                    post_date = pd.to_datetime(post["inserted"]).tz_localize(None)
-                    if post_date < twentyeight_days_ago:
-                        return pd.DataFrame(raw_data)
-
-                    data = {key: post[key] for key in KEYS}
-                    data["ticker"] = ticker
-                    data["text"] = post["content"]["text"]
-                    data["reactioncount"] = post["reactions"]["totalCount"]
-                    data["reactions_counters"] = post["reactions"]["counters"]
-                    data["commentscount"] = data.pop(
-                        "commentsCount"
-                    )  # переименование для базы
-                    raw_data.append(data)
-
-                time.sleep(SLEEP_BETWEEN_PAGES)  # пауза между страницами
+                response = client.get_posts_by_ticker(ticker, cursor)
                 break  # успешный запрос
             except Exception as e:
                 logger.warning(
                     f"[WARN] Ошибка при парсинге {ticker}: {e}, попытка {attempt + 1}/{MAX_RETRIES}"
                 )
-                time.sleep(SLEEP_ON_ERROR)
+                _pause(SLEEP_ON_ERROR * 2**attempt, stop)  # экспоненциальная пауза
         else:
-            logging.erro(
-                f"[ERROR] Не удалось получить данные по {ticker} после {MAX_RETRIES} попыток"
+            raise PulseFetchError(
+                f"Не удалось получить данные по {ticker} после {MAX_RETRIES} попыток"
             )
-            break
+
+        cursor = response.get("nextCursor")
+        yield from response.get("items", [])
 
         if not cursor:
+            return
+        if limiter is None:
+            _pause(SLEEP_BETWEEN_PAGES, stop)  # пауза между страницами
+
+
+def post_date(post):
+    return pd.to_datetime(post["inserted"]).tz_localize(None)
+
+
+def post_to_row(ticker, post, inserted=None):
+    """Пост API в компактную строку таблицы t_pulse_data в порядке POST_COLUMNS"""
+    if inserted is None:
+        inserted = post_date(post)
+    return (
+        post["id"],
+        ticker,
+        inserted.date(),
+        post["content"]["text"],
+        post["commentsCount"],
+        post["reactions"]["totalCount"],
+        post["reactions"]["counters"],
+    )
+
+
+def iter_last_twentyeight_days(ticker, client=None, limiter=None, stop=None):
+    """Строки постов Т-пульса за последние 28 дней по тикеру"""
+    twentyeight_days_ago = pd.Timestamp.now() - pd.Timedelta(days=28)
+    for post in iter_ticker_posts(ticker, client, limiter, stop):
+        inserted = post_date(post)
+        if inserted < twentyeight_days_ago:
+            return
+        yield post_to_row(ticker, post, inserted)
+
+
+def iter_incremental(
+    ticker, checkpoint, hot_window_days=HOT_WINDOW_DAYS, client=None, limiter=None, stop=None
+):
+    """Инкрементальный парсинг: только посты новее контрольной точки тикера
+    и посты в горячем окне, у которых еще меняются счетчики комментариев и реакций.
+
+    checkpoint - (last_post_id, last_inserted) или None для тикера без истории.
+    Генератор строк, по завершении возвращает новую контрольную точку или None.
+    При PulseFetchError точка не возвращается: между ней и обрывом могли
+    остаться непрочитанные посты, следующий запуск дочитает их.
+    """
+    hot_cutoff = pd.Timestamp.now() - pd.Timedelta(days=hot_window_days)
+    if checkpoint is None:
+        last_post_id = None
+        stop_before = pd.Timestamp.now() - pd.Timedelta(days=LOOKBACK_DAYS)
+    else:
+        last_post_id, last_inserted = checkpoint
+        stop_before = min(pd.Timestamp(last_inserted), hot_cutoff)
+
+    newest = None
+    for post in iter_ticker_posts(ticker, client, limiter, stop):
+        inserted = post_date(post)
+        if inserted < stop_before:
+            break
+        # Дошли до уже сохраненного поста и вышли из горячего окна - дальше все известно
+        if post["id"] == last_post_id and inserted < hot_cutoff:
             break
+        if newest is None:
+            newest = (post["id"], inserted)
+        yield post_to_row(ticker, post, inserted)
+    return newest
+
+
+def load_checkpoints(conn):
+    """Контрольные точки парсинга: {ticker: (last_post_id, last_inserted)}"""
+    conn.execute(
+        text(f"""
+            CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+                ticker VARCHAR(20) PRIMARY KEY,
+                last_post_id TEXT NOT NULL,
+                last_inserted TIMESTAMP NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    )
+    rows = conn.execute(
+        text(f"SELECT ticker, last_post_id, last_inserted FROM {CHECKPOINT_TABLE}")
+    ).all()
+    return {ticker: (post_id, inserted) for ticker, post_id, inserted in rows}
+
+
+def save_checkpoints(conn, checkpoints):
+    """Сохраняем самые свежие увиденные посты по тикерам"""
+    for ticker, (post_id, inserted) in checkpoints.items():
+        conn.execute(
+            text(f"""
+                INSERT INTO {CHECKPOINT_TABLE} (ticker, last_post_id, last_inserted)
+                VALUES (:ticker, :post_id, :inserted)
+                ON CONFLICT (ticker) DO UPDATE SET
+                    last_post_id = EXCLUDED.last_post_id,
+                    last_inserted = EXCLUDED.last_inserted,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE {CHECKPOINT_TABLE}.last_inserted <= EXCLUDED.last_inserted
+            """),
+            {"ticker": ticker, "post_id": post_id, "inserted": inserted.to_pydatetime()},
+        )
+
+
+def write_rows(conn, rows):
+    """Пакетный upsert строк постов: один execute_values на POSTS_PAGE_SIZE строк"""
+    # В одном INSERT ... ON CONFLICT ключ не может встречаться дважды
+    unique = {}
+    for row in rows:
+        unique.setdefault((row[0], row[1]), row)
+    if not unique:
+        return 0
+    values = [(*row[:-1], Json(row[-1])) for row in unique.values()]
+    cursor = conn.connection.cursor()
+    try:
+        execute_values(
+            cursor,
+            f"""
+                INSERT INTO {TABLE_NAME} ({", ".join(POST_COLUMNS)})
+                VALUES %s
+                ON CONFLICT (id, ticker) DO UPDATE SET
+                    text = EXCLUDED.text,
+                    commentscount = EXCLUDED.commentscount,
+                    reactioncount = EXCLUDED.reactioncount,
+                    reactions_counters = EXCLUDED.reactions_counters
+            """,
+            values,
+            page_size=POSTS_PAGE_SIZE,
+        )
+    finally:
+        cursor.close()
+    return len(values)
+
+
+def delete_stale_posts(conn, ticker, seen_ids):
+    """Полный режим: удаляем посты 28-дневного окна, которых больше нет в ленте тикера"""
+    conn.execute(
+        text(f"""
+            DELETE FROM {TABLE_NAME}
+            WHERE ticker = :ticker
+              AND inserted >= current_date - interval '28 days'
+              AND id <> ALL(:ids)
+        """),
+        {"ticker": ticker, "ids": list(seen_ids)},
+    )
+
+
+class PulseClient:
+    """Лента постов тикера: тот же запрос, что TinkoffPulse.get_posts_by_ticker.
+
+    Адрес (TPULSE_BASE_URL) и транспорт httpx с кэшем ответов задаются
+    при создании клиента, а не правкой внутренних полей tpulse.
+    """
+
+    def __init__(self, base_url=None):
+        import httpx
+        from tpulse import settings
+        from tpulse.sync_client import PostClient, ua
+
+        self.client = httpx.Client(
+            base_url=base_url or PostClient.BASE_URL,
+            headers={
+                "Content-type": "application/json",
+                "Accept": "application/json",
+                "User-agent": ua,
+            },
+            params={"appName": "invest", "origin": "web", "platform": "web"},
+            timeout=settings.TIMEOUT_SEC,
+            # С HTTP_CACHE=on|offline страницы постов берутся из дискового кэша
+            transport=caching_transport(httpx.HTTPTransport()),
+        )
+
+    def get_posts_by_ticker(self, ticker, cursor=None):
+        """Страница постов: payload ответа или None, если API вернул не Ok"""
+        response = self.client.get(
+            f"post/instrument/{ticker}", params={"limit": 30, "cursor": cursor}
+        )
+        response.raise_for_status()
+        body = response.json()
+        return body["payload"] if body["status"] == "Ok" else None
+
+    def close(self):
+        self.client.close()
+
+
+def worker_client():
+    """Свой клиент Т-Пульса у каждого потока, создается при первом запросе"""
+    if not hasattr(_local, "pulse"):
+        _local.pulse = PulseClient(BASE_URL)
+    return _local.pulse
+
+
+def _put(out, item, stop):
+    """put в ограниченную очередь, прерываемый событием stop"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=PUT_TIMEOUT)
+            return
+        except queue.Full:
+            continue
+    raise PipelineStopped
+
+
+def _stream_ticker(out, ticker, rows, stop):
+    """Перекладывает строки тикера в очередь записи и сообщает итог парсинга"""
+    logging.info(f"[INFO] Парсинг тикера {ticker} ...")
+    try:
+        while True:
+            _put(out, ("row", ticker, next(rows)), stop)  # ждет, пока запись отстает
+    except StopIteration as result:
+        _put(out, ("done", ticker, result.value), stop)
+    except PipelineStopped:
+        rows.close()
+        raise
+    except Exception as e:
+        logger.error(f"[ERROR] {e}")
+        _put(out, ("failed", ticker, None), stop)
+
+
+def stream_tickers(make_rows, out, stop):
+    """Производитель: make_rows(ticker, client, limiter, stop) -> генератор строк по тикеру.
+
+    При WORKERS > 1 тикеры парсятся пулом потоков, общий бюджет запросов
+    задает rate_limiter, а повторы идут внутри каждого потока.
+    В конце кладет в очередь None. После stop потоки бросают парсинг и
+    завершаются, не дожидаясь места в очереди.
+    """
+
+    def task(ticker):
+        if stop.is_set():
+            return
+        if WORKERS <= 1:
+            _stream_ticker(out, ticker, make_rows(ticker, None, None, stop), stop)
+            stop.wait(SLEEP_BETWEEN_TICKERS)  # пауза между тикерами
+        else:
+            _stream_ticker(
+                out, ticker, make_rows(ticker, worker_client(), rate_limiter, stop), stop
+            )
 
-    df = pd.DataFrame(raw_data)
-    if not df.empty:
-        df["inserted"] = pd.to_datetime(df["inserted"]).dt.date
-    return df
+    try:
+        with ThreadPoolExecutor(max_workers=max(WORKERS, 1)) as executor:
+            list(executor.map(task, tickers))
+    except PipelineStopped:
+        pass
+    finally:
+        if not stop.is_set():
+            out.put(None)
 
 
-def update_posts_table(df):
-    """Обновляем таблицу в PostgreSQL"""
-    if df.empty:
-        logging.info("[INFO] Нет новых данных для обновления.")
-        return
+def run_pipeline(make_rows, finish):
+    """Потоковый конвейер страница -> строки -> БД.
 
+    Строки пишутся пачками по FLUSH_BATCH_SIZE, каждая пачка в своей транзакции,
+    поэтому в памяти не больше пачки и очереди, а после сбоя сохранено все
+    до последней записанной пачки. finish(conn, ticker, newest, seen_ids)
+    вызывается в транзакции пачки, где записаны последние строки тикера.
+    """
     engine = connection()
+    out = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=stream_tickers, args=(make_rows, out, stop), daemon=True)
+    producer.start()
+
+    batch, finished = [], []
+    seen = {}
+
+    def flush():
+        if not batch and not finished:
+            return
+        with engine.begin() as conn:
+            write_rows(conn, batch)
+            for ticker, newest in finished:
+                finish(conn, ticker, newest, seen.get(ticker, ()))
+        for ticker, _ in finished:
+            count = len(seen.pop(ticker, ()))
+            logging.info(f"[INFO] Данные по {ticker} обновлены: {count} постов")
+        batch.clear()
+        finished.clear()
+
+    try:
+        while (message := out.get()) is not None:
+            kind, ticker, payload = message
+            if kind == "row":
+                batch.append(payload)
+                seen.setdefault(ticker, []).append(payload[0])
+                if len(batch) >= FLUSH_BATCH_SIZE:
+                    flush()
+            elif kind == "done":
+                # Все строки тикера уже в пачке или записаны раньше - очередь FIFO
+                finished.append((ticker, payload))
+            else:
+                seen.pop(ticker, None)
+        flush()
+    except BaseException:
+        # Запись упала: без stop производители и потоки пула навсегда
+        # заблокируются на put в полную очередь
+        stop.set()
+        producer.join()
+        raise
+    producer.join()
+
+
+def run_full():
+    """Полный режим: 28 дней по всем тикерам с перезаписью окна"""
+
+    def finish(conn, ticker, newest, seen_ids):
+        if seen_ids:
+            delete_stale_posts(conn, ticker, seen_ids)
+
+    run_pipeline(iter_last_twentyeight_days, finish)
+
+
+def run_incremental():
+    """Инкрементальный режим: до контрольной точки тикера плюс горячее окно"""
+    with connection().begin() as conn:
+        checkpoints = load_checkpoints(conn)
+
+    def finish(conn, ticker, newest, seen_ids):
+        # Точка сдвигается в той же транзакции, что и последние строки тикера
+        if newest is not None:
+            save_checkpoints(conn, {ticker: newest})
+
+    run_pipeline(
+        lambda ticker, client, limiter, stop: iter_incremental(
+            ticker, checkpoints.get(ticker), client=client, limiter=limiter, stop=stop
+        ),
+        finish,
+    )
 
-    with engine.connect() as conn:
-        with conn.begin():  # автоматическое управление транзакциями
-            for ticker in df["ticker"].unique():
-                # Удаляем старые данные
-                conn.execute(
-                    text(f"""
-                        DELETE FROM {TABLE_NAME}
-                        WHERE ticker = :ticker AND inserted >= current_date - interval '28 days'
-                    """),
-                    {"ticker": ticker},
-                )
 
-                # Вставляем новые данные
-                ticker_data = df[df["ticker"] == ticker]
-                count = 0
-
-                for _, row in ticker_data.iterrows():
-                    conn.execute(
-                        text(f"""
-                            INSERT INTO {TABLE_NAME} (id, ticker, inserted, text, commentscount, reactioncount, reactions_counters)
-                            VALUES (:id, :ticker, :inserted, :text, :commentscount, :reactioncount, :reactions_counters)
-                            ON CONFLICT (id, ticker) DO UPDATE SET
-                                text = EXCLUDED.text,
-                                commentscount = EXCLUDED.commentscount,
-                                reactioncount = EXCLUDED.reactioncount,
-                                reactions_counters = EXCLUDED.reactions_counters
-                        """),
-                        {
-                            "id": row.id,
-                            "ticker": row.ticker,
-                            "inserted": row.inserted,
-                            "text": row.text,
-                            "commentscount": row.commentscount,
-                            "reactioncount": row.reactioncount,
-                            "reactions_counters": str(row.reactions_counters),
-                        },
-                    )
-                    count += 1
-
-                logging.info(f"[INFO] Данные по {ticker} обновлены: {count} постов")
-
-        # Соединение автоматически закрывается при выходе из with блока
+# ----------------- Основной цикл -----------------
 
 
-# ----------------- Основной цикл -----------------
+def collect():
+    """Одна итерация парсинга в режиме TPULSE_MODE"""
+    logging.info("[INFO] Запуск скрипта парсинга Т-пульса")
+    if MODE == "full":
+        run_full()
+    else:
+        run_incremental()
 
 
 def main():
     while True:
-        logging.info("[INFO] Запуск скрипта парсинга Т-пульса")
-        all_data = pd.DataFrame()
-        for ticker in tickers:
-            logging.info(f"[INFO] Парсинг тикера {ticker} ...")
-            df = parsing_tpulse_last_twentyeight_days(ticker, KEYS)
-            logging.info(f"[INFO] Найдено {len(df)} постов за последние 2 недели для {ticker}")
-            all_data = pd.concat([all_data, df], axis=0)
-            time.sleep(SLEEP_BETWEEN_TICKERS)  # пауза между тикерами
-
-        update_posts_table(all_data)
+        collect()
         logging.info("[INFO] Скрипт завершил выполнение. Ждем 1 день до следующей итерации.")
         time.sleep(24 * 60 * 60)
 
@@ -0,0 +1,36 @@
+import argparse
+import logging
+import os
+import sys
+
+from utils.gaps import HISTORY_YEARS, backfill_gaps
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+TINKOFF_TOKEN = os.getenv("TINKOFF_TOKEN")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск и догрузка пропусков в дневных свечах")
+    parser.add_argument("--dry-run", action="store_true", help="только показать план запросов")
+    parser.add_argument(
+        "--history-years",
+        type=int,
+        default=HISTORY_YEARS,
+        help="глубина загрузки тикеров без истории",
+    )
+    args = parser.parse_args()
+
+    total = backfill_gaps(connection(), TINKOFF_TOKEN, args.dry_run, args.history_years)
+    logger.info(f"🎉 Догружено {total} свечей")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,11 @@ except ImportError:
     import psycopg2
     from psycopg2.extras import execute_batch
 
+from utils.candles import CANDLE_COLUMNS, copy_candle_lines, values_to_line
+from utils import run_ledger
+from utils.schema import create_candles
+from utils.tinkoff_async import client_options, fetch_candles, get_candles
+
 ALL_TICKERS = [
     # Банки и финансы
     "SBER",
@@ -218,22 +223,8 @@ class DatabaseManager:
                     )
                 """)
 
-                # Таблица свечей
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS candles (
-                        id SERIAL PRIMARY KEY,
-                        ticker VARCHAR(20) REFERENCES companies(ticker),
-                        datetime TIMESTAMP NOT NULL,
-                        open DECIMAL(15,6),
-                        high DECIMAL(15,6),
-                        low DECIMAL(15,6),
-                        close DECIMAL(15,6),
-                        volume BIGINT,
-                        is_complete BOOLEAN,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(ticker, datetime)
-                    )
-                """)
+                # Таблица свечей: партиции по datetime, покрывающий ключ и BRIN
+                create_candles(self.conn)
 
                 # Таблица метаданных сборов
                 cursor.execute("""
@@ -259,12 +250,6 @@ class DatabaseManager:
                 """)
 
                 # Индексы для оптимизации
-                cursor.execute(
-                    "CREATE INDEX IF NOT EXISTS idx_candles_ticker_datetime ON candles(ticker, datetime)"
-                )
-                cursor.execute(
-                    "CREATE INDEX IF NOT EXISTS idx_candles_datetime ON candles(datetime)"
-                )
                 cursor.execute(
                     "CREATE INDEX IF NOT EXISTS idx_companies_ticker ON companies(ticker)"
                 )
@@ -311,48 +296,30 @@ class DatabaseManager:
             self.conn.rollback()
             return False
 
+    def copy_candles(self, ticker, candles_df):
+        """COPY свечей в текущей транзакции, коммит остается за вызывающим"""
+        if candles_df.empty:
+            return 0
+        # Строки потоком уходят в COPY, без iterrows и кортежей на строку
+        lines = (
+            values_to_line(ticker, *values)
+            for values in candles_df[list(CANDLE_COLUMNS[1:])].itertuples(
+                index=False, name=None
+            )
+        )
+        return copy_candle_lines(self.conn, lines)
+
     def save_candles_batch(self, ticker, candles_df):
         """Пакетное сохранение свечей"""
         if candles_df.empty:
             return True
 
         try:
-            with self.conn.cursor() as cursor:
-                # Подготавливаем данные для вставки
-                data_tuples = [
-                    (
-                        ticker,
-                        row["datetime"],
-                        row["open"],
-                        row["high"],
-                        row["low"],
-                        row["close"],
-                        row["volume"],
-                        row["is_complete"],
-                    )
-                    for _, row in candles_df.iterrows()
-                ]
+            saved = self.copy_candles(ticker, candles_df)
 
-                # Пакетная вставка
-                execute_batch(
-                    cursor,
-                    """
-                    INSERT INTO candles (ticker, datetime, open, high, low, close, volume, is_complete)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (ticker, datetime) DO UPDATE SET
-                        open = EXCLUDED.open,
-                        high = EXCLUDED.high,
-                        low = EXCLUDED.low,
-                        close = EXCLUDED.close,
-                        volume = EXCLUDED.volume,
-                        is_complete = EXCLUDED.is_complete
-                """,
-                    data_tuples,
-                )
-
-                self.conn.commit()
-                print(f"   📊 Сохранено {len(data_tuples)} свечей для {ticker}")
-                return True
+            self.conn.commit()
+            print(f"   📊 Сохранено {saved} свечей для {ticker}")
+            return True
 
         except Exception as e:
             print(f"❌ Ошибка сохранения свечей для {ticker}: {e}")
@@ -420,7 +387,7 @@ class CompleteDataCollector:
         """Поиск доступных акций из списка"""
         print(f"Всего тикеров в списке: {len(ALL_TICKERS)}")
 
-        with Client(self.token) as client:
+        with Client(self.token, **client_options()) as client:
             try:
                 all_shares = client.instruments.shares().instruments
                 print(f"Всего акций в Tinkoff API: {len(all_shares)}")
@@ -474,108 +441,94 @@ class CompleteDataCollector:
                 print(f"Ошибка при поиске акций: {e}")
                 return [], ALL_TICKERS
 
-    def collect_extended_data(self, stocks_info, years=10):
-        """Сбор данных с расширенной историей"""
-        all_data = {}
-        failed_tickers = []
-
-        print(f"\n Начинаем сбор данных за {years} лет...")
-        print(f" Обрабатываем {len(stocks_info)} акций")
+    def collect_units(self, units, figis, save_unit, fail_unit):
+        """Последовательная загрузка единиц (тикер, начало, конец): каждая
+        сохраняется сразу после загрузки через save_unit"""
+        print(f"\n Загружаем {len(units)} периодов...")
         print("-" * 60)
 
-        for i, stock in enumerate(stocks_info, 1):
+        for i, (ticker, start_time, end_time) in enumerate(units, 1):
+            print(f" [{i:3d}/{len(units)}] {ticker} {start_time.date()} - {end_time.date()}")
             try:
-                print(f" [{i:2d}/{len(stocks_info)}] {stock['ticker']}...")
-
-                # Собираем данные по частям
-                candles_df = self._collect_data_in_chunks(stock["figi"], years=years)
-
-                if candles_df is not None and len(candles_df) > 100:
-                    all_data[stock["ticker"]] = {
-                        "data": candles_df,
-                        "info": stock,
-                        "first_date": candles_df["datetime"].min(),
-                        "last_date": candles_df["datetime"].max(),
-                        "candle_count": len(candles_df),
-                        "data_quality": self._assess_data_quality(candles_df),
-                        "period_years": (
-                            candles_df["datetime"].max() - candles_df["datetime"].min()
-                        ).days
-                        / 365.25,
-                    }
-
-                    print(f"   Успешно: {len(candles_df)} свечей")
-                    print(
-                        f"   Период: {candles_df['datetime'].min().date()} - {candles_df['datetime'].max().date()}"
-                    )
-
-                else:
-                    failed_tickers.append(stock["ticker"])
-                    print(
-                        f"   Мало данных: {len(candles_df) if candles_df else 0} свечей"
-                    )
-
-                # Пауза между запросами
-                time.sleep(0.3)
-
+                candles_df = self._get_candles_period(figis[ticker], start_time, end_time)
             except Exception as e:
-                failed_tickers.append(stock["ticker"])
                 print(f"   Ошибка: {e}")
+                fail_unit(ticker, start_time, e)
                 continue
+            save_unit(ticker, start_time, end_time, candles_df)
 
+            # Пауза между запросами
+            time.sleep(0.2)
+
+    def collect_units_async(self, units, figis, save_unit, fail_unit, batch_size=32):
+        """Конкурентная загрузка единиц через один AsyncClient пачками по
+        batch_size: после каждой пачки ее единицы сохраняются по одной, так что
+        при падении теряется не больше одной пачки"""
+        print(f"\n Асинхронно загружаем {len(units)} периодов...")
         print("-" * 60)
-        print(f"Успешно собрано: {len(all_data)} акций")
-        if failed_tickers:
-            print(f" Проблемы с: {', '.join(failed_tickers)}")
 
-        return all_data
+        for offset in range(0, len(units), batch_size):
+            batch = units[offset:offset + batch_size]
+            jobs = [
+                ((ticker, start_time), figis[ticker], start_time, end_time)
+                for ticker, start_time, end_time in batch
+            ]
+            candles, failed = fetch_candles(jobs, self.token)
+            errors = {key: error for key, _, _, error in failed}
 
-    def _collect_data_in_chunks(self, figi, years=10, chunk_years=3):
-        """Сбор данных частями"""
-        all_chunks = []
-        end_time = datetime.utcnow()
+            for ticker, start_time, end_time in batch:
+                error = errors.get((ticker, start_time))
+                if error is not None:
+                    print(
+                        f"   Ошибка чанка {ticker} {start_time.date()} - {end_time.date()}: {error}"
+                    )
+                    fail_unit(ticker, start_time, error)
+                    continue
+                candles_df = self._candles_to_dataframe(candles.get((ticker, start_time), []))
+                save_unit(ticker, start_time, end_time, candles_df)
+            print(f"   Готово {min(offset + batch_size, len(units))}/{len(units)}")
+
+    def _add_stock_data(self, all_data, stock, candles_df):
+        """Добавление свечей акции в результат сбора, если данных достаточно"""
+        if candles_df is not None and len(candles_df) > 100:
+            all_data[stock["ticker"]] = {
+                "data": candles_df,
+                "info": stock,
+                "first_date": candles_df["datetime"].min(),
+                "last_date": candles_df["datetime"].max(),
+                "candle_count": len(candles_df),
+                "data_quality": self._assess_data_quality(candles_df),
+                "period_years": (
+                    candles_df["datetime"].max() - candles_df["datetime"].min()
+                ).days
+                / 365.25,
+            }
+
+            print(f"   Успешно: {len(candles_df)} свечей")
+            print(
+                f"   Период: {candles_df['datetime'].min().date()} - {candles_df['datetime'].max().date()}"
+            )
+            return True
 
-        # Разбиваем на периоды
+        print(f"   Мало данных: {len(candles_df) if candles_df is not None else 0} свечей")
+        return False
+
+    def _chunk_periods(self, end_time, years=10, chunk_years=3):
+        """Периоды (начало, конец) по chunk_years лет, от свежих к старым"""
         for chunk_start in range(0, years, chunk_years):
             chunk_end = min(chunk_start + chunk_years, years)
 
             start_time = end_time - timedelta(days=chunk_end * 365)
             chunk_start_time = end_time - timedelta(days=chunk_start * 365)
-
-            try:
-                chunk_data = self._get_candles_period(
-                    figi, start_time, chunk_start_time
-                )
-                if chunk_data is not None and len(chunk_data) > 0:
-                    all_chunks.append(chunk_data)
-
-                time.sleep(0.2)
-
-            except Exception:
-                continue
-
-        # Объединяем все чанки
-        if all_chunks:
-            combined_df = pd.concat(all_chunks, ignore_index=True)
-            combined_df = combined_df.drop_duplicates(subset=["datetime"]).sort_values(
-                "datetime"
-            )
-            return combined_df
-        else:
-            return pd.DataFrame()
+            yield start_time, chunk_start_time
 
     def _get_candles_period(
         self, figi, start_time, end_time, interval=CandleInterval.CANDLE_INTERVAL_DAY
     ):
         """Получение свечей за период"""
-        with Client(self.token) as client:
-            try:
-                candles = client.get_all_candles(
-                    figi=figi, from_=start_time, to=end_time, interval=interval
-                )
-                return self._candles_to_dataframe(candles)
-            except Exception:
-                return pd.DataFrame()
+        with Client(self.token, **client_options()) as client:
+            candles = get_candles(client, figi, start_time, end_time, interval)
+            return self._candles_to_dataframe(candles)
 
     def _candles_to_dataframe(self, candles):
         """Конвертация свечей в DataFrame"""
@@ -621,30 +574,114 @@ class CompleteDataCollector:
 
 
 class CompleteDataDBManager:
+    COLLECTION_JOB = "complete_collection"
+
     def __init__(self, db_config):
         self.db_manager = DatabaseManager(db_config)
+        self.conn = self.db_manager.conn
+        run_ledger.ensure_ledger(self.conn)
+        self.conn.commit()
+        self.run_id = None
 
-    def save_all_data(
-        self, all_data, available_stocks, not_found_tickers, collection_years
-    ):
-        """Сохранение всех данных в базу данных"""
-        timestamp = datetime.now()
-
-        print("\n Сохранение данных в PostgreSQL...")
-
-        # Сохранение информации о компаниях
+    def save_companies(self, available_stocks):
+        """Сохранение информации о компаниях до загрузки свечей"""
         companies_saved = 0
         for stock in available_stocks:
             if self.db_manager.save_company_info(stock):
                 companies_saved += 1
         print(f"   Компании сохранены: {companies_saved}/{len(available_stocks)}")
 
-        # Сохранение свечей
-        candles_saved = 0
-        for ticker, data in all_data.items():
-            if self.db_manager.save_candles_batch(ticker, data["data"]):
-                candles_saved += 1
-        print(f"   Свечи сохранены: {candles_saved}/{len(all_data)}")
+    def start_run(self, available_stocks, chunk_periods, years, chunk_years):
+        """Открытие прогона в журнале: продолжение незавершенного с теми же
+        параметрами или новый. Возвращает (конец периода, невыполненные единицы)"""
+        params = {"years": years, "chunk_years": chunk_years}
+        self.run_id, end_time, resumed = run_ledger.open_run(
+            self.conn, self.COLLECTION_JOB, params
+        )
+        # Новые тикеры добавляются и в продолжаемый прогон
+        run_ledger.add_units(
+            self.conn,
+            self.run_id,
+            [
+                (stock["ticker"], start_time, chunk_end_time)
+                for stock in available_stocks
+                for start_time, chunk_end_time in chunk_periods(end_time, years, chunk_years)
+            ],
+        )
+        self.conn.commit()
+
+        units = run_ledger.pending_units(self.conn, self.run_id)
+        if resumed:
+            progress = run_ledger.run_progress(self.conn, self.run_id)
+            print(
+                f" Продолжаем сборку {self.run_id} от {end_time:%Y-%m-%d %H:%M}: "
+                f"выполнено {progress.get('done', 0)}, осталось {len(units)}"
+            )
+        else:
+            print(f" Новая сборка {self.run_id}: {len(units)} периодов")
+        return end_time, units
+
+    def save_unit(self, ticker, start_time, end_time, candles_df):
+        """Свечи единицы и отметка о ее выполнении в одной транзакции"""
+        try:
+            saved = self.db_manager.copy_candles(ticker, candles_df)
+            run_ledger.complete_unit(self.conn, self.run_id, ticker, start_time, saved)
+            self.conn.commit()
+            print(f"   📊 {ticker} {start_time.date()} - {end_time.date()}: {saved} свечей")
+        except Exception as e:
+            print(f"❌ Ошибка сохранения свечей для {ticker}: {e}")
+            self.conn.rollback()
+            self.fail_unit(ticker, start_time, e)
+
+    def fail_unit(self, ticker, start_time, error):
+        """Ошибка единицы: при следующем запуске она будет повторена"""
+        try:
+            run_ledger.fail_unit(self.conn, self.run_id, ticker, start_time, error)
+            self.conn.commit()
+        except Exception as e:
+            print(f"❌ Ошибка записи в журнал для {ticker}: {e}")
+            self.conn.rollback()
+
+    def finish_run(self):
+        """Сборка закрывается, когда невыполненных единиц не осталось;
+        иначе следующий запуск продолжит ее"""
+        left = run_ledger.pending_units(self.conn, self.run_id)
+        progress = run_ledger.run_progress(self.conn, self.run_id)
+        if not left:
+            status = "failed" if progress.get("failed") else "done"
+            run_ledger.finish_run(self.conn, self.run_id, status)
+        self.conn.commit()
+        print(
+            f"   Периоды: выполнено {progress.get('done', 0)}, "
+            f"с ошибкой {progress.get('failed', 0)}, осталось {len(left)}"
+        )
+        return not left
+
+    def load_run_data(self, tickers, start_time, end_time):
+        """Свечи сборки из базы по тикерам: отчет строится по сохраненным
+        данным, а не по памяти процесса, который мог быть перезапущен"""
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT ticker, datetime, open, high, low, close, volume, is_complete
+                FROM candles
+                WHERE ticker = ANY(%s) AND datetime >= %s AND datetime <= %s
+                ORDER BY ticker, datetime
+                """,
+                (list(tickers), start_time, end_time),
+            )
+            df = pd.DataFrame(cursor.fetchall(), columns=list(CANDLE_COLUMNS))
+        self.conn.commit()
+        for column in ("open", "high", "low", "close"):
+            df[column] = df[column].astype(float)
+        return {
+            ticker: group.drop(columns="ticker").reset_index(drop=True)
+            for ticker, group in df.groupby("ticker")
+        }
+
+    def save_all_data(self, all_data, not_found_tickers, collection_years):
+        """Сохранение метаданных сборки и аналитический отчет"""
+        timestamp = datetime.now()
 
         # Сохранение метаданных
         metadata = {
@@ -778,6 +815,8 @@ def main_complete_collection():
 
     # Настройки
     COLLECTION_YEARS = 10  # Лет истории
+    CHUNK_YEARS = 3  # Лет в одной единице журнала
+    ASYNC_COLLECTION = True  # Конкурентная загрузка через AsyncClient
 
     print(" ПОЛНЫЙ СБОР ДАННЫХ В POSTGRESQL")
     print("=" * 60)
@@ -797,16 +836,39 @@ def main_complete_collection():
             print("❌ Не найдено доступных акций!")
             return
 
-        # Шаг 2: Сбор данных
+        data_manager.save_companies(available_stocks)
+
+        # Шаг 2: Сбор данных по журналу, каждый период коммитится сразу
         print(f"\n Начинаем сбор данных за {COLLECTION_YEARS} лет...")
-        all_data = collector.collect_extended_data(
-            available_stocks, years=COLLECTION_YEARS
+        end_time, units = data_manager.start_run(
+            available_stocks, collector._chunk_periods, COLLECTION_YEARS, CHUNK_YEARS
         )
+        figis = {stock["ticker"]: stock["figi"] for stock in available_stocks}
+        if ASYNC_COLLECTION:
+            collector.collect_units_async(
+                units, figis, data_manager.save_unit, data_manager.fail_unit
+            )
+        else:
+            collector.collect_units(
+                units, figis, data_manager.save_unit, data_manager.fail_unit
+            )
+
+        if not data_manager.finish_run():
+            print(" Сборка не завершена, повторный запуск продолжит ее")
+            data_manager.close_connection()
+            return
+
+        # Шаг 3: Отчет по сохраненным свечам
+        candles = data_manager.load_run_data(
+            figis, end_time - timedelta(days=COLLECTION_YEARS * 365), end_time
+        )
+        all_data = {}
+        for stock in available_stocks:
+            collector._add_stock_data(all_data, stock, candles.get(stock["ticker"]))
 
         if all_data:
-            # Шаг 3: Сохранение в базу данных
             timestamp, collection_id = data_manager.save_all_data(
-                all_data, available_stocks, not_found, COLLECTION_YEARS
+                all_data, not_found, COLLECTION_YEARS
             )
 
             print("\n ПОЛНЫЙ СБОР ДАННЫХ ЗАВЕРШЕН!")
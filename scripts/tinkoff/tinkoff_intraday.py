@@ -0,0 +1,142 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from tinkoff.invest import CandleInterval
+
+from utils.intraday import (
+    INTRADAY_INTERVALS,
+    candle_to_line,
+    copy_intraday_lines,
+    ensure_intraday_table,
+    ensure_price_scales,
+    from_minutes,
+    load_instruments,
+)
+from utils.tinkoff_async import fetch_candles
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+TINKOFF_TOKEN = os.getenv("TINKOFF_TOKEN")
+INTERVALS = os.getenv("TINKOFF_INTRADAY_INTERVALS", "1m,5m,15m,1h").split(",")
+HISTORY_DAYS = int(os.getenv("TINKOFF_INTRADAY_HISTORY_DAYS", "30"))
+# Сколько дней истории грузится за один проход по всем тикерам:
+# ограничивает память, свечи пачки пишутся одной транзакцией
+BATCH_DAYS = int(os.getenv("TINKOFF_INTRADAY_BATCH_DAYS", "7"))
+UPDATE_INTERVAL = int(os.getenv("TINKOFF_INTRADAY_UPDATE_INTERVAL", "3600"))
+
+CANDLE_INTERVALS = {
+    "1m": CandleInterval.CANDLE_INTERVAL_1_MIN,
+    "5m": CandleInterval.CANDLE_INTERVAL_5_MIN,
+    "15m": CandleInterval.CANDLE_INTERVAL_15_MIN,
+    "1h": CandleInterval.CANDLE_INTERVAL_HOUR,
+}
+
+
+def _start_times(instruments, end_time, history_days):
+    """Начало загрузки по тикерам: с последней сохраненной свечи
+    (она могла быть незавершенной) или history_days назад"""
+    default = end_time - timedelta(days=history_days)
+    starts = {}
+    for row in instruments.itertuples(index=False):
+        if pd.isna(row.last_minute):
+            starts[row.company_id] = default
+        else:
+            starts[row.company_id] = from_minutes([row.last_minute])[0].to_pydatetime()
+    return starts
+
+
+def update_interval(engine, interval, history_days=HISTORY_DAYS):
+    """Догружает свечи одного интервала по всем тикерам"""
+    interval_minutes = INTRADAY_INTERVALS[interval]
+    end_time = datetime.utcnow()
+
+    with engine.begin() as conn:
+        ensure_intraday_table(
+            conn, end_time - timedelta(days=history_days), end_time + timedelta(days=366)
+        )
+        instruments = load_instruments(conn, interval_minutes)
+        # Масштаб цен фиксируется при первой загрузке тикера
+        scales = ensure_price_scales(conn, instruments)
+
+    if instruments.empty:
+        return 0
+
+    figis = dict(zip(instruments["company_id"], instruments["figi"]))
+    tickers = dict(zip(instruments["company_id"], instruments["ticker"]))
+    starts = _start_times(instruments, end_time, history_days)
+
+    total = 0
+    batch_start = min(starts.values())
+    while batch_start < end_time:
+        batch_end = min(batch_start + timedelta(days=BATCH_DAYS), end_time)
+        jobs = [
+            (company_id, figis[company_id], max(start, batch_start), batch_end)
+            for company_id, start in starts.items()
+            if start < batch_end
+        ]
+        candles, failed = fetch_candles(jobs, TINKOFF_TOKEN, interval=CANDLE_INTERVALS[interval])
+        for company_id, start, end, error in failed:
+            logger.error(
+                f"❌ {tickers[company_id]} {interval} "
+                f"{start:%Y-%m-%d %H:%M}..{end:%Y-%m-%d %H:%M}: {error}"
+            )
+
+        lines = (
+            candle_to_line(company_id, interval_minutes, scales[company_id], candle)
+            for company_id, items in candles.items()
+            for candle in items
+        )
+        with engine.begin() as conn:
+            written = copy_intraday_lines(conn, lines)
+        total += written
+        logger.info(f"{interval} {batch_start:%Y-%m-%d}..{batch_end:%Y-%m-%d}: {written} свечей")
+        batch_start = batch_end
+
+    return total
+
+
+def update_intraday(intervals=INTERVALS, history_days=HISTORY_DAYS):
+    engine = connection()
+    for interval in intervals:
+        total = update_interval(engine, interval, history_days)
+        logger.info(f"🎉 {interval}: записано {total} свечей")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка внутридневных свечей Tinkoff")
+    parser.add_argument("--intervals", nargs="+", choices=list(CANDLE_INTERVALS), default=INTERVALS)
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    parser.add_argument("--once", action="store_true", help="один проход без цикла")
+    args = parser.parse_args()
+
+    if args.once:
+        update_intraday(args.intervals, args.history_days)
+        return
+
+    logger.info("🚀 Сервис внутридневных свечей запущен")
+    while True:
+        try:
+            update_intraday(args.intervals, args.history_days)
+            time.sleep(UPDATE_INTERVAL)
+        except KeyboardInterrupt:
+            logger.error("🛑 Остановлено")
+            break
+        except Exception as e:
+            logger.error(f"🔥 Ошибка: {e}")
+            time.sleep(300)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,17 @@ import time
 import os
 import warnings
 from tinkoff.invest import Client, CandleInterval
+from utils.candles import copy_candles
+from utils.gaps import backfill_gaps
+from utils.indicators import ensure_tables, refresh_ticker
+from utils.schema import ensure_current_partitions
+from utils.rate_limit import TokenBucket
+from utils.tinkoff_async import (
+    MARKET_DATA_REQUESTS_PER_MINUTE,
+    client_options,
+    fetch_candles,
+    get_candles,
+)
 from utils.utils import connection
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
@@ -19,6 +30,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 TINKOFF_TOKEN = os.getenv("TINKOFF_TOKEN")
+FETCH_MODE = os.getenv("TINKOFF_FETCH_MODE", "async")  # async | sync
 
 
 def normalize_datetime(dt):
@@ -28,15 +40,13 @@ def normalize_datetime(dt):
     return dt
 
 
-def update_stock_data():
-    """Упрощенная функция обновления данных"""
-    engine = connection()
-
-    # Получаем все тикеры и FIGI одним запросом
+def load_last_dates(engine):
+    """Все тикеры и FIGI с датой последней и первой незавершенной свечи одним запросом"""
     with engine.connect() as conn:
-        tickers_df = pd.read_sql(
+        return pd.read_sql(
             """
-            SELECT c.ticker, c.figi, MAX(candles.datetime) as last_date 
+            SELECT c.ticker, c.figi, MAX(candles.datetime) as last_date,
+                MIN(candles.datetime) FILTER (WHERE NOT candles.is_complete) as first_incomplete
             FROM companies c 
             LEFT JOIN candles ON c.ticker = candles.ticker 
             GROUP BY c.ticker, c.figi
@@ -44,8 +54,33 @@ def update_stock_data():
             conn,
         )
 
+
+def update_window(last_date, first_incomplete):
+    """Начало догрузки и фильтр новых свечей: (start_time, is_new(dt)).
+
+    Незавершенная свеча (например, записанная стримом посреди дня) грузится
+    заново и перезаписывается завершенной: состояние индикаторов сдвигается
+    только по завершенным свечам и иначе остановилось бы на ней навсегда.
+    """
+    last_date = normalize_datetime(last_date)
+    if pd.isna(first_incomplete):
+        return last_date + timedelta(days=1), lambda dt: dt > last_date
+    start_time = normalize_datetime(first_incomplete)
+    return start_time, lambda dt: dt >= start_time
+
+
+def update_stock_data():
+    """Упрощенная функция обновления данных"""
+    engine = connection()
+    tickers_df = load_last_dates(engine)
+    with engine.begin() as conn:
+        ensure_current_partitions(conn)
+        ensure_tables(conn)
+
     logging.info(f"🔄 Обработка {len(tickers_df)} тикеров...")
 
+    # Квота MarketDataService вместо фиксированной паузы между тикерами
+    limiter = TokenBucket.per_minute(MARKET_DATA_REQUESTS_PER_MINUTE)
     total_added = 0
 
     for _, row in tickers_df.iterrows():
@@ -55,63 +90,110 @@ def update_stock_data():
 
         try:
             if pd.isna(last_date):
-                logging.info(f"⏩ Пропускаем {ticker}: нет исторических данных")
+                logging.info(f"⏩ Пропускаем {ticker}: нет истории, загрузит backfill_gaps")
                 continue
 
-            # Нормализуем дату (убираем часовой пояс если есть)
-            last_date = normalize_datetime(last_date)
-
-            # Получаем новые данные
-            start_time = last_date + timedelta(days=1)
+            # Получаем новые данные и заново незавершенные
+            start_time, is_new = update_window(last_date, row["first_incomplete"])
             end_time = datetime.utcnow()
 
             if start_time > end_time:
                 continue
 
-            with Client(TINKOFF_TOKEN) as client:
-                candles = client.get_all_candles(
-                    figi=figi,
-                    from_=start_time,
-                    to=end_time,
-                    interval=CandleInterval.CANDLE_INTERVAL_DAY,
+            with Client(TINKOFF_TOKEN, **client_options()) as client:
+                candles = get_candles(
+                    client,
+                    figi,
+                    start_time,
+                    end_time,
+                    CandleInterval.CANDLE_INTERVAL_DAY,
+                    limiter,
                 )
 
-                new_data = []
-                for candle in candles:
-                    candle_time = normalize_datetime(candle.time)
-
-                    if candle_time > last_date:
-                        new_data.append(
-                            {
-                                "ticker": ticker,
-                                "datetime": candle_time,
-                                "open": candle.open.units + candle.open.nano / 1e9,
-                                "high": candle.high.units + candle.high.nano / 1e9,
-                                "low": candle.low.units + candle.low.nano / 1e9,
-                                "close": candle.close.units + candle.close.nano / 1e9,
-                                "volume": candle.volume,
-                                "is_complete": candle.is_complete,
-                            }
-                        )
-
-                if new_data:
-                    df = pd.DataFrame(new_data)
-                    # Простое сохранение через pandas
-                    df.to_sql("candles", engine, if_exists="append", index=False)
-                    total_added += len(new_data)
-                    logging.info(f"✅ {ticker}: +{len(new_data)} свечей")
+                # Свечи потоком уходят в COPY, без DataFrame и словарей на строку
+                new_candles = (
+                    candle for candle in candles if is_new(normalize_datetime(candle.time))
+                )
+                with engine.begin() as conn:
+                    added = copy_candles(conn, ticker, new_candles)
+                    # Индикаторы досчитываются по новым свечам в той же транзакции
+                    refresh_ticker(conn, ticker)
+
+                if added:
+                    total_added += added
+                    logging.info(f"✅ {ticker}: +{added} свечей")
                 else:
                     logging.info(f"📭 {ticker}: нет новых данных")
 
-            time.sleep(0.5)
+        except Exception as e:
+            logging.error(f"❌ {ticker}: {e}")
 
+    logging.info(f"🎉 Добавлено {total_added} новых свечей")
+    return total_added
+
+
+def update_stock_data_async():
+    """Обновление данных: все тикеры грузятся конкурентно через один AsyncClient"""
+    engine = connection()
+    tickers_df = load_last_dates(engine)
+
+    logging.info(f"🔄 Обработка {len(tickers_df)} тикеров (async)...")
+
+    end_time = datetime.utcnow()
+    jobs = []
+    filters = {}
+    for row in tickers_df.itertuples(index=False):
+        if pd.isna(row.last_date):
+            logging.info(f"⏩ Пропускаем {row.ticker}: нет истории, загрузит backfill_gaps")
+            continue
+
+        start_time, is_new = update_window(row.last_date, row.first_incomplete)
+        if start_time > end_time:
+            continue
+
+        jobs.append((row.ticker, row.figi, start_time, end_time))
+        filters[row.ticker] = is_new
+
+    candles, failed = fetch_candles(jobs, TINKOFF_TOKEN)
+    for ticker, start, end, error in failed:
+        logging.error(f"❌ {ticker} {start:%Y-%m-%d}..{end:%Y-%m-%d}: {error}")
+
+    with engine.begin() as conn:
+        ensure_current_partitions(conn)
+        ensure_tables(conn)
+
+    total_added = 0
+    for ticker, items in candles.items():
+        is_new = filters[ticker]
+        new_candles = (candle for candle in items if is_new(normalize_datetime(candle.time)))
+        # Своя транзакция на тикер: ошибка одного не откатывает остальные
+        try:
+            with engine.begin() as conn:
+                added = copy_candles(conn, ticker, new_candles)
+                refresh_ticker(conn, ticker)
         except Exception as e:
             logging.error(f"❌ {ticker}: {e}")
+            continue
+        if added:
+            total_added += added
+            logging.info(f"✅ {ticker}: +{added} свечей")
+        else:
+            logging.info(f"📭 {ticker}: нет новых данных")
 
     logging.info(f"🎉 Добавлено {total_added} новых свечей")
     return total_added
 
 
+def collect():
+    """Одна итерация: новые свечи по всем тикерам и догрузка пропусков"""
+    if FETCH_MODE == "async":
+        update_stock_data_async()
+    else:
+        update_stock_data()
+    # Дыры в середине истории и тикеры без свечей
+    backfill_gaps(connection(), TINKOFF_TOKEN)
+
+
 def main():
     """Основной цикл"""
     logging.info("🚀 Сервис обновления данных запущен")
@@ -119,7 +201,7 @@ def main():
     while True:
         try:
             logging.info(f"\n=== {datetime.now().replace(microsecond=0)} ===")
-            update_stock_data()
+            collect()
             logging.info("💤 Ожидание 24 часа...")
             time.sleep(24 * 3600)
         except KeyboardInterrupt:
@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import pandas as pd
+from tinkoff.invest import (
+    AsyncClient,
+    CandleInstrument,
+    CandleInterval,
+    LastPriceInstrument,
+    SubscriptionInterval,
+)
+
+from utils.candles import copy_candle_lines, quotation_to_str, values_to_line
+from utils.indicators import ensure_tables, refresh_ticker
+from utils.intraday import (
+    EPOCH,
+    INTRADAY_TABLE,
+    candle_to_line,
+    copy_intraday_lines,
+    ensure_intraday_table,
+    ensure_price_scales,
+    load_instruments,
+)
+from utils.schema import ensure_current_partitions
+from utils.tinkoff_async import client_options, fetch_candles_async
+from utils.utils import connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+
+logger = logging.getLogger(__name__)
+
+TINKOFF_TOKEN = os.getenv("TINKOFF_TOKEN")
+# Микробатч пишется, когда накопилось FLUSH_SIZE событий или прошло FLUSH_SECONDS
+FLUSH_SIZE = int(os.getenv("TINKOFF_STREAM_FLUSH_SIZE", "5000"))
+FLUSH_SECONDS = float(os.getenv("TINKOFF_STREAM_FLUSH_SECONDS", "2"))
+# Пока база не успевает, очередь заполняется и чтение стримов приостанавливается
+QUEUE_SIZE = int(os.getenv("TINKOFF_STREAM_QUEUE_SIZE", "50000"))
+# Неудачный микробатч повторяется с нарастающей паузой, очередь в это время
+# не читается; данные отбрасываются только после WRITE_ATTEMPTS попыток
+WRITE_ATTEMPTS = int(os.getenv("TINKOFF_STREAM_WRITE_ATTEMPTS", "8"))
+WRITE_BACKOFF = 1.0
+MAX_WRITE_BACKOFF = 60.0
+SUBSCRIPTIONS_PER_STREAM = 300  # лимит подписок API на один стрим
+RECONNECT_BACKOFF = 1.0
+MAX_RECONNECT_BACKOFF = 60.0
+BACKFILL_MINUTES_LIMIT = timedelta(days=1)  # минутки глубже догружает tinkoff_intraday
+
+MINUTE = 1
+DAY = 24 * 60
+
+# Интервал подписки -> (интервал get_candles для добора, длительность в минутах)
+STREAM_INTERVALS = {
+    SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE: (
+        CandleInterval.CANDLE_INTERVAL_1_MIN,
+        MINUTE,
+    ),
+    SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_DAY: (CandleInterval.CANDLE_INTERVAL_DAY, DAY),
+}
+
+
+class StreamCandle(NamedTuple):
+    figi: str
+    minutes: int
+    time: datetime
+    open: object
+    high: object
+    low: object
+    close: object
+    volume: int
+    is_complete: bool
+
+
+class StreamPrice(NamedTuple):
+    figi: str
+    price: object
+    time: datetime
+
+
+LAST_PRICES_DDL = """
+    CREATE TABLE IF NOT EXISTS last_prices (
+        ticker VARCHAR(20) PRIMARY KEY REFERENCES companies(ticker),
+        price DECIMAL(15,6) NOT NULL,
+        time TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Instruments:
+    """Справочник FIGI -> тикер, id компании и масштаб цен минуток"""
+
+    def __init__(self, frame, scales):
+        self.tickers = dict(zip(frame["figi"], frame["ticker"]))
+        self.company_ids = dict(zip(frame["figi"], frame["company_id"]))
+        self.scales = {figi: scales[company_id] for figi, company_id in self.company_ids.items()}
+
+    @property
+    def figis(self):
+        return list(self.tickers)
+
+
+def prepare(engine) -> Instruments:
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        ensure_current_partitions(conn)
+        ensure_tables(conn)
+        ensure_intraday_table(conn, now - BACKFILL_MINUTES_LIMIT, now + timedelta(days=366))
+        conn.exec_driver_sql(LAST_PRICES_DDL)
+        frame = load_instruments(conn, MINUTE)
+        return Instruments(frame, ensure_price_scales(conn, frame))
+
+
+def _complete(candle: StreamCandle, now) -> bool:
+    """Стрим не отмечает завершенность: свеча закрыта, когда ее период истек"""
+    return candle.is_complete or candle.time + timedelta(minutes=candle.minutes) <= now
+
+
+def close_previous(latest, candle: StreamCandle):
+    """Предыдущая свеча того же FIGI и интервала, закрытая приходом более новой, или None.
+
+    Обновления свечи перестают приходить до конца ее периода, и по времени
+    (_complete) она бы так и осталась незавершенной. latest - последняя
+    свеча по (figi, интервал), обновляется здесь же.
+    """
+    key = candle.figi, candle.minutes
+    previous = latest.get(key)
+    if previous is not None and candle.time < previous.time:
+        return None  # запоздавшее обновление старой свечи, ее период уже истек
+    latest[key] = candle
+    if previous is not None and previous.time < candle.time:
+        return previous._replace(is_complete=True)
+    return None
+
+
+def write_batch(engine, instruments, candles, prices) -> int:
+    """Один микробатч одной транзакцией: дневные свечи с индикаторами,
+    минутки и последние цены"""
+    now = datetime.now(timezone.utc)
+    daily = [candle for candle in candles if candle.minutes == DAY]
+    minutes = [candle for candle in candles if candle.minutes != DAY]
+
+    with engine.begin() as conn:
+        if daily:
+            copy_candle_lines(
+                conn,
+                (
+                    values_to_line(
+                        instruments.tickers[c.figi],
+                        c.time,
+                        quotation_to_str(c.open),
+                        quotation_to_str(c.high),
+                        quotation_to_str(c.low),
+                        quotation_to_str(c.close),
+                        c.volume,
+                        _complete(c, now),
+                    )
+                    for c in daily
+                ),
+            )
+            for figi in {candle.figi for candle in daily}:
+                refresh_ticker(conn, instruments.tickers[figi])
+        if minutes:
+            copy_intraday_lines(
+                conn,
+                (
+                    candle_to_line(
+                        instruments.company_ids[c.figi],
+                        c.minutes,
+                        instruments.scales[c.figi],
+                        c._replace(is_complete=_complete(c, now)),
+                    )
+                    for c in minutes
+                ),
+            )
+        if prices:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.executemany(
+                    """
+                    INSERT INTO last_prices (ticker, price, time) VALUES (%s, %s, %s)
+                    ON CONFLICT (ticker) DO UPDATE SET
+                        price = EXCLUDED.price, time = EXCLUDED.time,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE last_prices.time <= EXCLUDED.time
+                    """,
+                    [
+                        (
+                            instruments.tickers[p.figi],
+                            quotation_to_str(p.price),
+                            p.time.replace(tzinfo=None),
+                        )
+                        for p in prices
+                    ],
+                )
+            finally:
+                cursor.close()
+    return len(candles) + len(prices)
+
+
+async def writer(engine, instruments, queue):
+    """Собирает события в микробатчи и пишет их в базу вне event loop.
+
+    Повторные обновления одной свечи или цены внутри батча схлопываются
+    до последнего, так что на каждый тик в базу ничего не пишется.
+    """
+    while True:
+        item = await queue.get()
+        candles, prices, events = {}, {}, 0
+        deadline = time.monotonic() + FLUSH_SECONDS
+        while item is not None:
+            if isinstance(item, StreamCandle):
+                candles[item.figi, item.minutes, item.time] = item
+            else:
+                prices[item.figi] = item
+            events += 1
+            if events >= FLUSH_SIZE:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                break
+
+        written = await write_with_retry(
+            engine, instruments, list(candles.values()), list(prices.values())
+        )
+        if written is not None:
+            logger.debug(f"Записано {written} из {events} событий, в очереди {queue.qsize()}")
+        if item is None:
+            return
+
+
+async def write_with_retry(engine, instruments, candles, prices, attempts=WRITE_ATTEMPTS):
+    """write_batch с повторами; None, если батч так и не записался и отброшен.
+
+    Пока идут повторы, writer не берет события из очереди: она заполняется,
+    и стримы приостанавливают чтение вместо потери данных.
+    """
+    backoff = WRITE_BACKOFF
+    for attempt in range(1, attempts + 1):
+        try:
+            return await asyncio.to_thread(write_batch, engine, instruments, candles, prices)
+        except Exception as e:
+            if attempt == attempts:
+                logger.error(
+                    f"❌ Микробатч отброшен после {attempts} попыток: {len(candles)} свечей, "
+                    f"{len(prices)} цен потеряны ({e})"
+                )
+                return None
+            logger.warning(
+                f"⚠️ Ошибка записи микробатча, попытка {attempt}/{attempts}, "
+                f"повтор через {backoff:.0f} с: {e}"
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_WRITE_BACKOFF)
+
+
+def _last_stored(engine, figis):
+    """Время последней дневной свечи и минутки по FIGI"""
+    with engine.connect() as conn:
+        frame = pd.read_sql(
+            f"""
+            SELECT c.figi,
+                (SELECT MAX(datetime) FROM candles WHERE ticker = c.ticker) AS last_day,
+                (SELECT MAX(minute) FROM {INTRADAY_TABLE} i
+                 WHERE i.company_id = c.id AND i.interval = %(minute)s) AS last_minute
+            FROM companies c WHERE c.figi = ANY(%(figis)s)
+            """,
+            conn,
+            params={"figis": list(figis), "minute": MINUTE},
+        )
+    return frame.set_index("figi")
+
+
+async def backfill(engine, figis, queue):
+    """Добор пропущенного, пока стрим был отключен.
+
+    Подписка уже активна, поэтому добор идет до текущего момента:
+    перекрытие со стримом безопасно, свечи пишутся как upsert.
+    """
+    now = datetime.utcnow()
+    last = await asyncio.to_thread(_last_stored, engine, figis)
+    for candle_interval, minutes in STREAM_INTERVALS.values():
+        jobs = []
+        for figi, row in last.iterrows():
+            if minutes == DAY:
+                start = None if pd.isna(row.last_day) else row.last_day.to_pydatetime()
+            else:
+                start = now - BACKFILL_MINUTES_LIMIT
+                if not pd.isna(row.last_minute):
+                    start = max(start, EPOCH + timedelta(minutes=int(row.last_minute)))
+            if start is not None and start < now:
+                jobs.append((figi, figi, start, now))
+        if not jobs:
+            continue
+
+        candles, failed = await fetch_candles_async(jobs, TINKOFF_TOKEN, interval=candle_interval)
+        for figi, start, end, error in failed:
+            logger.error(f"❌ Добор {figi} {start:%Y-%m-%d %H:%M}..{end:%Y-%m-%d %H:%M}: {error}")
+        count = 0
+        for figi, items in candles.items():
+            for c in items:
+                await queue.put(
+                    StreamCandle(
+                        figi, minutes, c.time, c.open, c.high, c.low, c.close, c.volume, c.is_complete
+                    )
+                )
+                count += 1
+        logger.info(f"Добор после подключения: {count} свечей {minutes} мин по {len(jobs)} FIGI")
+
+
+async def stream(engine, figis, queue):
+    """Один стрим на группу FIGI с переподключением и добором пропусков"""
+    backoff = RECONNECT_BACKOFF
+    latest = {}
+    while True:
+        try:
+            async with AsyncClient(TINKOFF_TOKEN, **client_options()) as client:
+                market_data = client.create_market_data_stream()
+                market_data.candles.subscribe(
+                    [
+                        CandleInstrument(figi=figi, interval=interval)
+                        for figi in figis
+                        for interval in STREAM_INTERVALS
+                    ]
+                )
+                market_data.last_price.subscribe(
+                    [LastPriceInstrument(figi=figi) for figi in figis]
+                )
+                filling = asyncio.create_task(backfill(engine, figis, queue))
+                try:
+                    async for response in market_data:
+                        backoff = RECONNECT_BACKOFF
+                        if response.candle:
+                            c = response.candle
+                            _, minutes = STREAM_INTERVALS[c.interval]
+                            candle = StreamCandle(
+                                c.figi, minutes, c.time,
+                                c.open, c.high, c.low, c.close, c.volume, False,
+                            )
+                            closed = close_previous(latest, candle)
+                            if closed is not None:
+                                await queue.put(closed)
+                            await queue.put(candle)
+                        elif response.last_price:
+                            p = response.last_price
+                            await queue.put(StreamPrice(p.figi, p.price, p.time))
+                finally:
+                    filling.cancel()
+                    market_data.stop()
+            logger.warning("Стрим закрыт сервером, переподключение")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"🔌 Обрыв стрима ({len(figis)} FIGI): {e}, повтор через {backoff:.0f} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF)
+
+
+async def run():
+    engine = connection()
+    instruments = await asyncio.to_thread(prepare, engine)
+    figis = instruments.figis
+    # Каждый FIGI занимает подписки на все интервалы свечей и на последнюю цену
+    per_stream = SUBSCRIPTIONS_PER_STREAM // (len(STREAM_INTERVALS) + 1)
+    groups = [figis[i : i + per_stream] for i in range(0, len(figis), per_stream)]
+    logger.info(f"🚀 Стриминг {len(figis)} FIGI в {len(groups)} стримах")
+
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    writing = asyncio.create_task(writer(engine, instruments, queue))
+    streams = [asyncio.create_task(stream(engine, group, queue)) for group in groups]
+    try:
+        await asyncio.gather(writing, *streams)
+    finally:
+        for task in streams:
+            task.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        if not writing.done():
+            await queue.put(None)  # дописать накопленное
+            await writing
+
+
+def main():
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.error("🛑 Остановлено")
+
+
+if __name__ == "__main__":
+    main()
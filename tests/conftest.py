@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from utils.utils import connection
+
+
+@pytest.fixture
+def db_conn():
+    """Соединение с базой из DB_* в транзакции, которая откатывается после теста"""
+    try:
+        conn = connection().connect()
+    except OperationalError as e:
+        pytest.skip(f"Postgres из DB_* недоступен: {e}")
+    transaction = conn.begin()
+    try:
+        yield conn
+    finally:
+        transaction.rollback()
+        conn.close()
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from utils.candles import copy_candle_lines, values_to_line
+
+TICKER = "TEST_CANDLES"
+START = datetime(2025, 1, 1, 7)
+
+
+@pytest.fixture
+def candles(db_conn):
+    """Временная candles на время транзакции: в pg_temp она закрывает основную"""
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                id SERIAL PRIMARY KEY,
+                ticker VARCHAR(20),
+                datetime TIMESTAMP,
+                open DECIMAL(15,6),
+                high DECIMAL(15,6),
+                low DECIMAL(15,6),
+                close DECIMAL(15,6),
+                volume BIGINT,
+                is_complete BOOLEAN,
+                UNIQUE (ticker, datetime)
+            ) ON COMMIT DROP
+        """)
+    )
+    return db_conn
+
+
+def lines(days):
+    return [
+        values_to_line(TICKER, START + timedelta(days=day), 1, 2, 0.5, 1.5, 100, True)
+        for day in days
+    ]
+
+
+def test_copy_candle_lines_counts_merged_rows(candles):
+    assert copy_candle_lines(candles, lines(range(3))) == 3
+    assert copy_candle_lines(candles, lines(range(5))) == 5
+
+
+def test_copy_candle_lines_inserted_only(candles):
+    """Перезапись уже сохраненных дней не считается вставкой"""
+    copy_candle_lines(candles, lines(range(3)))
+    assert copy_candle_lines(candles, lines(range(5)), inserted_only=True) == 2
+    assert copy_candle_lines(candles, lines(range(5)), inserted_only=True) == 0
+    assert candles.execute(text("SELECT COUNT(*) FROM candles")).scalar() == 5
+
+
+def test_copy_candle_lines_duplicate_in_batch(candles):
+    """Повтор свечи в одной пачке: завершенная важнее, среди равных побеждает последняя"""
+    dt = START
+    batch = [
+        values_to_line(TICKER, dt, 1, 2, 0.5, 1.1, 10, False),
+        values_to_line(TICKER, dt, 1, 2, 0.5, 1.2, 20, True),
+        values_to_line(TICKER, dt, 1, 2, 0.5, 1.3, 30, False),
+        values_to_line(TICKER, dt + timedelta(days=1), 1, 2, 0.5, 1.4, 40, False),
+        values_to_line(TICKER, dt + timedelta(days=1), 1, 2, 0.5, 1.5, 50, False),
+    ]
+    assert copy_candle_lines(candles, batch) == 2
+    rows = candles.execute(
+        text("SELECT close, volume, is_complete FROM candles ORDER BY datetime")
+    ).all()
+    assert [(float(close), volume, done) for close, volume, done in rows] == [
+        (1.2, 20, True),
+        (1.5, 50, False),
+    ]
+
+
+def test_copy_candle_lines_keeps_target_precision(db_conn):
+    """Staging повторяет типы candles и не обрезает nano-цены"""
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                ticker VARCHAR(20), datetime TIMESTAMP,
+                open DECIMAL(18,9), high DECIMAL(18,9), low DECIMAL(18,9), close DECIMAL(18,9),
+                volume BIGINT, is_complete BOOLEAN, UNIQUE (ticker, datetime)
+            ) ON COMMIT DROP
+        """)
+    )
+    line = values_to_line(TICKER, START, "0.000012345", 1, "0.000000001", "123.456789012", 1, True)
+    copy_candle_lines(db_conn, [line])
+    row = db_conn.execute(text("SELECT open, low, close FROM candles")).one()
+    assert list(row) == [Decimal("0.000012345"), Decimal("0.000000001"), Decimal("123.456789012")]
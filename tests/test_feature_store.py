@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from utils.feature_store import changed_tickers, read_features, rebuild_features, refresh_features
+from utils.indicators import rebuild_ticker
+
+TICKER = "TEST_FEATURE_STORE"
+START = datetime(2025, 1, 1, 7)
+DAYS = 60
+BACKFILLED_DAY = 30
+
+
+@pytest.fixture
+def candles(db_conn):
+    """Временная candles закрывает основную: признаки считаются только по тестовому тикеру"""
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                id SERIAL PRIMARY KEY,
+                ticker VARCHAR(20),
+                datetime TIMESTAMP,
+                open DECIMAL(18,9),
+                high DECIMAL(18,9),
+                low DECIMAL(18,9),
+                close DECIMAL(18,9),
+                volume BIGINT,
+                is_complete BOOLEAN,
+                UNIQUE (ticker, datetime)
+            ) ON COMMIT DROP
+        """)
+    )
+    return db_conn
+
+
+def insert_days(conn, days):
+    conn.execute(
+        text("""
+            INSERT INTO candles (ticker, datetime, open, high, low, close, volume, is_complete)
+            VALUES (:ticker, :datetime, :open, :high, :low, :close, 100, TRUE)
+        """),
+        [
+            {
+                "ticker": TICKER,
+                "datetime": START + timedelta(days=day),
+                "open": 100 + day % 7,
+                "high": 110 + day % 7,
+                "low": 90 + day % 5,
+                "close": 100 + (day * 37) % 11,
+            }
+            for day in days
+        ],
+    )
+
+
+def test_backfilled_candle_behind_state_is_filled(candles):
+    """Свеча, догруженная старше состояния индикаторов, попадает в признаки"""
+    insert_days(candles, [day for day in range(DAYS) if day != BACKFILLED_DAY])
+    assert refresh_features(candles) == DAYS - 1
+
+    insert_days(candles, [BACKFILLED_DAY])
+    assert TICKER in changed_tickers(candles)
+    assert refresh_features(candles) == DAYS
+    assert changed_tickers(candles) == []
+    features = read_features(candles, [TICKER])
+    assert len(features) == DAYS
+
+    # Совпадает с полным пересчетом по уже полной истории
+    rebuild_ticker(candles, TICKER)
+    rebuild_features(candles, [TICKER])
+    pd.testing.assert_frame_equal(features, read_features(candles, [TICKER]))
+
+    after_gap = features.set_index("datetime").loc[START + timedelta(days=BACKFILLED_DAY + 1)]
+    gap_close = 100 + (BACKFILLED_DAY * 37) % 11
+    assert after_gap["open_to_prev_close"] == pytest.approx((100 + (BACKFILLED_DAY + 1) % 7) / gap_close - 1)
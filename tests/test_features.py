@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from utils.features import FEATURE_COLUMNS, compute_features, grouped_shift
+
+CANDLE_COLUMNS = [
+    "id",
+    "ticker",
+    "datetime",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "is_complete",
+    "created_at",
+]
+
+
+def test_grouped_shift_empty():
+    assert len(grouped_shift(np.array([]), np.array([], dtype=bool))) == 0
+
+
+def test_compute_features_empty_frame():
+    """Неизвестный тикер или пустой период: пустой кадр, а не исключение"""
+    candles = pd.DataFrame(columns=CANDLE_COLUMNS).astype(
+        {column: "float64" for column in ("open", "high", "low", "close")}
+    )
+    features = compute_features(candles)
+    assert features.empty
+    assert set(FEATURE_COLUMNS) <= set(features.columns)
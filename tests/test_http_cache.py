@@ -0,0 +1,88 @@
+from datetime import date
+
+import pytest
+
+from utils import http_cache
+from utils.http_cache import ResponseCache, request_key, ttl_for
+
+ISS = "https://iss.moex.com/iss/history/engines/stock/markets/index/securities.json"
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(http_cache, "_today", lambda: date(2025, 3, 10))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Часы кэша, которые идут только вручную"""
+    now = [1_000_000.0]
+
+    class Clock:
+        def tick(self, seconds=1):
+            now[0] += seconds
+
+    monkeypatch.setattr(http_cache.time, "time", lambda: now[0])
+    return Clock()
+
+
+@pytest.mark.parametrize(
+    "url, ttl",
+    [
+        (f"{ISS}?date=2025-03-09", None),  # закрытый день не устаревает
+        (f"{ISS}?date=2025-03-10", 15 * 60),
+        (f"{ISS}?from=2025-01-01&till=2025-03-11", 15 * 60),
+        ("https://www.cbr.ru/hd_base/KeyRate/?y1=2020&y2=2024", None),
+        ("https://www.cbr.ru/hd_base/KeyRate/?y1=2020&y2=2025", 24 * 3600),
+        ("https://www.tbank.ru/api/posts?limit=30", 10 * 60),
+        ("https://example.com/data", http_cache.DEFAULT_TTL),
+    ],
+)
+def test_ttl_for(today, url, ttl):
+    assert ttl_for(url) == ttl
+
+
+def test_ttl_for_uses_moscow_date(today):
+    """22:30 UTC 9 марта - это уже 10 марта в Москве: период еще не закрыт"""
+    assert ttl_for("tinkoff://candles?to=2025-03-09T22:30:00Z") == 5 * 60
+    assert ttl_for("tinkoff://candles?to=2025-03-09T20:30:00Z") is None
+
+
+def test_expired_response_is_refetched_except_offline(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "http.sqlite"))
+    key = request_key("GET", ISS)
+    cache.put(key, ISS, 200, {"X": "1"}, b"body", ttl=60)
+    assert cache.get(key) == (200, {"X": "1"}, b"body")
+    clock.tick(61)
+    assert cache.get(key) is None
+    assert ResponseCache(str(tmp_path / "http.sqlite"), offline=True).get(key)[2] == b"body"
+
+
+def test_lru_evicts_least_recently_read(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(http_cache, "EVICT_CHECK_EVERY", 1)
+    body = bytes(range(256)) * 40  # плохо сжимается: размер записи предсказуем
+    cache = ResponseCache(str(tmp_path / "http.sqlite"), max_bytes=10**9)
+    for name in "abc":
+        cache.put(name, f"https://example.com/{name}", 200, {}, body)
+        clock.tick()
+    entry = cache.stats()[0][2] // 3
+    cache.get("a")  # a читали недавно, b - самая старая запись
+    clock.tick()
+
+    cache.max_bytes = entry * 3 + entry // 2  # четыре записи не помещаются, три - да
+    cache.put("d", "https://example.com/d", 200, {}, body)
+    assert cache.get("b") is None
+    assert all(cache.get(name) is not None for name in "acd")
+
+
+def test_size_not_recounted_on_every_put(tmp_path, monkeypatch):
+    """Пока оценка размера ниже лимита, SUM(size) считается раз в EVICT_CHECK_EVERY записей"""
+    monkeypatch.setattr(http_cache, "EVICT_CHECK_EVERY", 10)
+    cache = ResponseCache(str(tmp_path / "http.sqlite"))
+    evictions = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: evictions.append(1) or evict())
+    for i in range(25):
+        cache.put(str(i), f"https://example.com/{i}", 200, {}, b"x")
+    # Первая запись узнает размер из базы, дальше - каждая десятая
+    assert len(evictions) == 3
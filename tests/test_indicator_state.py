@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import stockstats
+
+from utils.indicators import INDICATOR_COLUMNS, IndicatorState
+
+START = datetime(2015, 1, 5, 7)
+
+
+def expected(closes):
+    """Индикаторы stockstats по всему ряду сразу"""
+    frame = stockstats.wrap(
+        pd.DataFrame(
+            {
+                "date": [START + timedelta(days=day) for day in range(len(closes))],
+                "open": closes,
+                "high": closes,
+                "low": closes,
+                "close": closes,
+                "volume": 1000,
+            }
+        )
+    )
+    return np.column_stack([frame[column].to_numpy() for column in INDICATOR_COLUMNS])
+
+
+def incremental(closes, restore_every=None):
+    """Индикаторы по одной свече; с restore_every состояние периодически
+    проходит через запись в indicator_state и обратно"""
+    state = IndicatorState()
+    rows = []
+    for day, close in enumerate(closes):
+        if restore_every and day % restore_every == 0:
+            state = IndicatorState.from_row(SimpleNamespace(**state.to_record("T")))
+        rows.append(state.update(START + timedelta(days=day), float(close)))
+    return np.array(rows)
+
+
+def walk(count, seed, step=None):
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, count)))
+    if step:
+        closes = np.round(closes / step) * step
+    return closes
+
+
+def with_flat(length, seed=0):
+    closes = walk(300, seed)
+    return np.concatenate([closes[:100], np.full(length, closes[99]), closes[100:]])
+
+
+SERIES = {
+    "walk": walk(1000, 1),
+    # Цены с шагом биржи и долгими стоянками, как у малоликвидных бумаг
+    "ticks": walk(1000, 2, step=0.5),
+    "integer_prices": walk(1000, 3, step=1.0),
+    "starts_flat": np.concatenate([np.full(40, 10.0), walk(200, 4)]),
+    **{f"flat_{length}": with_flat(length) for length in (1, 19, 20, 21, 25, 30, 60)},
+}
+
+
+@pytest.mark.parametrize("name", SERIES)
+def test_incremental_matches_stockstats(name):
+    closes = SERIES[name]
+    np.testing.assert_array_equal(incremental(closes), expected(closes))
+
+
+@pytest.mark.parametrize("name", ["ticks", "flat_25"])
+def test_restored_state_matches_stockstats(name):
+    """Состояние из базы продолжает расчет без расхождений"""
+    closes = SERIES[name]
+    np.testing.assert_array_equal(incremental(closes, restore_every=7), expected(closes))
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from utils.indicators import ensure_tables, load_state, refresh_ticker
+
+TICKER = "TEST_IND"
+
+
+@pytest.fixture
+def candles(db_conn):
+    """Временная candles на время транзакции: в pg_temp она закрывает основную"""
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                ticker VARCHAR(20),
+                datetime TIMESTAMP,
+                close DECIMAL(15,6),
+                is_complete BOOLEAN
+            ) ON COMMIT DROP
+        """)
+    )
+    ensure_tables(db_conn)
+    return db_conn
+
+
+def insert_candles(conn, rows):
+    conn.execute(
+        text("""
+            INSERT INTO candles (ticker, datetime, close, is_complete)
+            VALUES (:ticker, :datetime, :close, :is_complete)
+        """),
+        [
+            {"ticker": TICKER, "datetime": dt, "close": close, "is_complete": complete}
+            for dt, close, complete in rows
+        ],
+    )
+
+
+def test_state_advances_after_candle_completed(candles):
+    start = datetime(2025, 1, 1, 7)
+    days = [start + timedelta(days=number) for number in range(30)]
+    insert_candles(candles, [(dt, 100 + number, True) for number, dt in enumerate(days)])
+    today = days[-1] + timedelta(days=1)
+    insert_candles(candles, [(today, 150, False)])
+
+    refresh_ticker(candles, TICKER)
+    # Незавершенная свеча не сдвигает состояние
+    assert load_state(candles, TICKER).last_datetime == days[-1]
+
+    # Дневная догрузка перезаписывает свечу завершенной
+    candles.execute(
+        text("UPDATE candles SET close = 151, is_complete = true WHERE datetime = :dt"),
+        {"dt": today},
+    )
+    assert refresh_ticker(candles, TICKER) == 1
+    assert load_state(candles, TICKER).last_datetime == today
+    # Дальше пересчитывать нечего
+    assert refresh_ticker(candles, TICKER) == 0
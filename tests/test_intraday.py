@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import intraday
+from utils.intraday import DEFAULT_PRICE_SCALE, MAX_PRICE_SCALE, price_scale
+
+
+@pytest.mark.parametrize(
+    "increment, scale",
+    [
+        (0.01, 2),
+        (Decimal("0.0005"), 4),
+        (0.5, 1),
+        (1.0, 0),
+        (10, 0),
+        (1e-12, MAX_PRICE_SCALE),
+    ],
+)
+def test_price_scale(increment, scale):
+    assert price_scale(increment) == scale
+
+
+@pytest.mark.parametrize("increment", [None, float("nan"), np.nan, pd.NA])
+def test_price_scale_unknown_increment(increment):
+    """NULL min_price_increment (None или NaN из DataFrame) дает масштаб по умолчанию"""
+    assert price_scale(increment) == DEFAULT_PRICE_SCALE
+
+
+def test_ensure_price_scales_with_null_increment(monkeypatch):
+    saved = {}
+    monkeypatch.setattr(intraday, "save_price_scales", lambda conn, scales: saved.update(scales))
+    instruments = pd.DataFrame(
+        {
+            "company_id": [1, 2, 3],
+            "price_scale": [-1, -1, 4],
+            "min_price_increment": [0.01, None, None],
+        }
+    )
+    assert instruments["min_price_increment"].isna().sum() == 2
+    scales = intraday.ensure_price_scales(None, instruments)
+    assert scales == {1: 2, 2: DEFAULT_PRICE_SCALE, 3: 4}
+    assert saved == {1: 2, 2: DEFAULT_PRICE_SCALE}
@@ -0,0 +1,57 @@
+import importlib.util
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+
+spec = importlib.util.spec_from_file_location(
+    "moex_iss_dividends", "scripts/moex_iss_dividends/moex_iss_dividends.py"
+)
+moex_iss_dividends = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(moex_iss_dividends)
+
+
+def iss_response(rows):
+    columns = ["secid", "isin", "registryclosedate", "value", "currencyid"]
+    return {"dividends": {"metadata": dict.fromkeys(columns, {}), "data": rows}}
+
+
+def test_payments_on_same_close_date_are_summed(monkeypatch):
+    """Обычный и специальный дивиденд с одной датой реестра не теряются"""
+    rows = [
+        ["SBER", "RU0009029540", "2024-07-11", 33.3, "RUB"],
+        ["SBER", "RU0009029540", "2024-07-11", 5.0, "RUB"],
+        ["SBER", "RU0009029540", "2023-05-11", 25.0, "RUB"],
+        ["SBER", "RU0009029540", None, 1.0, "RUB"],
+    ]
+    monkeypatch.setattr(moex_iss_dividends, "iss_get", lambda path: iss_response(rows))
+    df = moex_iss_dividends.fetch_index_data("sber")
+    assert df[["ticker", "date", "dividedends_rub_per_share"]].values.tolist() == [
+        ["SBER", date(2024, 7, 11), 38.3],
+        ["SBER", date(2023, 5, 11), 25.0],
+    ]
+
+
+def test_rows_to_sync_compares_dates():
+    df = pd.DataFrame(
+        {"date": [date(2020, 1, 1), date(2023, 9, 1), date(2024, 7, 11)], "ticker": "SBER"}
+    )
+    assert len(moex_iss_dividends._rows_to_sync(df, None)) == 3
+    synced = moex_iss_dividends._rows_to_sync(df, date(2024, 7, 11))
+    assert synced["date"].tolist() == [date(2023, 9, 1), date(2024, 7, 11)]
+
+
+def test_ensure_date_type_migrates_text_dates(db_conn):
+    db_conn.execute(
+        text(
+            "CREATE TEMP TABLE moex_iss_dividends (ticker TEXT, date TEXT, "
+            "dividedends_rub_per_share DOUBLE PRECISION, updated_date DATE) ON COMMIT DROP"
+        )
+    )
+    db_conn.execute(
+        text("INSERT INTO moex_iss_dividends VALUES ('SBER', '2024-07-11', 33.3, NULL), ('SBER', '', 1, NULL)")
+    )
+    assert moex_iss_dividends.ensure_date_type(db_conn) is True
+    assert moex_iss_dividends.ensure_date_type(db_conn) is False
+    dates = db_conn.execute(text("SELECT date FROM moex_iss_dividends ORDER BY date")).scalars().all()
+    assert dates == [date(2024, 7, 11), None]
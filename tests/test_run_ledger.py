@@ -0,0 +1,159 @@
+import importlib.util
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from utils import run_ledger
+from utils.run_ledger import MAX_ATTEMPTS
+
+pytest.importorskip("tinkoff.invest")
+
+spec = importlib.util.spec_from_file_location("tinkoff_script", "scripts/tinkoff/script.py")
+script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(script)
+
+YEARS, CHUNK_YEARS = 6, 3  # две единицы на тикер
+STOCKS = [{"ticker": ticker, "figi": f"FIGI_{ticker}"} for ticker in ("AAA", "BAD", "BBB")]
+
+
+class Killed(BaseException):
+    """Процесс убит посреди сборки: единица не сохранена и не отмечена"""
+
+
+class SavepointConnection:
+    """psycopg2-соединение теста: commit/rollback сборщика работают на
+    точках сохранения, а вся транзакция теста потом откатывается"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.raw.cursor().execute("SAVEPOINT unit")
+
+    def commit(self):
+        self.raw.cursor().execute("RELEASE SAVEPOINT unit; SAVEPOINT unit")
+
+    def rollback(self):
+        self.raw.cursor().execute("ROLLBACK TO SAVEPOINT unit")
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+@pytest.fixture
+def conn(db_conn):
+    """Временные журнал и candles закрывают основные таблицы"""
+    db_conn.execute(
+        text(run_ledger.LEDGER_DDL.replace("CREATE TABLE IF NOT EXISTS", "CREATE TEMP TABLE"))
+    )
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                ticker VARCHAR(20), datetime TIMESTAMP,
+                open DECIMAL(15,6), high DECIMAL(15,6), low DECIMAL(15,6), close DECIMAL(15,6),
+                volume BIGINT, is_complete BOOLEAN, UNIQUE (ticker, datetime)
+            )
+        """)
+    )
+    return SavepointConnection(db_conn.connection)
+
+
+def make_manager(conn):
+    db_manager = script.DatabaseManager.__new__(script.DatabaseManager)
+    db_manager.conn = conn
+    manager = script.CompleteDataDBManager.__new__(script.CompleteDataDBManager)
+    manager.db_manager = db_manager
+    manager.conn = conn
+    manager.run_id = None
+    return manager
+
+
+def run_collection(conn, monkeypatch, kill_after=None):
+    """Один запуск сборки; возвращает (запрошенные единицы, завершена ли сборка)"""
+    fetched = []
+
+    def get_candles_period(figi, start_time, end_time):
+        if kill_after is not None and len(fetched) == kill_after:
+            raise Killed()
+        ticker = figi.removeprefix("FIGI_")
+        fetched.append((ticker, start_time))
+        if ticker == "BAD":
+            raise RuntimeError("RESOURCE_EXHAUSTED")
+        return pd.DataFrame(
+            {
+                "datetime": [start_time + timedelta(days=1)],
+                "open": [1.0], "high": [2.0], "low": [0.5], "close": [1.5],
+                "volume": [100], "is_complete": [True],
+            }
+        )
+
+    collector = script.CompleteDataCollector("TOKEN")
+    monkeypatch.setattr(collector, "_get_candles_period", get_candles_period)
+    monkeypatch.setattr(script.time, "sleep", lambda seconds: None)
+    manager = make_manager(conn)
+    _, units = manager.start_run(STOCKS, collector._chunk_periods, YEARS, CHUNK_YEARS)
+    figis = {stock["ticker"]: stock["figi"] for stock in STOCKS}
+    try:
+        collector.collect_units(units, figis, manager.save_unit, manager.fail_unit)
+    except Killed:
+        return fetched, None
+    return fetched, manager.finish_run()
+
+
+def units(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT ticker, status, attempts FROM collection_units ORDER BY ticker, period_start DESC"
+    )
+    return cursor.fetchall()
+
+
+def test_resume_after_kill_skips_finished_units(conn, monkeypatch):
+    fetched, finished = run_collection(conn, monkeypatch, kill_after=3)
+    assert finished is None
+    assert [ticker for ticker, _ in fetched] == ["AAA", "AAA", "BAD"]
+
+    # Продолжение того же прогона: готовые единицы не запрашиваются повторно
+    fetched, finished = run_collection(conn, monkeypatch)
+    assert [ticker for ticker, _ in fetched] == ["BAD", "BAD", "BBB", "BBB"]
+    assert finished is False
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), MIN(status) FROM collection_runs")
+    assert cursor.fetchone() == (1, "running")
+    cursor.execute("SELECT ticker, COUNT(*) FROM candles GROUP BY ticker ORDER BY ticker")
+    assert cursor.fetchall() == [("AAA", 2), ("BBB", 2)]
+
+
+def test_failed_units_stop_at_max_attempts(conn, monkeypatch):
+    results = [run_collection(conn, monkeypatch)[1] for _ in range(MAX_ATTEMPTS)]
+    # Пока у BAD остаются попытки, сборка не закрывается
+    assert results == [False] * (MAX_ATTEMPTS - 1) + [True]
+    assert units(conn) == [
+        ("AAA", "done", 1),
+        ("AAA", "done", 1),
+        ("BAD", "failed", MAX_ATTEMPTS),
+        ("BAD", "failed", MAX_ATTEMPTS),
+        ("BBB", "done", 1),
+        ("BBB", "done", 1),
+    ]
+    cursor = conn.cursor()
+    cursor.execute("SELECT status, finished_at IS NOT NULL FROM collection_runs")
+    assert cursor.fetchall() == [("failed", True)]
+
+    # Закрытая сборка не продолжается: следующий запуск открывает новую
+    fetched, _ = run_collection(conn, monkeypatch)
+    assert len(fetched) == len(STOCKS) * 2
+    cursor.execute("SELECT COUNT(*) FROM collection_runs")
+    assert cursor.fetchone() == (2,)
+
+
+def test_finish_run_done_without_failures(conn):
+    run_id, _, resumed = run_ledger.open_run(conn, "job", {"years": 1})
+    assert not resumed
+    run_ledger.add_units(conn, run_id, [("AAA", pd.Timestamp(2025, 1, 1), pd.Timestamp(2025, 6, 1))])
+    manager = make_manager(conn)
+    manager.run_id = run_id
+    assert manager.finish_run() is False
+    run_ledger.complete_unit(conn, run_id, "AAA", pd.Timestamp(2025, 1, 1), 10)
+    assert manager.finish_run() is True
+    assert run_ledger.open_run(conn, "job", {"years": 1})[2] is False
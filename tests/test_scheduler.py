@@ -0,0 +1,79 @@
+import asyncio
+from datetime import timedelta
+
+from utils import scheduler
+from utils.scheduler import IntervalTrigger, Job, Scheduler
+
+
+class Ledger:
+    """Журнал запусков в памяти вместо scheduler_runs"""
+
+    def __init__(self):
+        self.statuses = []
+
+    def record(self, job, fire_time, started, status, error=None):
+        self.statuses.append(status)
+
+
+def make_scheduler(job, monkeypatch):
+    ledger = Ledger()
+    sched = Scheduler([job], engine=None)
+    monkeypatch.setattr(sched, "_record", ledger.record)
+    return sched, ledger
+
+
+def failing():
+    raise RuntimeError("ISS недоступен")
+
+
+def test_failed_job_retries_with_backoff(monkeypatch):
+    """Упавшая задача повторяется через минуты, а не через 30 дней"""
+    job = Job("dividends", failing, IntervalTrigger(days=30), retries=2, retry_delay=timedelta(minutes=5))
+    sched, ledger = make_scheduler(job, monkeypatch)
+    delays = []
+    for _ in range(3):
+        now = scheduler._now()
+        job.next_fire = job.trigger.next_after(now)
+        asyncio.run(sched._run(job, now))
+        delays.append(job.next_fire - now)
+    sched.shutdown()
+
+    assert ledger.statuses == ["failed"] * 3
+    assert timedelta(minutes=5) <= delays[0] < timedelta(minutes=6)
+    assert timedelta(minutes=10) <= delays[1] < timedelta(minutes=11)
+    # Попытки исчерпаны: задача ждет своего срабатывания по сетке
+    assert delays[2] > timedelta(days=1)
+    assert job.failures == 3
+
+
+def test_success_resets_failures(monkeypatch):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("таймаут")
+
+    job = Job("cbrf", flaky, IntervalTrigger(days=14))
+    sched, ledger = make_scheduler(job, monkeypatch)
+    now = scheduler._now()
+    job.next_fire = job.trigger.next_after(now)
+    asyncio.run(sched._run(job, now))
+    assert job.failures == 1
+    asyncio.run(sched._run(job, job.next_fire))
+    sched.shutdown()
+    assert ledger.statuses == ["failed", "ok"]
+    assert job.failures == 0
+
+
+def test_jobs_resolved_at_startup(tmp_path):
+    """Строковые функции импортируются до цикла, сломанный импорт не мешает остальным"""
+    module = tmp_path / "service.py"
+    module.write_text("def run_once():\n    return 'ok'\n")
+    good = Job("service", f"{module}:run_once", IntervalTrigger(hours=1))
+    broken = Job("broken", "no_such_module_for_scheduler:run", IntervalTrigger(hours=1))
+    sched = Scheduler([good, broken], engine=None)
+    asyncio.run(sched._resolve_jobs())
+    sched.shutdown()
+    assert callable(good.func) and good.func() == "ok"
+    assert broken.func == "no_such_module_for_scheduler:run"
@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from utils.schema import migrate_tpulse_reactions, parse_reactions
+from utils.utils import connection
+
+LEGACY = {
+    "p1": "[{'type': 'like', 'count': 5}]",
+    "p2": "[{'type': \"it's\", 'count': 1, 'own': True, 'extra': None}]",
+    "p3": '[{"type": "rocket", "count": 2}]',
+    "p4": "[{'type': 'like'",
+    "p5": "",
+    "p6": None,
+}
+
+
+def test_parse_reactions():
+    assert parse_reactions(LEGACY["p1"]) == [{"type": "like", "count": 5}]
+    assert parse_reactions(LEGACY["p2"]) == [
+        {"type": "it's", "count": 1, "own": True, "extra": None}
+    ]
+    assert parse_reactions(LEGACY["p3"]) == [{"type": "rocket", "count": 2}]
+    assert parse_reactions(LEGACY["p4"]) is None
+    assert parse_reactions(LEGACY["p5"]) is None
+
+
+@pytest.fixture
+def legacy_table():
+    engine = connection()
+    name = f"test_tpulse_{uuid.uuid4().hex[:8]}"
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text(f"""
+                    CREATE TABLE {name} (
+                        id TEXT, ticker TEXT, reactions_counters TEXT,
+                        PRIMARY KEY (id, ticker)
+                    )
+                """)
+            )
+            conn.execute(
+                text(f"INSERT INTO {name} VALUES (:id, 'SBER', :value)"),
+                [{"id": post_id, "value": value} for post_id, value in LEGACY.items()],
+            )
+    except OperationalError as e:
+        pytest.skip(f"Postgres из DB_* недоступен: {e}")
+    yield engine, name
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+def test_migrate_tpulse_reactions(legacy_table):
+    """Python-repr с True/None и апострофами переносится, битые строки - NULL"""
+    engine, name = legacy_table
+    assert migrate_tpulse_reactions(engine, name, chunk=2) == (3, 2)
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text(f"SELECT id, reactions_counters FROM {name}")).all())
+    assert rows == {
+        "p1": [{"type": "like", "count": 5}],
+        "p2": [{"type": "it's", "count": 1, "own": True, "extra": None}],
+        "p3": [{"type": "rocket", "count": 2}],
+        "p4": None,
+        "p5": None,
+        "p6": None,
+    }
+    assert migrate_tpulse_reactions(engine, name) is None
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+from sqlalchemy import text
+
+from utils.snapshot import export_snapshot, load_manifest, read_candles, snapshot_dataset
+
+START = datetime(2023, 1, 2, 7)
+
+
+@pytest.fixture
+def candles(db_conn):
+    """Временная candles закрывает основную на время транзакции теста"""
+    db_conn.execute(
+        text("""
+            CREATE TEMP TABLE candles (
+                ticker VARCHAR(20),
+                datetime TIMESTAMP,
+                open DECIMAL(15,6),
+                close DECIMAL(15,6),
+                volume BIGINT,
+                is_complete BOOLEAN
+            ) ON COMMIT DROP
+        """)
+    )
+    insert(db_conn, ["AAA", "BBB"], START, 28)  # раз в месяц 2023-2025
+    return db_conn
+
+
+def insert(conn, tickers, start, count, step=timedelta(days=30)):
+    conn.execute(
+        text("INSERT INTO candles VALUES (:ticker, :datetime, :price, :price + 1, 100, TRUE)"),
+        [
+            {"ticker": ticker, "datetime": start + i * step, "price": float(i)}
+            for ticker in tickers
+            for i in range(count)
+        ],
+    )
+
+
+def source(conn, where="TRUE"):
+    df = pd.read_sql(
+        text(f"""
+            SELECT ticker, datetime, open::float8 AS open, close::float8 AS close,
+                volume, is_complete
+            FROM candles WHERE {where} ORDER BY ticker, datetime
+        """),
+        conn,
+    )
+    df["datetime"] = df["datetime"].astype("datetime64[ns]")
+    return df
+
+
+def snapshot(**kwargs):
+    df = read_candles(**kwargs).drop(columns="year")
+    df["ticker"] = df["ticker"].astype(str)
+    df["datetime"] = df["datetime"].astype("datetime64[ns]")  # Parquet хранит миллисекунды
+    return df[["ticker", "datetime", "open", "close", "volume", "is_complete"]]
+
+
+def partition_files(base_dir, year):
+    files = {}
+    for ticker in os.listdir(base_dir / "candles"):
+        directory = base_dir / "candles" / ticker / f"year={year}"
+        for name in os.listdir(directory) if directory.exists() else []:
+            path = directory / name
+            files[str(path)] = path.stat().st_mtime_ns
+    return files
+
+
+def test_incremental_export_round_trip(candles, tmp_path):
+    assert export_snapshot(candles, ["candles"], tmp_path, full=True) == {"candles": 56}
+    manifest = load_manifest(tmp_path)["candles"]
+    assert manifest["since"] is None
+    last = START + 27 * timedelta(days=30)
+    assert manifest["watermark"] == last.isoformat()
+    pd.testing.assert_frame_equal(snapshot(base_dir=tmp_path), source(candles))
+
+    # Правка свечи текущего года, новые свечи и новый тикер после выгрузки
+    untouched = partition_files(tmp_path, 2023)
+    candles.execute(
+        text("UPDATE candles SET close = -1 WHERE ticker = 'AAA' AND datetime = :dt"),
+        {"dt": last},
+    )
+    insert(candles, ["AAA"], last + timedelta(days=1), 3, timedelta(days=1))
+    insert(candles, ["CCC"], datetime(2025, 2, 3, 7), 2)
+
+    year = last.year
+    assert export_snapshot(candles, ["candles"], tmp_path) == {
+        "candles": len(source(candles, f"EXTRACT(YEAR FROM datetime) >= {year}"))
+    }
+    manifest = load_manifest(tmp_path)["candles"]
+    assert manifest["since"] == datetime(year, 1, 1).isoformat()
+    assert manifest["watermark"] == (last + timedelta(days=3)).isoformat()
+
+    # Партиции года водяного знака перезаписаны целиком, без дублей старых строк;
+    # более ранние годы не трогались
+    assert partition_files(tmp_path, 2023) == untouched
+    pd.testing.assert_frame_equal(snapshot(base_dir=tmp_path), source(candles))
+
+
+def test_read_candles_pushes_filters_down(candles, tmp_path):
+    export_snapshot(candles, ["candles"], tmp_path, full=True)
+    left, right = datetime(2024, 3, 1), datetime(2025, 1, 15)
+    expected = source(
+        candles, "ticker = 'BBB' AND datetime BETWEEN '2024-03-01' AND '2025-01-15'"
+    )
+    actual = snapshot(tickers=["BBB"], left_date=left, right_date=right, base_dir=tmp_path)
+    pd.testing.assert_frame_equal(actual, expected)
+
+    # Условия на ticker и year отсекают каталоги партиций до чтения файлов
+    expression = (
+        ds.field("ticker").isin(["BBB"]) & (ds.field("year") >= 2024) & (ds.field("year") <= 2025)
+    )
+    paths = [
+        os.path.relpath(fragment.path, tmp_path)
+        for fragment in snapshot_dataset("candles", tmp_path).get_fragments(filter=expression)
+    ]
+    assert sorted(os.path.dirname(path) for path in paths) == [
+        os.path.join("candles", "ticker=BBB", "year=2024"),
+        os.path.join("candles", "ticker=BBB", "year=2025"),
+    ]
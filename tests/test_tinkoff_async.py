@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("tinkoff.invest")
+
+from tinkoff.invest import CandleInterval
+
+from utils import tinkoff_async
+from utils.http_cache import CacheMiss, ResponseCache
+
+DAY = CandleInterval.CANDLE_INTERVAL_DAY
+
+
+class FakeMarketData:
+    def __init__(self):
+        self.requests = []
+
+    def get_candles(self, figi, from_, to, interval):
+        self.requests.append((from_, to))
+        days = range((to - from_).days)
+        return SimpleNamespace(
+            candles=[SimpleNamespace(time=from_ + timedelta(days=day, hours=7)) for day in days]
+        )
+
+
+class FakeClient:
+    def __init__(self):
+        self.market_data = FakeMarketData()
+
+
+def test_align_period_to_days():
+    now = datetime(2025, 3, 5, 12, 34, 56, 789, tzinfo=timezone.utc)
+    start, end = tinkoff_async.align_period(now - timedelta(days=10), now)
+    assert start == datetime(2025, 2, 23, tzinfo=timezone.utc)
+    assert end == datetime(2025, 3, 6, tzinfo=timezone.utc)
+    assert tinkoff_async.align_period(start, end) == (start, end)
+
+
+def test_get_candles_replays_from_cache(tmp_path, monkeypatch):
+    """Ключи окон не зависят от момента запуска: второй запуск offline без промахов"""
+    cache = ResponseCache(str(tmp_path / "http.sqlite"))
+    monkeypatch.setattr(tinkoff_async, "get_cache", lambda: cache)
+    first = datetime(2025, 3, 5, 12, 0, 1, 123)
+    client = FakeClient()
+    candles = tinkoff_async.get_candles(client, "FIGI", first - timedelta(days=400), first, DAY)
+    assert len(client.market_data.requests) == 2  # окно GetCandles для дней - год
+    assert [c.time for c in candles] == sorted({c.time for c in candles})
+
+    cache.offline = True
+    replay = FakeClient()
+    later = first + timedelta(minutes=5, microseconds=77)
+    replayed = tinkoff_async.get_candles(replay, "FIGI", later - timedelta(days=400), later, DAY)
+    assert len(replayed) == len(candles)
+    assert replay.market_data.requests == []
+    with pytest.raises(CacheMiss):
+        tinkoff_async.get_candles(replay, "OTHER", later - timedelta(days=10), later, DAY)
+
+
+def test_get_candles_takes_token_per_request(monkeypatch):
+    monkeypatch.setattr(tinkoff_async, "get_cache", lambda: None)
+    limiter = SimpleNamespace(taken=0)
+    limiter.acquire = lambda: setattr(limiter, "taken", limiter.taken + 1)
+    now = datetime(2025, 3, 5, 12)
+    client = FakeClient()
+    tinkoff_async.get_candles(client, "FIGI", now - timedelta(days=400), now, DAY, limiter)
+    assert limiter.taken == len(client.market_data.requests) == 2
@@ -0,0 +1,81 @@
+import importlib.util
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("tinkoff.invest")
+
+spec = importlib.util.spec_from_file_location("tinkoff_stock", "scripts/tinkoff/tinkoff_stock.py")
+tinkoff_stock = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tinkoff_stock)
+
+
+def test_update_window_after_last_complete_candle():
+    last = datetime(2025, 1, 10, 7)
+    start, is_new = tinkoff_stock.update_window(pd.Timestamp(last), pd.NaT)
+    assert start == last + timedelta(days=1)
+    assert not is_new(last)
+
+
+def test_update_window_refetches_incomplete_candle():
+    """Незавершенная свеча грузится заново и проходит фильтр новых"""
+    incomplete = datetime(2025, 1, 8, 7)
+    start, is_new = tinkoff_stock.update_window(
+        pd.Timestamp(2025, 1, 10, 7), pd.Timestamp(incomplete)
+    )
+    assert start == incomplete
+    assert is_new(incomplete)
+    assert not is_new(incomplete - timedelta(days=1))
+
+
+class FakeEngine:
+    def __init__(self):
+        self.committed = []
+
+    @contextmanager
+    def begin(self):
+        work = []
+        yield work
+        self.committed.extend(work)
+
+
+def test_async_update_isolates_ticker_errors(monkeypatch):
+    """Ошибка записи одного тикера не откатывает остальные"""
+    engine = FakeEngine()
+    last = pd.Timestamp(2025, 1, 10, 7)
+    monkeypatch.setattr(tinkoff_stock, "connection", lambda: engine)
+    monkeypatch.setattr(
+        tinkoff_stock,
+        "load_last_dates",
+        lambda engine: pd.DataFrame(
+            {
+                "ticker": ["AAA", "BAD", "CCC"],
+                "figi": ["F1", "F2", "F3"],
+                "last_date": [last] * 3,
+                "first_incomplete": [pd.NaT] * 3,
+            }
+        ),
+    )
+    candle = SimpleNamespace(time=datetime(2025, 1, 11, 7))
+    monkeypatch.setattr(
+        tinkoff_stock,
+        "fetch_candles",
+        lambda jobs, token: ({ticker: [candle] for ticker, *_ in jobs}, []),
+    )
+    monkeypatch.setattr(tinkoff_stock, "ensure_current_partitions", lambda conn: None)
+    monkeypatch.setattr(tinkoff_stock, "ensure_tables", lambda conn: None)
+
+    def copy_candles(conn, ticker, candles):
+        if ticker == "BAD":
+            raise ValueError("bad candle")
+        conn.append(ticker)
+        return len(list(candles))
+
+    monkeypatch.setattr(tinkoff_stock, "copy_candles", copy_candles)
+    monkeypatch.setattr(tinkoff_stock, "refresh_ticker", lambda conn, ticker: 1)
+
+    assert tinkoff_stock.update_stock_data_async() == 2
+    assert engine.committed == ["AAA", "CCC"]
@@ -0,0 +1,70 @@
+import asyncio
+import importlib.util
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("tinkoff.invest")
+
+spec = importlib.util.spec_from_file_location("tinkoff_stream", "scripts/tinkoff/tinkoff_stream.py")
+tinkoff_stream = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tinkoff_stream)
+
+START = datetime(2025, 1, 10, 7, tzinfo=timezone.utc)
+
+
+def candle(minute, figi="FIGI", minutes=1):
+    return tinkoff_stream.StreamCandle(
+        figi, minutes, START + timedelta(minutes=minute), 1, 1, 1, 1, 10, False
+    )
+
+
+def test_close_previous_on_newer_candle():
+    """Приход следующей минуты закрывает предыдущую с ее последними значениями"""
+    latest = {}
+    assert tinkoff_stream.close_previous(latest, candle(0)) is None
+    last_update = candle(0)._replace(volume=25)
+    assert tinkoff_stream.close_previous(latest, last_update) is None
+    closed = tinkoff_stream.close_previous(latest, candle(1))
+    assert closed == last_update._replace(is_complete=True)
+
+
+def test_close_previous_keeps_figis_and_intervals_apart():
+    latest = {}
+    tinkoff_stream.close_previous(latest, candle(0))
+    assert tinkoff_stream.close_previous(latest, candle(1, figi="OTHER")) is None
+    assert tinkoff_stream.close_previous(latest, candle(1, minutes=1440)) is None
+
+
+def test_close_previous_ignores_late_update():
+    latest = {}
+    tinkoff_stream.close_previous(latest, candle(1))
+    assert tinkoff_stream.close_previous(latest, candle(0)) is None
+    assert tinkoff_stream.close_previous(latest, candle(2)) == candle(1)._replace(is_complete=True)
+
+
+def test_write_with_retry_keeps_failed_batch(monkeypatch):
+    """Батч повторяется целиком, пока база не вернется"""
+    calls = []
+
+    def write_batch(engine, instruments, candles, prices):
+        calls.append((candles, prices))
+        if len(calls) < 3:
+            raise OSError("database is down")
+        return len(candles) + len(prices)
+
+    monkeypatch.setattr(tinkoff_stream, "write_batch", write_batch)
+    monkeypatch.setattr(tinkoff_stream, "WRITE_BACKOFF", 0)
+    written = asyncio.run(tinkoff_stream.write_with_retry(None, None, [candle(0)], ["price"]))
+    assert written == 2
+    assert calls == [([candle(0)], ["price"])] * 3
+
+
+def test_write_with_retry_drops_after_attempts(monkeypatch, caplog):
+    def write_batch(*args):
+        raise OSError("database is down")
+
+    monkeypatch.setattr(tinkoff_stream, "write_batch", write_batch)
+    monkeypatch.setattr(tinkoff_stream, "WRITE_BACKOFF", 0)
+    assert asyncio.run(tinkoff_stream.write_with_retry(None, None, [candle(0)], [], 2)) is None
+    assert "отброшен" in caplog.text
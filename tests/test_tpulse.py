@@ -0,0 +1,26 @@
+import importlib.util
+import threading
+import time
+
+import pytest
+
+spec = importlib.util.spec_from_file_location(
+    "parse_tpulse_daily", "scripts/t-pulse/automatization/parse_tpulse_daily.py"
+)
+parse_tpulse_daily = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(parse_tpulse_daily)
+
+
+class FailingClient:
+    def get_posts_by_ticker(self, ticker, cursor):
+        raise OSError("unavailable")
+
+
+def test_retry_wait_interrupted_by_stop():
+    """Пауза перед повтором не держит конвейер после остановки"""
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+    started = time.monotonic()
+    with pytest.raises(parse_tpulse_daily.PipelineStopped):
+        list(parse_tpulse_daily.iter_ticker_posts("SBER", FailingClient(), stop=stop))
+    assert time.monotonic() - started < parse_tpulse_daily.SLEEP_ON_ERROR
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, Table, event, text
+
+from utils import upsert
+from utils.upsert import ensure_unique_index, upsert_dataframe
+
+table = Table(
+    "tmp_upsert_test",
+    MetaData(),
+    Column("key", Integer),
+    Column("value", Float),
+)
+
+
+@pytest.fixture
+def temp_table(db_conn, monkeypatch):
+    monkeypatch.setattr(upsert, "_checked_indexes", set())
+    db_conn.execute(
+        text("CREATE TEMP TABLE tmp_upsert_test (key INTEGER, value DOUBLE PRECISION) ON COMMIT DROP")
+    )
+    ensure_unique_index(db_conn, table, ["key"])
+    return db_conn
+
+
+def rows(conn):
+    return conn.execute(text("SELECT key, value FROM tmp_upsert_test ORDER BY key")).all()
+
+
+@pytest.mark.parametrize("method", ["insert", "copy"])
+@pytest.mark.parametrize("only_changed, expected", [(False, 5), (True, 4)])
+def test_upsert_overlapping_frames(temp_table, method, only_changed, expected):
+    first = pd.DataFrame({"key": [1, 2, 3, 4, 5], "value": [1.0, 2.0, 3.0, 4.0, 5.0]})
+    assert upsert_dataframe(first, table, ["key"], temp_table, method=method) == 5
+
+    # 4 меняется, 5 совпадает, 6-8 новые, дубль 8 внутри пачки - побеждает последний
+    second = pd.DataFrame({"key": [4, 5, 6, 7, 8, 8], "value": [40.0, 5.0, 6.0, None, 0.0, 8.0]})
+    affected = upsert_dataframe(
+        second, table, ["key"], temp_table, method=method, only_changed=only_changed
+    )
+    assert affected == expected
+    assert rows(temp_table) == [
+        (1, 1.0), (2, 2.0), (3, 3.0), (4, 40.0), (5, 5.0), (6, 6.0), (7, None), (8, 8.0)
+    ]
+
+
+def test_ensure_unique_index_checks_catalog_once(temp_table):
+    """Созданный индекс запоминается при следующей проверке, дальше каталог не читается"""
+    assert upsert._checked_indexes == set()
+    ensure_unique_index(temp_table, table, ["key"])
+    assert len(upsert._checked_indexes) == 1
+
+    queries = []
+
+    def count(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(temp_table, "before_cursor_execute", count)
+    try:
+        ensure_unique_index(temp_table, table, ["key"])
+    finally:
+        event.remove(temp_table, "before_cursor_execute", count)
+    assert queries == []
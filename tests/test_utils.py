@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from utils.utils import async_connection, connection, dispose_engines
+
+
+def test_connection_is_shared():
+    assert connection() is connection()
+
+
+def test_async_connection_smoke():
+    """AsyncEngine на asyncpg поднимается и выполняет запрос"""
+
+    async def select_one():
+        engine = async_connection()
+        assert engine is async_connection()
+        try:
+            async with engine.connect() as conn:
+                return (await conn.execute(text("SELECT 1"))).scalar()
+        finally:
+            await engine.dispose()
+
+    try:
+        result = asyncio.run(select_one())
+    except (OSError, DBAPIError) as e:
+        pytest.skip(f"Postgres из DB_* недоступен: {e}")
+    finally:
+        dispose_engines()
+    assert result == 1
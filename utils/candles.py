@@ -0,0 +1,128 @@
+import io
+
+CANDLE_COLUMNS = (
+    "ticker",
+    "datetime",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "is_complete",
+)
+
+STAGING_TABLE = "tmp_candles_copy"
+
+
+def quotation_to_str(quotation):
+    """Точное десятичное представление Quotation/MoneyValue без float"""
+    total = quotation.units * 1_000_000_000 + quotation.nano
+    sign = "-" if total < 0 else ""
+    units, nano = divmod(abs(total), 1_000_000_000)
+    return f"{sign}{units}.{nano:09d}"
+
+
+def candle_to_line(ticker, candle):
+    """Строка в текстовом формате COPY для свечи Tinkoff API"""
+    return (
+        f"{ticker}\t{candle.time.strftime('%Y-%m-%d %H:%M:%S')}\t"
+        f"{quotation_to_str(candle.open)}\t{quotation_to_str(candle.high)}\t"
+        f"{quotation_to_str(candle.low)}\t{quotation_to_str(candle.close)}\t"
+        f"{candle.volume}\t{'t' if candle.is_complete else 'f'}\n"
+    )
+
+
+def values_to_line(ticker, dt, open_, high, low, close, volume, is_complete):
+    """Строка в текстовом формате COPY из уже разобранных значений"""
+    return (
+        f"{ticker}\t{dt.strftime('%Y-%m-%d %H:%M:%S')}\t{open_}\t{high}\t{low}\t"
+        f"{close}\t{volume}\t{'t' if is_complete else 'f'}\n"
+    )
+
+
+class IteratorFile(io.TextIOBase):
+    """Файлоподобный объект поверх итератора строк для COPY FROM STDIN"""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _dbapi_cursor(conn):
+    """Курсор psycopg2 для SQLAlchemy Connection или сырого соединения psycopg2"""
+    raw = conn.connection if hasattr(conn, "exec_driver_sql") else conn
+    return raw.cursor()
+
+
+def copy_candle_lines(conn, lines, inserted_only=False) -> int:
+    """Потоковая загрузка строк свечей через COPY во временную таблицу
+    и слияние в candles с семантикой ON CONFLICT (ticker, datetime).
+
+    Работает внутри текущей транзакции, коммит остается за вызывающим.
+    Возвращает количество вставленных/обновленных свечей, а с inserted_only
+    только новых: у обновленной строки xmax не нулевой.
+    """
+    columns = ", ".join(CANDLE_COLUMNS)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in CANDLE_COLUMNS[2:])
+
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(f"SELECT to_regclass('pg_temp.{STAGING_TABLE}')")
+        if cursor.fetchone()[0] is None:
+            # Типы колонок берутся из candles, чтобы staging не округлял цены
+            # иначе, чем целевая таблица; seq - порядок строк в потоке COPY
+            cursor.execute(f"""
+                CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS
+                SELECT {columns} FROM candles WITH NO DATA
+            """)
+            cursor.execute(
+                f"ALTER TABLE {STAGING_TABLE} ADD COLUMN seq BIGINT GENERATED ALWAYS AS IDENTITY"
+            )
+        cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({columns}) FROM STDIN", IteratorFile(lines)
+        )
+        # Из повторов свечи в одной пачке побеждает завершенная, среди равных - последняя
+        merge = f"""
+            INSERT INTO candles ({columns})
+            SELECT DISTINCT ON (ticker, datetime) {columns}
+            FROM {STAGING_TABLE}
+            ORDER BY ticker, datetime, is_complete DESC NULLS LAST, seq DESC
+            ON CONFLICT (ticker, datetime) DO UPDATE SET {updates}
+        """
+        if not inserted_only:
+            cursor.execute(merge)
+            return cursor.rowcount
+        cursor.execute(f"""
+            WITH merged AS ({merge} RETURNING xmax = 0 AS inserted)
+            SELECT COUNT(*) FILTER (WHERE inserted) FROM merged
+        """)
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def copy_candles(conn, ticker, candles, inserted_only=False) -> int:
+    """Загрузка свечей Tinkoff API одного тикера без промежуточного DataFrame"""
+    return copy_candle_lines(
+        conn, (candle_to_line(ticker, candle) for candle in candles), inserted_only
+    )
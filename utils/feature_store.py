@@ -0,0 +1,252 @@
+import hashlib
+import json
+
+import pandas as pd
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Float,
+    MetaData,
+    String,
+    Table,
+    text,
+)
+
+from utils.features import (
+    BOLL_STD_TIMES,
+    BOLL_WINDOW,
+    FEATURE_COLUMNS,
+    MACD_FAST,
+    MACD_SLOW,
+    RSI_WINDOW,
+)
+from utils.indicators import ensure_tables as ensure_indicator_tables
+from utils.indicators import rebuild_ticker, refresh_ticker
+
+# Описание набора признаков: любое изменение дает новый хеш и новую версию строк
+FEATURE_SET = {
+    "source": "candles + candle_indicators",
+    "order": "datetime ASC",
+    "columns": list(FEATURE_COLUMNS),
+    "open_to_prev_close": "open / LAG(close) - 1",
+    "macd": [MACD_FAST, MACD_SLOW],
+    "rsi": RSI_WINDOW,
+    "boll": [BOLL_WINDOW, BOLL_STD_TIMES],
+}
+
+
+def feature_set_hash(spec=FEATURE_SET) -> str:
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+FEATURE_SET_HASH = feature_set_hash()
+
+metadata = MetaData()
+
+candle_features = Table(
+    "candle_features",
+    metadata,
+    Column("feature_set", String(12), primary_key=True),
+    Column("ticker", String(20), primary_key=True),
+    Column("datetime", DateTime, primary_key=True),
+    Column("volume", BigInteger),
+    *(Column(name, Float) for name in FEATURE_COLUMNS),
+    Column("computed_at", DateTime, server_default=text("CURRENT_TIMESTAMP")),
+)
+
+# Последняя завершенная свеча, по которую признаки тикера уже посчитаны
+feature_watermarks = Table(
+    "feature_watermarks",
+    metadata,
+    Column("feature_set", String(12), primary_key=True),
+    Column("ticker", String(20), primary_key=True),
+    Column("last_datetime", DateTime, nullable=False),
+    Column("updated_at", DateTime, server_default=text("CURRENT_TIMESTAMP")),
+)
+
+# Строки свечей новее отметки тикера: LAG видит последнюю уже посчитанную свечу,
+# а незавершенные свечи остаются за отметкой и пересчитываются следующим запуском
+MATERIALIZE_SQL = f"""
+    WITH marks AS (
+        SELECT ticker, last_datetime FROM feature_watermarks
+        WHERE feature_set = :feature_set
+    ),
+    src AS (
+        SELECT c.ticker, c.datetime, c.open::float8 AS open, c.close::float8 AS close,
+            c.volume, c.is_complete, m.last_datetime,
+            LAG(c.close::float8) OVER (PARTITION BY c.ticker ORDER BY c.datetime) AS prev_close
+        FROM candles c
+        LEFT JOIN marks m ON m.ticker = c.ticker
+        WHERE c.ticker = ANY(:tickers)
+        AND (m.last_datetime IS NULL OR c.datetime >= m.last_datetime)
+    ),
+    computed AS (
+        INSERT INTO candle_features (
+            feature_set, ticker, datetime, volume, {", ".join(FEATURE_COLUMNS)}
+        )
+        SELECT :feature_set, s.ticker, s.datetime, s.volume,
+            s.open / NULLIF(s.prev_close, 0) - 1,
+            s.close,
+            s.open - s.close,
+            (s.open - s.close) / NULLIF(s.close, 0),
+            i.macd, i.rsi_14, i.boll_ub, i.boll_lb
+        FROM src s
+        JOIN candle_indicators i ON i.ticker = s.ticker AND i.datetime = s.datetime
+        WHERE s.last_datetime IS NULL OR s.datetime > s.last_datetime
+        ON CONFLICT (feature_set, ticker, datetime) DO UPDATE SET
+            {", ".join(f"{name} = EXCLUDED.{name}" for name in ("volume", *FEATURE_COLUMNS))},
+            computed_at = CURRENT_TIMESTAMP
+        RETURNING ticker, datetime
+    )
+    SELECT computed.ticker, COUNT(*) AS rows,
+        MAX(computed.datetime) FILTER (WHERE c.is_complete) AS last_complete
+    FROM computed
+    JOIN candles c ON c.ticker = computed.ticker AND c.datetime = computed.datetime
+    GROUP BY computed.ticker
+"""
+
+
+def ensure_tables(conn):
+    ensure_indicator_tables(conn)
+    metadata.create_all(conn, checkfirst=True)
+
+
+def changed_tickers(conn, feature_set=FEATURE_SET_HASH):
+    """Тикеры, у которых есть свечи новее отметки набора признаков
+    или свечи без индикаторов (догруженные задним числом)"""
+    rows = conn.execute(
+        text("""
+            SELECT c.ticker
+            FROM candles c
+            LEFT JOIN feature_watermarks w
+                ON w.ticker = c.ticker AND w.feature_set = :feature_set
+            LEFT JOIN candle_indicators i ON i.ticker = c.ticker AND i.datetime = c.datetime
+            GROUP BY c.ticker, w.last_datetime
+            HAVING w.last_datetime IS NULL OR MAX(c.datetime) > w.last_datetime
+                OR BOOL_OR(i.ticker IS NULL)
+        """),
+        {"feature_set": feature_set},
+    ).all()
+    return [ticker for (ticker,) in rows]
+
+
+def tickers_without_indicators(conn, tickers) -> dict:
+    """Тикеры, для свечей которых ingest еще не посчитал индикаторы.
+
+    {тикер: True}, если среди таких свечей есть не новее состояния индикаторов:
+    refresh_ticker их не увидит, тикер нужно пересчитать целиком.
+    """
+    rows = conn.execute(
+        text("""
+            SELECT c.ticker, BOOL_OR(c.datetime <= s.last_datetime) IS TRUE AS behind_state
+            FROM candles c
+            LEFT JOIN candle_indicators i ON i.ticker = c.ticker AND i.datetime = c.datetime
+            LEFT JOIN indicator_state s ON s.ticker = c.ticker
+            WHERE c.ticker = ANY(:tickers) AND i.ticker IS NULL
+            GROUP BY c.ticker
+        """),
+        {"tickers": list(tickers)},
+    ).all()
+    return dict(rows)
+
+
+def _clear_features(conn, tickers, feature_set):
+    for table in (candle_features, feature_watermarks):
+        conn.execute(
+            table.delete().where(
+                table.c.feature_set == feature_set, table.c.ticker.in_(list(tickers))
+            )
+        )
+
+
+def refresh_features(conn, tickers=None, feature_set=FEATURE_SET_HASH) -> int:
+    """Досчитывает признаки только по тикерам и датам, изменившимся с прошлого запуска.
+
+    Индикаторы берутся из candle_indicators (досчитываются здесь же, если ingest
+    их не обновил), строковые признаки считаются в базе одним запросом.
+    Тикеры со свечами, догруженными позади состояния индикаторов, пересчитываются
+    целиком, как в rebuild_features. Возвращает число записанных строк.
+    """
+    ensure_tables(conn)
+    tickers = changed_tickers(conn, feature_set) if tickers is None else list(tickers)
+    if not tickers:
+        return 0
+
+    stale = []
+    for ticker, behind_state in tickers_without_indicators(conn, tickers).items():
+        if behind_state:
+            rebuild_ticker(conn, ticker)
+            stale.append(ticker)
+        else:
+            refresh_ticker(conn, ticker)
+    if stale:
+        _clear_features(conn, stale, feature_set)
+
+    results = conn.execute(
+        text(MATERIALIZE_SQL), {"feature_set": feature_set, "tickers": tickers}
+    ).all()
+
+    marks = [
+        {"feature_set": feature_set, "ticker": ticker, "last_datetime": last_complete}
+        for ticker, _, last_complete in results
+        if last_complete is not None
+    ]
+    if marks:
+        conn.execute(
+            text("""
+                INSERT INTO feature_watermarks (feature_set, ticker, last_datetime)
+                VALUES (:feature_set, :ticker, :last_datetime)
+                ON CONFLICT (feature_set, ticker) DO UPDATE SET
+                    last_datetime = GREATEST(
+                        feature_watermarks.last_datetime, EXCLUDED.last_datetime
+                    ),
+                    updated_at = CURRENT_TIMESTAMP
+            """),
+            marks,
+        )
+    return sum(rows for _, rows, _ in results)
+
+
+def rebuild_features(conn, tickers, feature_set=FEATURE_SET_HASH) -> int:
+    """Полный пересчет тикеров, например после исправления исторических свечей"""
+    tickers = list(tickers)
+    _clear_features(conn, tickers, feature_set)
+    return refresh_features(conn, tickers, feature_set)
+
+
+def read_features(
+    conn,
+    tickers=None,
+    left_date=None,
+    right_date=None,
+    columns=FEATURE_COLUMNS,
+    feature_set=FEATURE_SET_HASH,
+) -> pd.DataFrame:
+    """Готовая матрица признаков (ticker, datetime, volume, *columns) из candle_features"""
+    unknown = set(columns) - set(FEATURE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Неизвестные признаки: {sorted(unknown)}")
+
+    conditions = ["feature_set = :feature_set"]
+    params = {"feature_set": feature_set}
+    if tickers is not None:
+        conditions.append("ticker = ANY(:tickers)")
+        params["tickers"] = list(tickers)
+    if left_date is not None:
+        conditions.append("datetime >= :left_date")
+        params["left_date"] = left_date
+    if right_date is not None:
+        conditions.append("datetime <= :right_date")
+        params["right_date"] = right_date
+
+    return pd.read_sql(
+        text(f"""
+            SELECT ticker, datetime, volume, {", ".join(columns)}
+            FROM candle_features
+            WHERE {" AND ".join(conditions)}
+            ORDER BY ticker, datetime
+        """),
+        conn,
+        params=params,
+    )
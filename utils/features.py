@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Параметры индикаторов как в stockstats: macd, rsi_14, boll_ub / boll_lb
+MACD_FAST = 12
+MACD_SLOW = 26
+RSI_WINDOW = 14
+BOLL_WINDOW = 20
+BOLL_STD_TIMES = 2
+
+PRICE_COLUMNS = ("open", "high", "low", "close")
+FEATURE_COLUMNS = (
+    "open_to_prev_close",
+    "target",
+    "delta_open_close",
+    "delta_open_close_pct",
+    "macd",
+    "rsi_14",
+    "boll_ub",
+    "boll_lb",
+)
+
+# Цены приводим к float8 в базе: разбор DECIMAL в объекты Decimal дороже самих расчетов
+CANDLES_QUERY = text("""
+    SELECT id, ticker, datetime,
+        open::float8 AS open, high::float8 AS high,
+        low::float8 AS low, close::float8 AS close,
+        volume, is_complete, created_at
+    FROM candles
+    WHERE ticker = ANY(:tickers)
+    AND datetime >= :left_date AND datetime <= :right_date
+    ORDER BY ticker, datetime DESC
+""")
+
+
+def load_candles(tickers, left_date, right_date, conn) -> pd.DataFrame:
+    """Свечи всех тикеров одним параметризованным запросом"""
+    candles = pd.read_sql(
+        CANDLES_QUERY,
+        conn,
+        params={
+            "tickers": list(tickers),
+            "left_date": left_date,
+            "right_date": right_date,
+        },
+    )
+    return candles.astype({column: "float64" for column in PRICE_COLUMNS})
+
+
+def _group_starts(keys: np.ndarray) -> np.ndarray:
+    """Маска первых строк групп в отсортированном по ключу массиве"""
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    return starts
+
+
+def grouped_shift(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Сдвиг на одну строку внутри групп, первая строка группы - NaN"""
+    shifted = np.empty_like(values)
+    if len(values):
+        shifted[0] = np.nan
+        shifted[1:] = values[:-1]
+    shifted[starts] = np.nan
+    return shifted
+
+
+def grouped_ema(values: pd.Series, keys, **ewm) -> pd.Series:
+    """EWM среднее отдельно по каждой группе, с параметрами pandas.ewm"""
+    return values.groupby(keys, sort=False).ewm(**ewm).mean().droplevel(0)
+
+
+def grouped_rolling(values: pd.Series, keys, window: int):
+    rolling = values.groupby(keys, sort=False).rolling(window, min_periods=1)
+    return rolling.mean().droplevel(0), rolling.std().droplevel(0)
+
+
+def macd(close: pd.Series, keys) -> pd.Series:
+    """Линия MACD: EMA(12) - EMA(26) по цене закрытия"""
+    fast = grouped_ema(close, keys, span=MACD_FAST, min_periods=1, adjust=True)
+    slow = grouped_ema(close, keys, span=MACD_SLOW, min_periods=1, adjust=True)
+    return fast - slow
+
+
+def rsi(close: pd.Series, keys, starts: np.ndarray, window: int = RSI_WINDOW) -> pd.Series:
+    """RSI со сглаживанием Уайлдера (ewm с alpha=1/window), первая разница в группе - 0"""
+    values = close.to_numpy()
+    change = values - grouped_shift(values, starts)
+    change[starts] = 0
+    up = pd.Series((change + np.abs(change)) / 2, index=close.index)
+    down = pd.Series((-change + np.abs(change)) / 2, index=close.index)
+    smma = {"alpha": 1.0 / window, "min_periods": 0, "adjust": True}
+    rs = grouped_ema(up, keys, **smma) / grouped_ema(down, keys, **smma)
+    return 100 - 100 / (1.0 + rs)
+
+
+def bollinger(close: pd.Series, keys, window: int = BOLL_WINDOW):
+    """Верхняя и нижняя полосы Боллинджера: SMA ± 2 стандартных отклонения"""
+    moving_avg, moving_std = grouped_rolling(close, keys, window)
+    width = BOLL_STD_TIMES * moving_std
+    return moving_avg + width, moving_avg - width
+
+
+def compute_features(candles: pd.DataFrame) -> pd.DataFrame:
+    """Признаки data_from_ticker сразу по всем тикерам кадра.
+
+    candles отсортированы по (ticker, datetime DESC), как их возвращает load_candles:
+    сдвиги и индикаторы считаются в этом порядке внутри каждого тикера.
+    """
+    shares = candles.drop_duplicates(subset=["ticker", "datetime"]).reset_index(drop=True)
+    keys = shares["ticker"].to_numpy()
+    starts = _group_starts(keys)
+    open_ = shares["open"].to_numpy()
+    close = shares["close"].to_numpy()
+
+    shares["prev_close"] = grouped_shift(close, starts)
+    shares["open_to_prev_close"] = open_ / shares["prev_close"].to_numpy() - 1
+    shares["target"] = close
+    shares["delta_open_close"] = open_ - close
+    shares["delta_open_close_pct"] = (open_ - close) / close
+
+    close_series = shares["close"]
+    shares["macd"] = macd(close_series, keys)
+    shares["rsi_14"] = rsi(close_series, keys, starts)
+    shares["boll_ub"], shares["boll_lb"] = bollinger(close_series, keys)
+
+    shares = shares.drop(columns=["open", "prev_close", "close"])
+
+    filled = shares.groupby("ticker", sort=False).ffill()
+    filled.insert(shares.columns.get_loc("ticker"), "ticker", shares["ticker"])
+
+    return filled.dropna().reset_index(drop=True)
+
+
+def build_features(tickers, left_date, right_date, conn) -> pd.DataFrame:
+    """Обучающая матрица по списку тикеров: один запрос и один проход по данным"""
+    return compute_features(load_candles(tickers, left_date, right_date, conn))
@@ -0,0 +1,204 @@
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+from tinkoff.invest import CandleInterval
+
+from utils.candles import copy_candles
+from utils.feature_store import rebuild_features
+from utils.indicators import rebuild_ticker
+from utils.tinkoff_async import INTERVAL_WINDOWS, fetch_candles
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_INDEX = "IMOEX"  # торговые дни биржи берутся по датам индекса
+# День без данных индекса все равно торговый, если в нем есть свечи у этой доли
+# тикеров, торговавшихся в то время
+CALENDAR_QUORUM = 0.5
+HISTORY_YEARS = 10  # глубина загрузки тикеров без единой свечи
+RECHECK_DAYS = 7  # последние дни могут появиться в API позже, их не помечаем проверенными
+
+# Проверенные промежутки: догрузка ничего не вернула (торги не шли),
+# повторно их не запрашиваем
+GAP_CHECKS_DDL = """
+    CREATE TABLE IF NOT EXISTS candle_gap_checks (
+        ticker VARCHAR(20) NOT NULL REFERENCES companies(ticker),
+        day_from DATE NOT NULL,
+        day_to DATE NOT NULL,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (ticker, day_from)
+    )
+"""
+
+# Торговые дни нумеруются подряд, пропущенные дни тикера группируются в
+# непрерывные промежутки по разности номера дня и номера пропуска
+GAPS_SQL = """
+    WITH days AS MATERIALIZED (
+        SELECT DISTINCT ticker, datetime::date AS day FROM candles
+    ),
+    spans AS (
+        SELECT ticker, MIN(day) AS first_day, MAX(day) AS last_day
+        FROM days
+        GROUP BY ticker
+    ),
+    per_day AS (
+        SELECT day, COUNT(*) AS traded FROM days GROUP BY day
+    ),
+    calendar AS (
+        SELECT day, ROW_NUMBER() OVER (ORDER BY day) AS n
+        FROM (
+            SELECT date::date AS day FROM moex_iss_indices WHERE index_code = %(index)s
+            UNION
+            SELECT p.day FROM per_day p
+            WHERE p.traded >= %(quorum)s * (
+                SELECT COUNT(*) FROM spans s
+                WHERE s.first_day <= p.day AND s.last_day >= p.day
+            )
+        ) trading_days
+        WHERE day < %(today)s
+    ),
+    missing AS (
+        SELECT s.ticker, cal.day,
+            cal.n - ROW_NUMBER() OVER (PARTITION BY s.ticker ORDER BY cal.n) AS grp
+        FROM spans s
+        JOIN calendar cal ON cal.day > s.first_day
+        LEFT JOIN days d ON d.ticker = s.ticker AND d.day = cal.day
+        WHERE d.ticker IS NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM candle_gap_checks g
+            WHERE g.ticker = s.ticker AND cal.day BETWEEN g.day_from AND g.day_to
+        )
+    )
+    SELECT m.ticker, co.figi, MIN(m.day) AS day_from, MAX(m.day) AS day_to, COUNT(*) AS days
+    FROM missing m
+    JOIN companies co ON co.ticker = m.ticker
+    GROUP BY m.ticker, co.figi, m.grp
+    ORDER BY m.ticker, day_from
+"""
+
+EMPTY_TICKERS_SQL = """
+    SELECT co.ticker, co.figi
+    FROM companies co
+    WHERE NOT EXISTS (SELECT 1 FROM candles c WHERE c.ticker = co.ticker)
+    AND NOT EXISTS (SELECT 1 FROM candle_gap_checks g WHERE g.ticker = co.ticker)
+    ORDER BY co.ticker
+"""
+
+
+def ensure_tables(conn):
+    conn.exec_driver_sql(GAP_CHECKS_DDL)
+
+
+def find_gaps(conn, today=None, history_years=HISTORY_YEARS) -> pd.DataFrame:
+    """Пропущенные торговые дни тикеров: (ticker, figi, day_from, day_to, days).
+
+    Тикеры без истории дают один промежуток глубиной history_years.
+    Текущий день не проверяется: его свеча еще не завершена.
+    """
+    today = today or datetime.utcnow().date()
+    gaps = pd.read_sql(
+        GAPS_SQL,
+        conn,
+        params={"index": CALENDAR_INDEX, "quorum": CALENDAR_QUORUM, "today": today},
+    )
+    empty = pd.read_sql(EMPTY_TICKERS_SQL, conn)
+    if not empty.empty:
+        empty["day_from"] = today - timedelta(days=history_years * 365)
+        empty["day_to"] = today - timedelta(days=1)
+        empty["days"] = None
+        gaps = pd.concat([gaps, empty], ignore_index=True)
+    return gaps
+
+
+def plan_ranges(gaps, window=INTERVAL_WINDOWS[CandleInterval.CANDLE_INTERVAL_DAY]):
+    """Минимальный набор диапазонов запросов (ticker, figi, from_, to, промежутки).
+
+    Соседние промежутки тикера объединяются, пока диапазон укладывается в
+    одно окно GetCandles: лишние уже загруженные дни в ответе дешевле
+    отдельного запроса.
+    """
+    ranges = []
+    for (ticker, figi), group in gaps.groupby(["ticker", "figi"], sort=True):
+        current = None
+        for row in group.sort_values("day_from").itertuples(index=False):
+            start = datetime.combine(row.day_from, datetime.min.time())
+            end = datetime.combine(row.day_to, datetime.min.time()) + timedelta(days=1)
+            if current is not None and end - current[2] <= window:
+                current[3] = end
+                current[4].append((row.day_from, row.day_to))
+                continue
+            current = [ticker, figi, start, end, [(row.day_from, row.day_to)]]
+            ranges.append(current)
+    return [tuple(item) for item in ranges]
+
+
+def mark_checked(conn, checked):
+    """Промежутки, по которым догрузка прошла без ошибок"""
+    if not checked:
+        return
+    cursor = conn.connection.cursor()
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO candle_gap_checks (ticker, day_from, day_to) VALUES (%s, %s, %s)
+            ON CONFLICT (ticker, day_from) DO UPDATE SET
+                day_to = GREATEST(candle_gap_checks.day_to, EXCLUDED.day_to),
+                checked_at = CURRENT_TIMESTAMP
+            """,
+            checked,
+        )
+    finally:
+        cursor.close()
+
+
+def backfill_gaps(engine, token, dry_run=False, history_years=HISTORY_YEARS) -> int:
+    """Находит пропуски и догружает только их, все диапазоны конкурентно.
+
+    Дни, которые API не вернул и после догрузки, помечаются проверенными.
+    Индикаторы и признаки тикеров с новыми свечами пересчитываются целиком:
+    вставка в середину истории меняет все последующие значения. Уже
+    сохраненные дни, попавшие в объединенный диапазон, новыми не считаются.
+    Возвращает число вставленных свечей.
+    """
+    with engine.begin() as conn:
+        ensure_tables(conn)
+        gaps = find_gaps(conn, history_years=history_years)
+    ranges = plan_ranges(gaps)
+    logger.info(
+        f"Пропусков: {len(gaps)} по {gaps['ticker'].nunique() if len(gaps) else 0} тикерам, "
+        f"запросов: {len(ranges)}"
+    )
+    if dry_run or not ranges:
+        for ticker, _, start, end, parts in ranges:
+            logger.info(f"{ticker}: {start:%Y-%m-%d}..{end:%Y-%m-%d} ({len(parts)} промежутков)")
+        return 0
+
+    jobs = [(i, figi, start, end) for i, (_, figi, start, end, _) in enumerate(ranges)]
+    candles, failed = fetch_candles(jobs, token)
+    failed_ranges = {i for i, _, _, _ in failed}
+    for i, start, end, error in failed:
+        logger.error(f"❌ {ranges[i][0]} {start:%Y-%m-%d}..{end:%Y-%m-%d}: {error}")
+
+    recent = datetime.utcnow().date() - timedelta(days=RECHECK_DAYS)
+    by_ticker = {}
+    checked = []
+    for i, (ticker, _, _, _, parts) in enumerate(ranges):
+        by_ticker.setdefault(ticker, []).extend(candles.get(i, []))
+        if i not in failed_ranges:
+            checked.extend(
+                (ticker, day_from, min(day_to, recent - timedelta(days=1)))
+                for day_from, day_to in parts
+                if day_from < recent
+            )
+
+    total = 0
+    with engine.begin() as conn:
+        for ticker, items in by_ticker.items():
+            added = copy_candles(conn, ticker, items, inserted_only=True)
+            if added:
+                rebuild_ticker(conn, ticker)
+                rebuild_features(conn, [ticker])
+                total += added
+                logger.info(f"✅ {ticker}: +{added} свечей в пропусках")
+        mark_checked(conn, checked)
+    return total
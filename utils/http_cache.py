@@ -0,0 +1,386 @@
+"""Дисковый кэш ответов внешних API для разработки и воспроизведения.
+
+Включается переменной HTTP_CACHE:
+    off     - кэш не используется (по умолчанию, прод);
+    on      - ответы берутся из кэша, пока не истек их срок, остальное
+              запрашивается и записывается;
+    offline - только кэш, без сети и без учета сроков: промах - ошибка.
+
+Ответы лежат в SQLite (HTTP_CACHE_PATH) сжатыми zlib, ключ - sha256 от
+метода и нормализованного URL (параметры отсортированы). Срок хранения
+зависит от источника, а ответы за закрытые периоды (параметр конца
+периода раньше сегодняшнего дня по Москве) не устаревают. При превышении
+HTTP_CACHE_MAX_MB вытесняются давно не читанные записи.
+
+Запуск из корня репозитория:
+    uv run python -m utils.http_cache stats
+    uv run python -m utils.http_cache clear [источник]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from zoneinfo import ZoneInfo
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODE = os.getenv("HTTP_CACHE", "off")  # off | on | offline
+CACHE_PATH = os.getenv("HTTP_CACHE_PATH", ".cache/http.sqlite")
+MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "512")) * 1024 * 1024
+EVICT_TO = 0.9  # после вытеснения остается 90% лимита, чтобы не чистить на каждой записи
+# Размер кэша пересчитывается по базе не чаще раза в столько записей (или при
+# превышении лимита по оценке): файл общий для нескольких процессов
+EVICT_CHECK_EVERY = 100
+# Периоды источников (ISS, ЦБ) закрываются по московскому времени, а не по часам сервера
+CACHE_TZ = ZoneInfo("Europe/Moscow")
+
+# Источник определяется по хосту, для остальных хостов источник - сам хост
+HOST_SOURCES = {
+    "cbr.ru": "cbr",
+    "www.cbr.ru": "cbr",
+    "iss.moex.com": "iss",
+    "www.tinkoff.ru": "tpulse",
+    "www.tbank.ru": "tpulse",
+}
+# Срок жизни ответов за текущий (незакрытый) период, секунд
+SOURCE_TTL = {
+    "cbr": 24 * 3600,  # ЦБ публикует данные раз в месяц
+    "iss": 15 * 60,
+    "tpulse": 10 * 60,  # счетчики реакций свежих постов меняются
+    "tinkoff": 5 * 60,
+}
+DEFAULT_TTL = 3600
+# Параметры конца запрошенного периода: ISS till/date, Tinkoff to, ЦБ y2 (год)
+PERIOD_END_PARAMS = ("till", "to", "date", "y2")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        url TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        headers TEXT NOT NULL,
+        body BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+class CacheMiss(requests.ConnectionError):
+    """Ответа нет в кэше, а сеть запрещена режимом offline"""
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def request_key(method: str, url: str, body: bytes = b"") -> str:
+    digest = hashlib.sha256(f"{method.upper()} {normalize_url(url)}".encode())
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def source_of(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        return parts.scheme  # условные URL не-HTTP запросов, например tinkoff://
+    host = parts.netloc.lower()
+    return HOST_SOURCES.get(host, host)
+
+
+def _today() -> date:
+    return datetime.now(CACHE_TZ).date()
+
+
+def _period_end(value: str):
+    if value.isdigit() and len(value) == 4:
+        return date(int(value), 12, 31)
+    try:
+        end = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if end.tzinfo is not None:
+        end = end.astimezone(CACHE_TZ)
+    return end.date()
+
+
+def ttl_for(url: str):
+    """Срок жизни ответа в секундах; None - ответ за закрытый период, не устаревает"""
+    params = dict(parse_qsl(urlsplit(url).query))
+    for name in PERIOD_END_PARAMS:
+        end = _period_end(params.get(name, ""))
+        if end is not None:
+            # Конец периода до сегодняшнего дня: данные уже не изменятся
+            if end < _today():
+                return None
+            break
+    return SOURCE_TTL.get(source_of(url), DEFAULT_TTL)
+
+
+class ResponseCache:
+    """Хранилище ответов в SQLite; соединение свое у каждого потока"""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._total = None  # оценка размера: сумма из базы плюс записанное после нее
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db().executescript(SCHEMA)
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        """(status, headers, body) или None; в режиме offline сроки не проверяются"""
+        now = time.time()
+        row = self._db().execute(
+            "SELECT status, headers, body, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, expires_at = row
+        if not self.offline and expires_at is not None and expires_at <= now:
+            return None
+        self._db().execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return status, json.loads(headers), zlib.decompress(body)
+
+    def put(self, key, url, status, headers, body, ttl=None, source=None):
+        now = time.time()
+        payload = zlib.compress(body, 6)
+        self._db().execute(
+            """
+            INSERT OR REPLACE INTO responses
+                (key, source, url, status, headers, body, size, created_at, expires_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                key,
+                source or source_of(url),
+                url,
+                status,
+                json.dumps(dict(headers)),
+                payload,
+                len(payload),
+                now,
+                None if ttl is None else now + ttl,
+                now,
+            ),
+        )
+        with self._lock:
+            self._writes += 1
+            if self._total is not None:
+                self._total += len(payload)
+            check = (
+                self._total is None
+                or self._total > self.max_bytes
+                or self._writes >= EVICT_CHECK_EVERY
+            )
+        if check:
+            self.evict()
+
+    def load(self, url):
+        """Тело ответа по URL или None; в режиме offline промах - CacheMiss"""
+        hit = self.get(request_key("GET", url))
+        if hit is not None:
+            return hit[2]
+        if self.offline:
+            raise CacheMiss(f"Нет в кэше: {url}")
+        return None
+
+    def save(self, url, body):
+        self.put(request_key("GET", url), url, 200, {}, body, ttl_for(url))
+
+    def evict(self):
+        """LRU: удаляет давно не читанные записи, пока кэш больше лимита"""
+        db = self._db()
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            self._reset_total(total)
+            return 0
+        target = self.max_bytes * EVICT_TO
+        rows = db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        keys = []
+        for key, size in rows:
+            if total <= target:
+                break
+            keys.append((key,))
+            total -= size
+        db.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self._reset_total(total)
+        return len(keys)
+
+    def _reset_total(self, total):
+        with self._lock:
+            self._total = total
+            self._writes = 0
+
+    def clear(self, source=None):
+        if source:
+            cursor = self._db().execute("DELETE FROM responses WHERE source = ?", (source,))
+        else:
+            cursor = self._db().execute("DELETE FROM responses")
+        return cursor.rowcount
+
+    def stats(self):
+        """[(источник, записей, байт сжатых, бессрочных)]"""
+        return self._db().execute(
+            """
+            SELECT source, COUNT(*), SUM(size), SUM(expires_at IS NULL)
+            FROM responses GROUP BY source ORDER BY source
+            """
+        ).fetchall()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Кэш процесса по HTTP_CACHE или None, если кэш выключен"""
+    global _cache
+    if CACHE_MODE == "off":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(offline=CACHE_MODE == "offline")
+                logger.info(f"Кэш ответов API: {CACHE_PATH} (режим {CACHE_MODE})")
+    return _cache
+
+
+class CachingAdapter(HTTPAdapter):
+    """HTTPAdapter для requests: успешные GET-ответы сохраняются в кэш"""
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        key = request_key(request.method, request.url)
+        hit = self.cache.get(key)
+        if hit is not None:
+            status, headers, body = hit
+            response = requests.Response()
+            response.status_code = status
+            response.headers.update(headers)
+            response._content = body
+            response._content_consumed = True
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            return response
+        if self.cache.offline:
+            raise CacheMiss(f"Нет в кэше: {request.url}", request=request)
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            # Тело уже сжатое транспортом распаковано, заголовки сжатия не нужны
+            headers = {
+                name: value
+                for name, value in response.headers.items()
+                if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+            }
+            self.cache.put(key, request.url, 200, headers, response.content, ttl_for(request.url))
+        return response
+
+
+def caching_transport(transport):
+    """Транспорт для httpx.Client(transport=...): с кэшем ответов, если
+    HTTP_CACHE включен, иначе transport как есть"""
+    cache = get_cache()
+    return CachingTransport(cache, transport) if cache is not None else transport
+
+
+class CachingTransport:
+    """Обертка над httpx-транспортом с тем же кэшем, что и у requests"""
+
+    def __init__(self, cache, transport):
+        self.cache = cache
+        self.transport = transport
+
+    def handle_request(self, request):
+        import httpx
+
+        url = str(request.url)
+        if request.method != "GET":
+            return self.transport.handle_request(request)
+        key = request_key(request.method, url)
+        hit = self.cache.get(key)
+        if hit is not None:
+            status, headers, body = hit
+            return httpx.Response(status, headers=headers, content=body, request=request)
+        if self.cache.offline:
+            raise httpx.ConnectError(f"Нет в кэше: {url}", request=request)
+
+        response = self.transport.handle_request(request)
+        if response.status_code != 200:
+            return response
+        body = response.read()
+        response.close()
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        self.cache.put(key, url, 200, headers, body, ttl_for(url))
+        return httpx.Response(200, headers=headers, content=body, request=request)
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Дисковый кэш ответов API")
+    parser.add_argument("command", choices=["stats", "clear", "evict"])
+    parser.add_argument("source", nargs="?", help="источник для clear")
+    args = parser.parse_args()
+
+    cache = ResponseCache()
+    if args.command == "clear":
+        print(f"Удалено записей: {cache.clear(args.source)}")
+    elif args.command == "evict":
+        print(f"Вытеснено записей: {cache.evict()}")
+    else:
+        print(f"{'источник':<20}{'записей':>10}{'МБ':>10}{'бессрочных':>12}")
+        for source, count, size, permanent in cache.stats():
+            print(f"{source:<20}{count:>10}{size / 2**20:>10.1f}{permanent:>12}")
+
+
+if __name__ == "__main__":
+    main()
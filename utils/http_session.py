@@ -0,0 +1,45 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.http_cache import CachingAdapter, get_cache
+
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+TIMEOUT = (3.05, 10)  # (connect, read)
+DEFAULT_POOL_SIZE = 4
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def make_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Keep-alive сессия с пулом соединений и повторами с экспоненциальной паузой"""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    options = {"pool_connections": 1, "pool_maxsize": pool_size, "max_retries": retry}
+    cache = get_cache()
+    # С HTTP_CACHE=on|offline ответы берутся из дискового кэша
+    adapter = CachingAdapter(cache, **options) if cache is not None else HTTPAdapter(**options)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(name: str, pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Общая для процесса сессия источника name: у каждого API свой пул
+    соединений, настройки и заголовки одного не влияют на другой"""
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = make_session(pool_size)
+    return session
@@ -0,0 +1,379 @@
+import math
+import sys
+from collections import deque
+from types import SimpleNamespace
+
+import pandas as pd
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+
+from utils.features import BOLL_STD_TIMES, BOLL_WINDOW, MACD_FAST, MACD_SLOW, RSI_WINDOW
+from utils.upsert import upsert_dataframe
+
+metadata = MetaData()
+
+# Рекуррентное состояние индикаторов тикера на последней завершенной свече
+indicator_state = Table(
+    "indicator_state",
+    metadata,
+    Column("ticker", String(20), primary_key=True),
+    Column("last_datetime", DateTime, nullable=False),
+    Column("ema_fast", Float),  # EMA(12) и сумма весов для adjust=True
+    Column("ema_fast_wt", Float),
+    Column("ema_slow", Float),  # EMA(26)
+    Column("ema_slow_wt", Float),
+    Column("rsi_up", Float),  # сглаживание Уайлдера роста и падения
+    Column("rsi_up_wt", Float),
+    Column("rsi_down", Float),
+    Column("rsi_down_wt", Float),
+    Column("prev_close", Float),
+    Column("closes", ARRAY(Float), nullable=False),  # окно Боллинджера
+    Column("same_count", Integer),  # накопители pandas.rolling для mean и std
+    Column("neg_count", Integer),
+    Column("sum_x", Float),
+    Column("sum_add_comp", Float),
+    Column("sum_remove_comp", Float),
+    Column("mean_x", Float),
+    Column("ssqdm_x", Float),
+    Column("var_add_comp", Float),
+    Column("var_remove_comp", Float),
+    Column("updated_at", DateTime, server_default=text("CURRENT_TIMESTAMP")),
+)
+
+candle_indicators = Table(
+    "candle_indicators",
+    metadata,
+    Column("ticker", String(20), primary_key=True),
+    Column("datetime", DateTime, primary_key=True),
+    Column("macd", Float),
+    Column("rsi_14", Float),
+    Column("boll_ub", Float),
+    Column("boll_lb", Float),
+)
+
+INDICATOR_COLUMNS = ("macd", "rsi_14", "boll_ub", "boll_lb")
+COPY_THRESHOLD = 500  # начальный расчет по всей истории пишем через COPY
+
+# pandas.rolling.var с 3.0 пересчитывает окно, когда сумма квадратов
+# отклонений за шаг падает больше чем в 1/(eps*1e3) раз
+RECOMPUTE_UNSTABLE_VAR = int(pd.__version__.split(".")[0]) >= 3
+INV_COND_TOL = sys.float_info.epsilon * 1e3
+
+
+def _upsert_statement(table, key_columns):
+    """INSERT ... ON CONFLICT DO UPDATE для executemany, компилируется один раз"""
+    stmt = insert(table)
+    updates = {
+        column.name: stmt.excluded[column.name]
+        for column in table.columns
+        if column.name not in key_columns and column.name != "updated_at"
+    }
+    if "updated_at" in table.columns:
+        updates["updated_at"] = func.now()
+    return stmt.on_conflict_do_update(index_elements=key_columns, set_=updates)
+
+
+UPSERT_INDICATORS = _upsert_statement(candle_indicators, ["ticker", "datetime"])
+UPSERT_STATE = _upsert_statement(indicator_state, ["ticker"])
+
+
+def _old_weight_factor(com: float) -> float:
+    # Тот же путь вычисления, что в pandas.ewm, иначе расходится последний бит
+    return 1.0 - 1.0 / (1.0 + com)
+
+
+class Ewm:
+    """Одна точка рекурсии pandas.ewm(adjust=True): среднее и накопленный вес"""
+
+    __slots__ = ("factor", "weighted", "old_wt")
+
+    def __init__(self, factor, weighted=math.nan, old_wt=1.0):
+        self.factor = factor
+        self.weighted = math.nan if weighted is None else weighted
+        self.old_wt = old_wt
+
+    @classmethod
+    def span(cls, span, *state):
+        return cls(_old_weight_factor((span - 1) / 2.0), *state)
+
+    @classmethod
+    def alpha(cls, alpha, *state):
+        return cls(_old_weight_factor(1.0 / alpha - 1.0), *state)
+
+    def update(self, value: float) -> float:
+        if self.weighted != self.weighted:  # первое наблюдение
+            self.weighted = value
+            self.old_wt = 1.0
+            return value
+        self.old_wt *= self.factor
+        if self.weighted != value:
+            self.weighted = (self.old_wt * self.weighted + value) / (self.old_wt + 1.0)
+        self.old_wt += 1.0
+        return self.weighted
+
+
+def _rsi(up: float, down: float) -> float:
+    if down == 0:  # деление по IEEE, как в numpy: x/0 = inf, 0/0 = nan
+        rs = math.inf if up > 0 else math.nan
+    else:
+        rs = up / down
+    return 100 - 100 / (1.0 + rs)
+
+
+class RollingMoments:
+    """Скользящие среднее и стандартное отклонение на тех же накопителях,
+    что pandas.rolling(window, min_periods=1): сумма Кэхэна для mean и метод
+    Уэлфорда для var, значения добавляются и удаляются без пересчета окна.
+
+    pandas 3 пересчитывает var по окну заново, когда сумма квадратов
+    отклонений теряет точность (например, окно заполнилось одинаковыми
+    ценами), а pandas 2 вместо этого обнуляет var на таком окне.
+    Повторяется поведение установленной версии, иначе после ровного участка
+    std расходится со stockstats навсегда.
+    """
+
+    ACCUMULATORS = (
+        "same_count",
+        "neg_count",
+        "sum_x",
+        "sum_add_comp",
+        "sum_remove_comp",
+        "mean_x",
+        "ssqdm_x",
+        "var_add_comp",
+        "var_remove_comp",
+    )
+
+    def __init__(self, window, values=(), prev_value=None, **accumulators):
+        self.window = window
+        self.values = deque(values)
+        self.prev_value = math.nan if prev_value is None else prev_value
+        for name in self.ACCUMULATORS:
+            value = accumulators.get(name)
+            setattr(self, name, 0 if value is None else value)
+
+    def _remove(self) -> bool:
+        """Удаляет старейшее значение; True, если var потеряла точность"""
+        value = self.values.popleft()
+        nobs = len(self.values)
+
+        y = -value - self.sum_remove_comp
+        t = self.sum_x + y
+        self.sum_remove_comp = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_count -= 1
+
+        if not nobs:
+            self.mean_x = 0
+            self.ssqdm_x = 0
+            return False
+        prev_m2 = self.ssqdm_x
+        prev_mean = self.mean_x - self.var_remove_comp
+        y = value - self.var_remove_comp
+        t = y - self.mean_x
+        self.var_remove_comp = t + self.mean_x - y
+        self.mean_x = self.mean_x - t / nobs
+        self.ssqdm_x = self.ssqdm_x - (value - prev_mean) * (value - self.mean_x)
+        return prev_m2 * INV_COND_TOL > self.ssqdm_x
+
+    def _add_var(self, value) -> bool:
+        nobs = len(self.values)
+        prev_m2 = self.ssqdm_x
+        prev_mean = self.mean_x - self.var_add_comp
+        y = value - self.var_add_comp
+        t = y - self.mean_x
+        self.var_add_comp = t + self.mean_x - y
+        self.mean_x = self.mean_x + t / nobs
+        self.ssqdm_x = self.ssqdm_x + (value - prev_mean) * (value - self.mean_x)
+        return prev_m2 * INV_COND_TOL > self.ssqdm_x
+
+    def _add(self, value) -> bool:
+        """Добавляет значение; True, если var потеряла точность"""
+        self.values.append(value)
+
+        y = value - self.sum_add_comp
+        t = self.sum_x + y
+        self.sum_add_comp = t - self.sum_x - y
+        self.sum_x = t
+        if math.copysign(1.0, value) < 0:
+            self.neg_count += 1
+        self.same_count = self.same_count + 1 if value == self.prev_value else 1
+        self.prev_value = value
+        return self._add_var(value)
+
+    def _recompute_var(self):
+        """Накопители var заново по значениям окна, как roll_var в pandas 3"""
+        values = list(self.values)
+        self.values.clear()
+        self.mean_x = self.ssqdm_x = self.var_add_comp = self.var_remove_comp = 0
+        for value in values:
+            self.values.append(value)
+            self._add_var(value)
+
+    def update(self, value):
+        """Сдвигает окно на значение и возвращает (mean, std)"""
+        unstable = False
+        if len(self.values) == self.window:
+            unstable = self._remove()
+        unstable = self._add(value) or unstable
+        if unstable and RECOMPUTE_UNSTABLE_VAR:
+            self._recompute_var()
+        nobs = len(self.values)
+
+        mean = self.sum_x / nobs
+        if self.same_count >= nobs:
+            mean = self.prev_value
+        elif self.neg_count == 0 and mean < 0:
+            mean = 0.0
+        elif self.neg_count == nobs and mean > 0:
+            mean = 0.0
+
+        if nobs == 1:
+            return mean, math.nan
+        if self.same_count >= nobs and not RECOMPUTE_UNSTABLE_VAR:
+            return mean, 0.0
+        var = self.ssqdm_x / (nobs - 1.0)
+        return mean, math.sqrt(var) if var >= 0 else 0.0
+
+
+class IndicatorState:
+    """Состояние macd, rsi_14 и boll_ub / boll_lb одного тикера, O(1) на свечу.
+
+    Свечи подаются по возрастанию времени, результат совпадает со stockstats
+    на том же упорядоченном ряде: EMA и RSI по той же рекурсии, что pandas.ewm,
+    полосы Боллинджера - по тем же накопителям, что pandas.rolling.
+    """
+
+    EWM_FIELDS = ("ema_fast", "ema_slow", "rsi_up", "rsi_down")
+
+    def __init__(self, last_datetime=None, prev_close=None, closes=(), ewm=None, rolling=None):
+        self.last_datetime = last_datetime
+        self.prev_close = prev_close
+        ewm = ewm or {}
+        self.ema_fast = Ewm.span(MACD_FAST, *ewm.get("ema_fast", ()))
+        self.ema_slow = Ewm.span(MACD_SLOW, *ewm.get("ema_slow", ()))
+        self.rsi_up = Ewm.alpha(1.0 / RSI_WINDOW, *ewm.get("rsi_up", ()))
+        self.rsi_down = Ewm.alpha(1.0 / RSI_WINDOW, *ewm.get("rsi_down", ()))
+        self.boll = RollingMoments(BOLL_WINDOW, closes or (), prev_close, **(rolling or {}))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            last_datetime=row.last_datetime,
+            prev_close=row.prev_close,
+            closes=row.closes,
+            ewm={
+                name: (getattr(row, name), getattr(row, f"{name}_wt"))
+                for name in cls.EWM_FIELDS
+            },
+            rolling={name: getattr(row, name) for name in RollingMoments.ACCUMULATORS},
+        )
+
+    def to_record(self, ticker):
+        record = {
+            "ticker": ticker,
+            "last_datetime": self.last_datetime,
+            "prev_close": self.prev_close,
+            "closes": list(self.boll.values),
+        }
+        for name in self.EWM_FIELDS:
+            ewm = getattr(self, name)
+            record[name] = ewm.weighted
+            record[f"{name}_wt"] = ewm.old_wt
+        for name in RollingMoments.ACCUMULATORS:
+            record[name] = getattr(self.boll, name)
+        return record
+
+    def copy(self):
+        return IndicatorState.from_row(SimpleNamespace(**self.to_record(None)))
+
+    def update(self, dt, close: float):
+        """Добавляет свечу и возвращает (macd, rsi_14, boll_ub, boll_lb)"""
+        change = 0.0 if self.prev_close is None else close - self.prev_close
+        self.prev_close = close
+        self.last_datetime = dt
+
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        up = self.rsi_up.update((change + abs(change)) / 2)
+        down = self.rsi_down.update((-change + abs(change)) / 2)
+
+        moving_avg, moving_std = self.boll.update(close)
+        width = BOLL_STD_TIMES * moving_std
+        return macd, _rsi(up, down), moving_avg + width, moving_avg - width
+
+
+def ensure_tables(conn):
+    metadata.create_all(conn, checkfirst=True)
+
+
+def load_state(conn, ticker):
+    row = conn.execute(
+        indicator_state.select().where(indicator_state.c.ticker == ticker)
+    ).first()
+    return IndicatorState.from_row(row) if row is not None else IndicatorState()
+
+
+def refresh_ticker(conn, ticker) -> int:
+    """Досчитывает индикаторы по свечам новее сохраненного состояния тикера.
+
+    Обычно это одна-две свечи, для тикера без состояния - вся история один раз.
+    Состояние сдвигается только по завершенным свечам: незавершенная свеча
+    получает индикаторы, но пересчитывается при следующем обновлении.
+    Возвращает число свечей с обновленными индикаторами.
+    """
+    state = load_state(conn, ticker)
+    rows = conn.execute(
+        text("""
+            SELECT datetime, close::float8 AS close, is_complete FROM candles
+            WHERE ticker = :ticker
+            AND (CAST(:last_datetime AS TIMESTAMP) IS NULL OR datetime > :last_datetime)
+            ORDER BY datetime
+        """),
+        {"ticker": ticker, "last_datetime": state.last_datetime},
+    ).all()
+    if not rows:
+        return 0
+
+    persisted = None
+    values = []
+    for dt, close, is_complete in rows:
+        if not is_complete and persisted is None:
+            persisted = state.copy()
+        values.append((ticker, dt, *state.update(dt, close)))
+    persisted = persisted or state
+
+    if len(values) > COPY_THRESHOLD:
+        upsert_dataframe(
+            pd.DataFrame(values, columns=["ticker", "datetime", *INDICATOR_COLUMNS]),
+            candle_indicators,
+            ["ticker", "datetime"],
+            conn,
+            method="copy",
+        )
+    else:
+        columns = ("ticker", "datetime", *INDICATOR_COLUMNS)
+        records = [
+            {name: None if value != value else value for name, value in zip(columns, row)}
+            for row in values
+        ]
+        conn.execute(UPSERT_INDICATORS, records)
+    if persisted.last_datetime is not None:
+        conn.execute(UPSERT_STATE, [persisted.to_record(ticker)])
+    return len(values)
+
+
+def rebuild_ticker(conn, ticker) -> int:
+    """Полный пересчет тикера, например после исправления исторических свечей"""
+    conn.execute(indicator_state.delete().where(indicator_state.c.ticker == ticker))
+    return refresh_ticker(conn, ticker)
@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from utils.candles import IteratorFile, _dbapi_cursor
+from utils.schema import periods
+
+# Внутридневные интервалы: имя -> длительность свечи в минутах
+INTRADAY_INTERVALS = {"1m": 1, "5m": 5, "15m": 15, "1h": 60}
+
+# Время свечи хранится как int32 минут от EPOCH (UTC): хватает до 6083 года
+EPOCH = datetime(2000, 1, 1)
+INTRADAY_TABLE = "candles_intraday"
+STAGING_TABLE = "tmp_candles_intraday_copy"
+DEFAULT_PRICE_SCALE = 6  # знаков после запятой, если шаг цены неизвестен
+MAX_PRICE_SCALE = 9  # точность nano в Quotation
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+
+def to_minute(dt) -> int:
+    """Минуты от EPOCH; aware-время сначала приводится к UTC"""
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None) - dt.utcoffset()
+    return int((dt - EPOCH) // timedelta(minutes=1))
+
+
+def from_minutes(minutes) -> pd.Series:
+    """Обратное преобразование сразу для колонки"""
+    return pd.to_datetime(EPOCH) + pd.to_timedelta(np.asarray(minutes, dtype=np.int64), unit="min")
+
+
+def price_scale(min_price_increment) -> int:
+    """Число знаков шага цены: цены хранятся целыми price * 10**scale"""
+    # NULL из companies приходит в DataFrame как None или NaN
+    if min_price_increment is None or pd.isna(min_price_increment):
+        return DEFAULT_PRICE_SCALE
+    exponent = Decimal(str(min_price_increment)).normalize().as_tuple().exponent
+    return min(max(0, -exponent), MAX_PRICE_SCALE)
+
+
+def scale_quotation(quotation, scale) -> int:
+    """Quotation (units, nano) в целое с scale знаками, без float.
+
+    Цена вне сетки шага округляется до ближайшего значения, а не отбрасывается.
+    """
+    divisor = 10 ** (MAX_PRICE_SCALE - scale)
+    value, remainder = divmod(quotation.units * 1_000_000_000 + quotation.nano, divisor)
+    return value + (2 * remainder >= divisor)
+
+
+INTRADAY_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {INTRADAY_TABLE} (
+        company_id INTEGER NOT NULL REFERENCES companies(id),
+        interval SMALLINT NOT NULL,
+        minute INTEGER NOT NULL,
+        open BIGINT NOT NULL,
+        high BIGINT NOT NULL,
+        low BIGINT NOT NULL,
+        close BIGINT NOT NULL,
+        volume BIGINT NOT NULL,
+        is_complete BOOLEAN NOT NULL,
+        PRIMARY KEY (company_id, interval, minute)
+    ) PARTITION BY RANGE (minute);
+
+    CREATE TABLE IF NOT EXISTS {INTRADAY_TABLE}_default
+        PARTITION OF {INTRADAY_TABLE} DEFAULT;
+
+    -- Масштаб цен тикера: price = value / 10^price_scale
+    CREATE TABLE IF NOT EXISTS intraday_price_scales (
+        company_id INTEGER PRIMARY KEY REFERENCES companies(id),
+        price_scale SMALLINT NOT NULL
+    );
+"""
+
+
+def widen_price_columns(cursor):
+    """Однократная миграция цен из INTEGER в BIGINT: при масштабе 6 в int32
+    помещаются только цены до ~2147"""
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND column_name = ANY(%s) AND data_type = 'integer'
+        """,
+        (INTRADAY_TABLE, list(PRICE_COLUMNS)),
+    )
+    columns = [row[0] for row in cursor.fetchall()]
+    if columns:
+        cursor.execute(
+            f"ALTER TABLE {INTRADAY_TABLE} "
+            + ", ".join(f"ALTER COLUMN {column} TYPE BIGINT" for column in columns)
+        )
+
+
+def ensure_intraday_table(conn, start, end):
+    """Таблица внутридневных свечей с годовыми партициями на период [start, end]"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(INTRADAY_DDL)
+        widen_price_columns(cursor)
+        for lower, upper in periods(start, end, "year"):
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {INTRADAY_TABLE}_y{lower:%Y}
+                PARTITION OF {INTRADAY_TABLE} FOR VALUES FROM (%s) TO (%s)
+                """,
+                (to_minute(lower), to_minute(upper)),
+            )
+    finally:
+        cursor.close()
+
+
+def load_instruments(conn, interval_minutes):
+    """Тикеры с FIGI, масштабом цен и последней сохраненной свечой интервала"""
+    return pd.read_sql(
+        f"""
+        SELECT c.id AS company_id, c.ticker, c.figi,
+            COALESCE(s.price_scale, -1) AS price_scale, c.min_price_increment,
+            (SELECT MAX(minute) FROM {INTRADAY_TABLE} i
+             WHERE i.company_id = c.id AND i.interval = %(interval)s) AS last_minute
+        FROM companies c
+        LEFT JOIN intraday_price_scales s ON s.company_id = c.id
+        ORDER BY c.ticker
+        """,
+        conn,
+        params={"interval": interval_minutes},
+    )
+
+
+def save_price_scales(conn, scales):
+    """Масштаб фиксируется при первой загрузке тикера и дальше не меняется"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO intraday_price_scales (company_id, price_scale)
+            VALUES (%s, %s) ON CONFLICT (company_id) DO NOTHING
+            """,
+            list(scales.items()),
+        )
+    finally:
+        cursor.close()
+
+
+def ensure_price_scales(conn, instruments) -> dict:
+    """{company_id: масштаб} для тикеров из load_instruments, новым масштаб сохраняется"""
+    scales = dict(zip(instruments["company_id"], instruments["price_scale"].astype(int)))
+    new_scales = {
+        row.company_id: price_scale(row.min_price_increment)
+        for row in instruments.itertuples(index=False)
+        if row.price_scale < 0
+    }
+    if new_scales:
+        save_price_scales(conn, new_scales)
+    scales.update(new_scales)
+    return scales
+
+
+def candle_to_line(company_id, interval_minutes, scale, candle):
+    """Строка COPY для свечи Tinkoff API в компактном формате"""
+    return (
+        f"{company_id}\t{interval_minutes}\t{to_minute(candle.time)}\t"
+        f"{scale_quotation(candle.open, scale)}\t{scale_quotation(candle.high, scale)}\t"
+        f"{scale_quotation(candle.low, scale)}\t{scale_quotation(candle.close, scale)}\t"
+        f"{candle.volume}\t{'t' if candle.is_complete else 'f'}\n"
+    )
+
+
+def copy_intraday_lines(conn, lines) -> int:
+    """COPY строк во временную таблицу и слияние в candles_intraday.
+
+    Как и copy_candle_lines, работает в текущей транзакции.
+    """
+    columns = "company_id, interval, minute, open, high, low, close, volume, is_complete"
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE}
+            (LIKE {INTRADAY_TABLE}) ON COMMIT DELETE ROWS
+            """
+        )
+        cursor.copy_expert(f"COPY {STAGING_TABLE} ({columns}) FROM STDIN", IteratorFile(lines))
+        cursor.execute(
+            f"""
+            INSERT INTO {INTRADAY_TABLE} ({columns})
+            SELECT DISTINCT ON (company_id, interval, minute) {columns}
+            FROM {STAGING_TABLE}
+            ORDER BY company_id, interval, minute
+            ON CONFLICT (company_id, interval, minute) DO UPDATE SET
+                open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume,
+                is_complete = EXCLUDED.is_complete
+            """
+        )
+        rowcount = cursor.rowcount
+        cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+        return rowcount
+    finally:
+        cursor.close()
+
+
+def read_intraday(conn, tickers, interval, left_date, right_date) -> pd.DataFrame:
+    """Внутридневные свечи в обычном виде: datetime и цены в рублях"""
+    interval_minutes = INTRADAY_INTERVALS[interval]
+    frame = pd.read_sql(
+        f"""
+        SELECT c.ticker, i.minute, i.open, i.high, i.low, i.close, i.volume,
+            i.is_complete, s.price_scale
+        FROM {INTRADAY_TABLE} i
+        JOIN companies c ON c.id = i.company_id
+        JOIN intraday_price_scales s ON s.company_id = i.company_id
+        WHERE c.ticker = ANY(%(tickers)s) AND i.interval = %(interval)s
+        AND i.minute >= %(left)s AND i.minute <= %(right)s
+        ORDER BY c.ticker, i.minute
+        """,
+        conn,
+        params={
+            "tickers": list(tickers),
+            "interval": interval_minutes,
+            "left": to_minute(pd.Timestamp(left_date).to_pydatetime()),
+            "right": to_minute(pd.Timestamp(right_date).to_pydatetime()),
+        },
+    )
+    divisor = np.power(10.0, frame.pop("price_scale").to_numpy())
+    for column in PRICE_COLUMNS:
+        frame[column] = frame[column].to_numpy() / divisor
+    frame.insert(1, "datetime", from_minutes(frame.pop("minute")))
+    return frame
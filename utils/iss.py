@@ -0,0 +1,74 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.http_session import TIMEOUT
+from utils.http_session import get_session as get_named_session
+
+logger = logging.getLogger(__name__)
+
+ISS_BASE_URL = os.getenv("ISS_BASE_URL", "https://iss.moex.com/iss")
+MAX_WORKERS = int(os.getenv("ISS_MAX_WORKERS", "8"))
+
+
+def get_session():
+    """Общая для процесса сессия ISS"""
+    return get_named_session("iss", pool_size=MAX_WORKERS)
+
+
+def iss_get(path: str, params=None, session=None) -> dict:
+    """GET к ISS MOEX, path относительно базового URL, например 'securities/sber/dividends.json'"""
+    session = session or get_session()
+    response = session.get(f"{ISS_BASE_URL}/{path}", params=params, timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def iss_get_paged(path: str, params=None, block: str = "history", session=None):
+    """Постраничное чтение блока ISS через параметр start=.
+
+    Конец выборки определяется по блоку <block>.cursor (INDEX, TOTAL, PAGESIZE),
+    а если его нет - по пустой странице.
+    Возвращает (columns, rows) со строками всех страниц.
+    """
+    params = dict(params or {})
+    columns, rows = [], []
+    start = 0
+    while True:
+        data = iss_get(path, params={**params, "start": start}, session=session)
+        page = data.get(block) or {}
+        page_rows = page.get("data", [])
+        columns = page.get("columns", columns)
+        rows.extend(page_rows)
+
+        cursor = data.get(f"{block}.cursor")
+        if cursor and cursor.get("data"):
+            cursor_row = dict(zip(cursor["columns"], cursor["data"][0]))
+            start = cursor_row["INDEX"] + cursor_row["PAGESIZE"]
+            if start >= cursor_row["TOTAL"]:
+                break
+        elif page_rows:
+            start += len(page_rows)
+        else:
+            break
+    return columns, rows
+
+
+def fetch_many(func, items, max_workers: int = MAX_WORKERS):
+    """Параллельно применяет func к items в пуле потоков.
+
+    Ошибка одного запроса не останавливает остальные: она логируется,
+    а элемент попадает в список неудачных.
+    Возвращает ({item: результат}, [item, ...]).
+    """
+    results = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {item: executor.submit(func, item) for item in items}
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                logger.warning(f"Ошибка запроса ISS для {item}: {e}")
+                failed.append(item)
+    return results, failed
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: int, capacity: float = None):
+        """Bucket по квоте API, заданной в запросах в минуту"""
+        return cls(requests_per_minute / 60, capacity)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens):
+        """Забирает токены, если хватает, иначе возвращает время ожидания"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Блокирует поток до появления токенов"""
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class AsyncTokenBucket(TokenBucket):
+    """Тот же token bucket для asyncio: ожидание не блокирует event loop"""
+
+    async def acquire(self, tokens: float = 1.0):
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
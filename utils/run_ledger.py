@@ -0,0 +1,171 @@
+import json
+from datetime import datetime
+
+from utils.candles import _dbapi_cursor
+
+MAX_ATTEMPTS = 3  # после стольких ошибок единица больше не повторяется
+
+# Журнал длинных сборов: прогон разбит на единицы (тикер, период), статус
+# каждой единицы фиксируется в той же транзакции, что и ее данные. Повторный
+# запуск продолжает незавершенный прогон с первой невыполненной единицы.
+LEDGER_DDL = """
+    CREATE TABLE IF NOT EXISTS collection_runs (
+        id SERIAL PRIMARY KEY,
+        job TEXT NOT NULL,
+        params JSONB NOT NULL,
+        end_time TIMESTAMP NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS collection_units (
+        run_id INTEGER NOT NULL REFERENCES collection_runs(id) ON DELETE CASCADE,
+        ticker VARCHAR(20) NOT NULL,
+        period_start TIMESTAMP NOT NULL,
+        period_end TIMESTAMP NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        row_count INTEGER,
+        error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (run_id, ticker, period_start)
+    );
+"""
+
+
+def ensure_ledger(conn):
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(LEDGER_DDL)
+    finally:
+        cursor.close()
+
+
+def open_run(conn, job, params, end_time=None):
+    """Незавершенный прогон job с теми же параметрами или новый.
+
+    Возвращает (run_id, end_time, resumed). Границы периодов считаются от
+    end_time прогона, поэтому при продолжении единицы совпадают с исходными.
+    """
+    params = json.dumps(params, sort_keys=True)
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            """
+            SELECT id, end_time FROM collection_runs
+            WHERE job = %s AND params = %s::jsonb AND status = 'running'
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (job, params),
+        )
+        row = cursor.fetchone()
+        if row:
+            return row[0], row[1], True
+        end_time = end_time or datetime.utcnow()
+        cursor.execute(
+            """
+            INSERT INTO collection_runs (job, params, end_time)
+            VALUES (%s, %s::jsonb, %s)
+            RETURNING id
+            """,
+            (job, params, end_time),
+        )
+        return cursor.fetchone()[0], end_time, False
+    finally:
+        cursor.close()
+
+
+def add_units(conn, run_id, units):
+    """Регистрация единиц (ticker, period_start, period_end); уже известные
+    прогону единицы и их статусы не трогаются"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO collection_units (run_id, ticker, period_start, period_end)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (run_id, ticker, period_start) DO NOTHING
+            """,
+            [(run_id, *unit) for unit in units],
+        )
+    finally:
+        cursor.close()
+
+
+def pending_units(conn, run_id, max_attempts=MAX_ATTEMPTS):
+    """Невыполненные единицы прогона, включая упавшие меньше max_attempts раз"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            """
+            SELECT ticker, period_start, period_end FROM collection_units
+            WHERE run_id = %s AND status <> 'done' AND attempts < %s
+            ORDER BY ticker, period_start DESC
+            """,
+            (run_id, max_attempts),
+        )
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def complete_unit(conn, run_id, ticker, period_start, row_count):
+    """Отметка о выполнении; коммитится вместе с данными единицы"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            """
+            UPDATE collection_units
+            SET status = 'done', attempts = attempts + 1, row_count = %s,
+                error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE run_id = %s AND ticker = %s AND period_start = %s
+            """,
+            (row_count, run_id, ticker, period_start),
+        )
+    finally:
+        cursor.close()
+
+
+def fail_unit(conn, run_id, ticker, period_start, error):
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            """
+            UPDATE collection_units
+            SET status = 'failed', attempts = attempts + 1, error = %s,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE run_id = %s AND ticker = %s AND period_start = %s
+            """,
+            (str(error), run_id, ticker, period_start),
+        )
+    finally:
+        cursor.close()
+
+
+def run_progress(conn, run_id):
+    """Количество единиц прогона по статусам"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            "SELECT status, COUNT(*) FROM collection_units WHERE run_id = %s GROUP BY status",
+            (run_id,),
+        )
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def finish_run(conn, run_id, status="done"):
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            """
+            UPDATE collection_runs
+            SET status = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            """,
+            (status, run_id),
+        )
+    finally:
+        cursor.close()
@@ -0,0 +1,323 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Union
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_TZ = ZoneInfo(os.getenv("SCHEDULER_TZ", "Europe/Moscow"))
+MAX_WORKERS = int(os.getenv("SCHEDULER_MAX_WORKERS", "4"))  # одновременно работающих задач
+MAX_SLEEP = 60  # планировщик просыпается не реже раза в минуту (сдвиг часов, новые задачи)
+# Упавшая задача повторяется через RETRY_DELAY, 2 * RETRY_DELAY, ... до RETRIES раз,
+# а не ждет следующего срабатывания (у дивидендов это 30 дней)
+RETRIES = int(os.getenv("SCHEDULER_RETRIES", "3"))
+RETRY_DELAY = timedelta(minutes=int(os.getenv("SCHEDULER_RETRY_MINUTES", "5")))
+
+RUNS_DDL = """
+    CREATE TABLE IF NOT EXISTS scheduler_runs (
+        job TEXT PRIMARY KEY,
+        last_fire_at TIMESTAMPTZ,
+        last_started_at TIMESTAMPTZ,
+        last_finished_at TIMESTAMPTZ,
+        last_status TEXT,
+        last_error TEXT,
+        last_duration DOUBLE PRECISION
+    )
+"""
+
+
+class IntervalTrigger:
+    """Срабатывания на фиксированной сетке start + k * interval.
+
+    Сетка не зависит от времени запуска процесса и длительности задачи,
+    поэтому после рестарта задачи не уезжают.
+    """
+
+    def __init__(self, seconds=0, minutes=0, hours=0, days=0, start=None):
+        self.interval = timedelta(seconds=seconds, minutes=minutes, hours=hours, days=days)
+        if self.interval <= timedelta(0):
+            raise ValueError("Интервал должен быть положительным")
+        self.start = start or datetime(2020, 1, 1, tzinfo=SCHEDULER_TZ)
+
+    def next_after(self, moment: datetime) -> datetime:
+        steps = (moment - self.start) // self.interval + 1
+        return self.start + max(steps, 0) * self.interval
+
+    def __repr__(self):
+        return f"interval({self.interval})"
+
+
+class CronTrigger:
+    """Cron-выражение из пяти полей: минута час день месяц день_недели.
+
+    Поддерживаются *, списки, диапазоны и шаги (*/15, 1-5, 0,30).
+    День недели: 0 или 7 - воскресенье. Как в cron, если заданы и день
+    месяца, и день недели, достаточно совпадения любого из них.
+    """
+
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str, tz=SCHEDULER_TZ):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидается 5 полей cron: {expression!r}")
+        self.expression = expression
+        self.tz = tz
+        parsed = [self._parse(value, *bounds) for value, bounds in zip(fields, self.BOUNDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(value, low, high):
+        result = set()
+        for part in value.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(x) for x in part.split("-"))
+            else:
+                start = end = int(part)
+                if step:
+                    end = high
+            if not (low <= start <= end <= high):
+                raise ValueError(f"Значение cron вне диапазона {low}-{high}: {value!r}")
+            result.update(range(start, end + 1, int(step) if step else 1))
+        return result
+
+    def _day_matches(self, day):
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        local = moment.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = local.date()
+        for _ in range(366 * 5):
+            if day.month in self.months and self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = datetime(
+                            day.year, day.month, day.day, hour, minute, tzinfo=self.tz
+                        )
+                        if candidate >= local:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Cron-выражение не срабатывает: {self.expression!r}")
+
+    def __repr__(self):
+        return f"cron({self.expression})"
+
+
+@dataclass
+class Job:
+    """Задача планировщика.
+
+    func - функция или строка 'модуль:функция' / 'путь/к/файлу.py:функция',
+    импортируется при старте планировщика. Синхронные функции выполняются в пуле
+    потоков, корутины - в цикле планировщика.
+    max_instances - сколько запусков задачи могут идти одновременно,
+    лишние срабатывания пропускаются. group - общий лимит для задач,
+    делящих один ресурс (например, квоту API). После ошибки задача
+    повторяется до retries раз с паузой retry_delay, удваивающейся с каждой
+    попыткой, если следующее срабатывание не наступит раньше.
+    """
+
+    name: str
+    func: Union[Callable, str]
+    trigger: Union[IntervalTrigger, CronTrigger]
+    max_instances: int = 1
+    group: Optional[str] = None
+    catch_up: bool = True  # запустить пропущенное за время простоя сразу после старта
+    retries: int = RETRIES
+    retry_delay: timedelta = RETRY_DELAY
+    running: int = field(default=0, init=False)
+    next_fire: Optional[datetime] = field(default=None, init=False)
+    failures: int = field(default=0, init=False)  # ошибок подряд
+
+    def schedule_retry(self, now) -> Optional[datetime]:
+        """Переносит next_fire на повтор после ошибки; None, если попытки кончились"""
+        if self.failures > self.retries:
+            return None
+        retry_at = now + self.retry_delay * 2 ** (self.failures - 1)
+        self.next_fire = min(self.next_fire or retry_at, retry_at)
+        return retry_at
+
+    def resolve(self) -> Callable:
+        if callable(self.func):
+            return self.func
+        target, _, attr = self.func.rpartition(":")
+        if target.endswith(".py"):
+            # Файлы сервисов лежат в каталогах с дефисами и не импортируются по имени
+            name = "job_" + os.path.splitext(os.path.basename(target))[0]
+            spec = importlib.util.spec_from_file_location(name, target)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(target)
+        self.func = getattr(module, attr)
+        return self.func
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class Scheduler:
+    """Все задачи в одном asyncio-процессе с общими пулом БД и HTTP-сессией.
+
+    Время последнего успешного срабатывания каждой задачи хранится в
+    scheduler_runs: после рестарта задачи, чье срабатывание пришлось на
+    простой или упало, запускаются сразу (один раз, без повтора каждого
+    пропуска), остальные ждут своего времени по сетке. Функции задач
+    импортируются при старте в потоке, а не в цикле событий.
+    """
+
+    def __init__(self, jobs, engine, groups=None, max_workers=MAX_WORKERS):
+        self.jobs = {job.name: job for job in jobs}
+        self.engine = engine
+        self.groups = {name: asyncio.Semaphore(limit) for name, limit in (groups or {}).items()}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.tasks = set()
+
+    def _load_ledger(self):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(RUNS_DDL)
+            rows = conn.exec_driver_sql("SELECT job, last_fire_at FROM scheduler_runs").all()
+        return dict(rows)
+
+    def _record(self, job, fire_time, started, status, error=None):
+        finished = _now()
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                """
+                INSERT INTO scheduler_runs (
+                    job, last_fire_at, last_started_at, last_finished_at,
+                    last_status, last_error, last_duration
+                )
+                VALUES (%(job)s, %(fire)s, %(started)s, %(finished)s,
+                    %(status)s, %(error)s, %(duration)s)
+                ON CONFLICT (job) DO UPDATE SET
+                    -- неудачное срабатывание не засчитывается и догоняется после рестарта
+                    last_fire_at = CASE WHEN EXCLUDED.last_status = 'ok'
+                        THEN EXCLUDED.last_fire_at ELSE scheduler_runs.last_fire_at END,
+                    last_started_at = EXCLUDED.last_started_at,
+                    last_finished_at = EXCLUDED.last_finished_at,
+                    last_status = EXCLUDED.last_status,
+                    last_error = EXCLUDED.last_error,
+                    last_duration = EXCLUDED.last_duration
+                """,
+                {
+                    "job": job.name,
+                    "fire": fire_time if status == "ok" else None,
+                    "started": started,
+                    "finished": finished,
+                    "status": status,
+                    "error": error,
+                    "duration": (finished - started).total_seconds(),
+                },
+            )
+
+    def _plan(self, ledger):
+        now = _now()
+        for job in self.jobs.values():
+            last_fire = ledger.get(job.name)
+            if last_fire is None:
+                job.next_fire = now  # новая задача: первый запуск сразу, как делали сервисы
+            elif job.catch_up:
+                job.next_fire = job.trigger.next_after(last_fire)
+            else:
+                job.next_fire = job.trigger.next_after(now)
+            logger.info(
+                f"{job.name} {job.trigger}: следующий запуск "
+                f"{job.next_fire.astimezone(SCHEDULER_TZ):%Y-%m-%d %H:%M:%S}"
+            )
+
+    async def _run(self, job, fire_time):
+        if job.running >= job.max_instances:
+            logger.warning(f"⏭ {job.name}: предыдущий запуск еще идет, срабатывание пропущено")
+            return
+        job.running += 1
+        loop = asyncio.get_running_loop()
+        group = self.groups.get(job.group)
+        started = _now()
+        status, error = "ok", None
+        try:
+            if group is not None:
+                await group.acquire()
+            try:
+                func = job.func if callable(job.func) else await asyncio.to_thread(job.resolve)
+                logger.info(f"▶ {job.name}")
+                monotonic = time.monotonic()
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await loop.run_in_executor(self.executor, func)
+                logger.info(f"✅ {job.name}: {time.monotonic() - monotonic:.1f} с")
+            finally:
+                if group is not None:
+                    group.release()
+        except Exception as e:
+            status, error = "failed", repr(e)
+            logger.exception(f"❌ {job.name}: {e}")
+        finally:
+            job.running -= 1
+        if status == "ok":
+            job.failures = 0
+        else:
+            job.failures += 1
+            retry_at = job.schedule_retry(_now())
+            if retry_at is None:
+                logger.error(
+                    f"❌ {job.name}: {job.failures} ошибок подряд, повторы исчерпаны, "
+                    f"ждем срабатывания {job.next_fire.astimezone(SCHEDULER_TZ):%Y-%m-%d %H:%M}"
+                )
+            else:
+                logger.warning(
+                    f"🔁 {job.name}: повтор {job.failures}/{job.retries} "
+                    f"в {job.next_fire.astimezone(SCHEDULER_TZ):%H:%M:%S}"
+                )
+        try:
+            await loop.run_in_executor(None, self._record, job, fire_time, started, status, error)
+        except Exception as e:
+            logger.error(f"Не удалось записать запуск {job.name}: {e}")
+
+    async def _resolve_jobs(self):
+        for job in self.jobs.values():
+            try:
+                await asyncio.to_thread(job.resolve)
+            except Exception as e:
+                # Задача упадет и повторится при запуске, остальные работают
+                logger.exception(f"❌ {job.name}: не удалось импортировать {job.func}: {e}")
+
+    async def run(self):
+        await self._resolve_jobs()
+        ledger = await asyncio.to_thread(self._load_ledger)
+        self._plan(ledger)
+        while True:
+            now = _now()
+            for job in self.jobs.values():
+                if job.next_fire <= now:
+                    task = asyncio.create_task(self._run(job, job.next_fire))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                    # Все пропущенные срабатывания схлопываются в одно
+                    job.next_fire = job.trigger.next_after(now)
+            wake = min(job.next_fire for job in self.jobs.values())
+            await asyncio.sleep(min(max((wake - _now()).total_seconds(), 0), MAX_SLEEP))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,285 @@
+import ast
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from utils.candles import _dbapi_cursor
+
+logger = logging.getLogger(__name__)
+
+PARTITION_GRANULARITY = os.getenv("CANDLES_PARTITION", "year")  # year | month
+PARTITIONS_FROM = datetime(2000, 1, 1)  # начало истории для новой базы
+MIGRATION_CHUNK = "month"  # сколько копируется в одной транзакции
+CATCHUP_DAYS = 7  # окно свежих свечей, которые ingest мог переписать во время миграции
+
+CANDLE_COPY_COLUMNS = (
+    "id",
+    "ticker",
+    "datetime",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "is_complete",
+    "created_at",
+)
+
+
+def candles_ddl(table="candles") -> str:
+    """Свечи, партиционированные по диапазону datetime.
+
+    Уникальный ключ (ticker, datetime) сразу покрывающий: выборки OHLCV
+    по тикеру и периоду читаются только из индекса. BRIN по datetime
+    почти ничего не весит и сужает сканирование по датам без тикера.
+    """
+    return f"""
+        CREATE SEQUENCE IF NOT EXISTS candles_id_seq;
+
+        CREATE TABLE {table} (
+            id BIGINT NOT NULL DEFAULT nextval('candles_id_seq'),
+            ticker VARCHAR(20) REFERENCES companies(ticker),
+            datetime TIMESTAMP NOT NULL,
+            open DECIMAL(15,6),
+            high DECIMAL(15,6),
+            low DECIMAL(15,6),
+            close DECIMAL(15,6),
+            volume BIGINT,
+            is_complete BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT uq_candles_ticker_datetime UNIQUE (ticker, datetime)
+                INCLUDE (open, high, low, close, volume)
+        ) PARTITION BY RANGE (datetime);
+
+        CREATE INDEX brin_candles_datetime ON {table} USING brin (datetime);
+        CREATE TABLE candles_default PARTITION OF {table} DEFAULT;
+    """
+
+
+def _period_start(dt, granularity):
+    if granularity == "month":
+        return datetime(dt.year, dt.month, 1)
+    return datetime(dt.year, 1, 1)
+
+
+def _next_period(start, granularity):
+    if granularity == "month":
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return datetime(start.year + 1, 1, 1)
+
+
+def periods(start, end, granularity):
+    """Границы [lower, upper) периодов, покрывающих [start, end]"""
+    lower = _period_start(start, granularity)
+    while lower <= end:
+        upper = _next_period(lower, granularity)
+        yield lower, upper
+        lower = upper
+
+
+def partition_name(lower, granularity):
+    if granularity == "month":
+        return f"candles_m{lower:%Y%m}"
+    return f"candles_y{lower:%Y}"
+
+
+def table_kind(conn, table="candles"):
+    """'p' - партиционированная, 'r' - обычная таблица, None - нет таблицы"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,)
+        )
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+
+def ensure_partitions(conn, start, end, table="candles", granularity=PARTITION_GRANULARITY):
+    """Создает недостающие партиции на период [start, end]"""
+    cursor = _dbapi_cursor(conn)
+    try:
+        for lower, upper in periods(start, end, granularity):
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {partition_name(lower, granularity)}
+                PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)
+                """,
+                (lower, upper),
+            )
+    finally:
+        cursor.close()
+
+
+def ensure_current_partitions(conn, table="candles", granularity=PARTITION_GRANULARITY):
+    """Партиции на текущий и следующий период, чтобы свежие свечи не уходили в DEFAULT"""
+    if table_kind(conn, table) != "p":
+        return
+    now = datetime.now()
+    ensure_partitions(conn, now, _next_period(now, granularity), table, granularity)
+
+
+def create_candles(conn, granularity=PARTITION_GRANULARITY):
+    """Создает партиционированную candles в новой базе; существующую не трогает"""
+    if table_kind(conn) is not None:
+        ensure_current_partitions(conn, granularity=granularity)
+        return
+    cursor = _dbapi_cursor(conn)
+    try:
+        cursor.execute(candles_ddl())
+    finally:
+        cursor.close()
+    now = datetime.now()
+    ensure_partitions(conn, PARTITIONS_FROM, _next_period(now, granularity), granularity=granularity)
+
+
+def migrate_candles(engine, granularity=PARTITION_GRANULARITY, drop_legacy=False):
+    """Онлайн-перенос обычной candles в партиционированную.
+
+    1. Рядом создается candles_new с партициями на весь диапазон данных.
+    2. Данные копируются по месяцам, каждый месяц в своей транзакции:
+       таблица остается доступной на чтение и запись, а прерванный перенос
+       можно перезапустить - уже скопированные строки пропускаются.
+    3. В короткой финальной транзакции под EXCLUSIVE-блокировкой (чтение
+       не блокируется) досинхронизируются строки, записанные за время
+       переноса, и таблицы меняются именами. Старая остается candles_legacy.
+    """
+    columns = ", ".join(CANDLE_COPY_COLUMNS)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in CANDLE_COPY_COLUMNS[3:])
+
+    with engine.begin() as conn:
+        kind = table_kind(conn)
+        if kind == "p":
+            logger.info("candles уже партиционирована")
+            return
+        if kind is None:
+            create_candles(conn, granularity)
+            return
+        started, first, last = conn.exec_driver_sql(
+            "SELECT now()::timestamp, MIN(datetime), MAX(datetime) FROM candles"
+        ).one()
+        if table_kind(conn, "candles_new") is None:
+            conn.exec_driver_sql(candles_ddl("candles_new"))
+        first = first or started
+        horizon = _next_period(max(last or started, started), granularity)
+        ensure_partitions(conn, first, horizon, "candles_new", granularity)
+
+    copied = 0
+    for lower, upper in periods(first, last or first, MIGRATION_CHUNK):
+        with engine.begin() as conn:
+            result = conn.exec_driver_sql(
+                f"""
+                INSERT INTO candles_new ({columns})
+                SELECT {columns} FROM candles
+                WHERE datetime >= %(lower)s AND datetime < %(upper)s
+                ON CONFLICT (ticker, datetime) DO NOTHING
+                """,
+                {"lower": lower, "upper": upper},
+            )
+            copied += result.rowcount
+        logger.info(f"candles {lower:%Y-%m}: перенесено {result.rowcount}, всего {copied}")
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("LOCK TABLE candles IN EXCLUSIVE MODE")
+        result = conn.exec_driver_sql(
+            f"""
+            INSERT INTO candles_new ({columns})
+            SELECT {columns} FROM candles
+            WHERE created_at >= %(started)s OR datetime >= %(recent)s
+            ON CONFLICT (ticker, datetime) DO UPDATE SET {updates}
+            """,
+            {"started": started, "recent": started - timedelta(days=CATCHUP_DAYS)},
+        )
+        logger.info(f"Досинхронизировано {result.rowcount} свечей")
+        conn.exec_driver_sql("ALTER TABLE candles RENAME TO candles_legacy")
+        conn.exec_driver_sql("ALTER TABLE candles_new RENAME TO candles")
+        conn.exec_driver_sql("ALTER SEQUENCE candles_id_seq OWNED BY candles.id")
+        conn.exec_driver_sql(
+            "SELECT setval('candles_id_seq', GREATEST((SELECT MAX(id) FROM candles), 1))"
+        )
+        if drop_legacy:
+            conn.exec_driver_sql("DROP TABLE candles_legacy")
+    logger.info("candles переведена на партиции")
+
+
+def parse_reactions(value):
+    """Старое значение reactions_counters в объект для JSONB или None.
+
+    Ранние версии сборщика писали str() списка словарей Python: одинарные
+    кавычки, True/False/None, апострофы внутри строк. Такой текст разбирается
+    ast.literal_eval, уже записанный JSON - json.loads.
+    """
+    if value is None or not value.strip():
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def migrate_tpulse_reactions(engine, table="t_pulse_data", chunk=10_000):
+    """Однократный перевод reactions_counters из текста в JSONB.
+
+    Значения разбираются в Python (parse_reactions), нераспознанные
+    становятся NULL. Все в одной транзакции: при ошибке столбец остается
+    текстовым. Возвращает (перенесено, стало NULL) или None, если переводить
+    нечего.
+    """
+    with engine.begin() as conn:
+        column_type = conn.exec_driver_sql(
+            """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = %(table)s AND column_name = 'reactions_counters'
+            """,
+            {"table": table},
+        ).scalar()
+        if column_type is None or column_type == "jsonb":
+            logger.info(f"{table}.reactions_counters уже JSONB или таблицы нет")
+            return None
+
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN reactions_jsonb jsonb")
+        reader = conn.connection.cursor(name="reactions_reader")  # серверный курсор
+        writer = _dbapi_cursor(conn)
+        migrated = invalid = 0
+        try:
+            reader.execute(
+                f"SELECT id, ticker, reactions_counters FROM {table} "
+                "WHERE reactions_counters IS NOT NULL"
+            )
+            while rows := reader.fetchmany(chunk):
+                values = []
+                for post_id, ticker, raw in rows:
+                    parsed = parse_reactions(raw)
+                    if parsed is None:
+                        invalid += 1
+                        continue
+                    values.append((post_id, ticker, json.dumps(parsed, ensure_ascii=False)))
+                execute_values(
+                    writer,
+                    f"""
+                    UPDATE {table} t SET reactions_jsonb = v.value::jsonb
+                    FROM (VALUES %s) AS v (id, ticker, value)
+                    WHERE t.id = v.id AND t.ticker = v.ticker
+                    """,
+                    values,
+                    page_size=chunk,
+                )
+                migrated += len(values)
+        finally:
+            reader.close()
+            writer.close()
+
+        conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN reactions_counters")
+        conn.exec_driver_sql(
+            f"ALTER TABLE {table} RENAME COLUMN reactions_jsonb TO reactions_counters"
+        )
+    logger.info(f"{table}.reactions_counters переведена в JSONB: {migrated}, NULL: {invalid}")
+    return migrated, invalid
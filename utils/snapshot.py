@@ -0,0 +1,216 @@
+import io
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import csv, fs
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "data/snapshot")
+MANIFEST = "_manifest.json"
+
+# table: (колонка партиции или None, колонка времени или None).
+# Таблицы с колонкой времени партиционируются еще и по году и выгружаются
+# инкрементально, остальные небольшие и перезаписываются целиком.
+SNAPSHOT_TABLES = {
+    "candles": ("ticker", "datetime"),
+    "companies": (None, None),
+    "cbrf_data": (None, "date"),
+    "moex_iss_indices": ("index_code", "date"),
+    "moex_iss_dividends": ("ticker", None),
+    "t_pulse_data": ("ticker", "inserted"),
+}
+
+CSV_READ_OPTIONS = csv.ReadOptions(block_size=64 << 20)
+CSV_PARSE_OPTIONS = csv.ParseOptions(newlines_in_values=True)  # тексты постов многострочные
+
+
+def _copy_to_arrow(conn, query, params=None, column_types=None) -> pa.Table:
+    """SELECT через COPY TO STDOUT сразу в Arrow, без Python-объектов на каждое значение"""
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify(query, params).decode() if params else query
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+    finally:
+        cursor.close()
+    buffer.seek(0)
+    return csv.read_csv(
+        buffer,
+        read_options=CSV_READ_OPTIONS,
+        parse_options=CSV_PARSE_OPTIONS,
+        convert_options=csv.ConvertOptions(
+            column_types=column_types or {},
+            strings_can_be_null=True,
+            true_values=["t"],  # BOOLEAN в CSV-выводе Postgres
+            false_values=["f"],
+        ),
+    )
+
+
+def _with_year(table: pa.Table, time_column) -> pa.Table:
+    column = table[time_column]
+    if pa.types.is_string(column.type):  # даты, хранящиеся текстом
+        column = pc.strptime(column, format="%Y-%m-%d", unit="s")
+    return table.append_column("year", pc.year(column).cast(pa.int32()))
+
+
+def load_manifest(base_dir=SNAPSHOT_DIR) -> dict:
+    path = os.path.join(base_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, base_dir=SNAPSHOT_DIR):
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)  # манифест меняется атомарно
+
+
+def _write(table: pa.Table, path, partition_columns):
+    partitioning = None
+    if partition_columns:
+        partitioning = ds.partitioning(
+            pa.schema([(name, table.schema.field(name).type) for name in partition_columns]),
+            flavor="hive",
+        )
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=partitioning,
+        # Перезаписываются только партиции, попавшие в выгрузку
+        existing_data_behavior="delete_matching" if partition_columns else "overwrite_or_ignore",
+        basename_template="part-{i}.parquet",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+def export_table(conn, name, base_dir=SNAPSHOT_DIR, full=False, manifest=None) -> int:
+    """Выгружает таблицу в base_dir/<name> как Parquet с hive-партициями.
+
+    Инкрементальный режим перечитывает только годы, начиная с года последней
+    выгруженной строки, и перезаписывает их партиции; запрос идет по одной
+    партиции верхнего уровня (тикеру), так что в памяти не больше ее данных.
+    Возвращает число выгруженных строк.
+    """
+    partition_column, time_column = SNAPSHOT_TABLES[name]
+    manifest = load_manifest(base_dir) if manifest is None else manifest
+    path = os.path.join(base_dir, name)
+    column_types = {partition_column: pa.string()} if partition_column else None
+
+    since = None
+    if time_column and not full and name in manifest:
+        since = datetime(datetime.fromisoformat(manifest[name]["watermark"]).year, 1, 1)
+    condition = f"{time_column}::timestamp >= %(since)s" if since else "TRUE"
+
+    if (full or time_column is None) and os.path.isdir(path):
+        shutil.rmtree(path)
+
+    if time_column is None:
+        table = _copy_to_arrow(conn, f"SELECT * FROM {name}", column_types=column_types)
+        _write(table, path, [partition_column] if partition_column else None)
+        manifest[name] = {"rows": table.num_rows, "exported_at": datetime.now().isoformat()}
+        return table.num_rows
+
+    partition_columns = [partition_column, "year"] if partition_column else ["year"]
+    if partition_column:
+        keys = [
+            key
+            for (key,) in conn.exec_driver_sql(
+                f"SELECT DISTINCT {partition_column} FROM {name} WHERE {condition}",
+                {"since": since},
+            ).all()
+        ]
+        chunks = [
+            (
+                f"SELECT * FROM {name} WHERE {partition_column} = %(key)s AND {condition}",
+                {"key": key, "since": since},
+            )
+            for key in keys
+        ]
+    else:
+        chunks = [(f"SELECT * FROM {name} WHERE {condition}", {"since": since})]
+
+    rows = 0
+    watermark = manifest.get(name, {}).get("watermark")
+    for query, params in chunks:
+        table = _copy_to_arrow(conn, query, params, column_types)
+        if not table.num_rows:
+            continue
+        table = _with_year(table, time_column)
+        _write(table, path, partition_columns)
+        rows += table.num_rows
+        latest = pc.max(table[time_column]).as_py()
+        latest = latest if isinstance(latest, str) else latest.isoformat()
+        watermark = max(watermark, latest) if watermark else latest
+
+    manifest[name] = {
+        "rows": rows,
+        "since": since.isoformat() if since else None,
+        "watermark": watermark,
+        "exported_at": datetime.now().isoformat(),
+    }
+    return rows
+
+
+def export_snapshot(conn, tables=None, base_dir=SNAPSHOT_DIR, full=False) -> dict:
+    """Инкрементальная выгрузка таблиц в Parquet, возвращает {таблица: строк}"""
+    manifest = load_manifest(base_dir)
+    exported = {}
+    for name in tables or SNAPSHOT_TABLES:
+        exported[name] = export_table(conn, name, base_dir, full, manifest)
+        save_manifest(manifest, base_dir)  # отметка сдвигается после каждой таблицы
+        logger.info(f"Snapshot {name}: выгружено {exported[name]} строк")
+    return exported
+
+
+def snapshot_dataset(name, base_dir=SNAPSHOT_DIR) -> ds.Dataset:
+    """Parquet-датасет таблицы со снимка, файлы читаются через memory map"""
+    return ds.dataset(
+        os.path.join(base_dir, name),
+        format="parquet",
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_snapshot(name, columns=None, filter=None, base_dir=SNAPSHOT_DIR) -> pa.Table:
+    """Чтение таблицы снимка с проталкиванием фильтра.
+
+    filter - выражение pyarrow.dataset, например
+    (ds.field("ticker") == "SBER") & (ds.field("year") >= 2020): условия на
+    партиции отсекают каталоги, остальные - row group по статистикам Parquet.
+    """
+    return snapshot_dataset(name, base_dir).to_table(columns=columns, filter=filter)
+
+
+def read_candles(tickers=None, left_date=None, right_date=None, columns=None, base_dir=SNAPSHOT_DIR):
+    """Свечи со снимка в pandas, аналог SELECT * FROM candles WHERE ..."""
+    conditions = []
+    if tickers is not None:
+        conditions.append(ds.field("ticker").isin(list(tickers)))
+    if left_date is not None:
+        left = datetime.fromisoformat(str(left_date))
+        conditions.append(ds.field("year") >= left.year)
+        conditions.append(ds.field("datetime") >= pa.scalar(left, pa.timestamp("s")))
+    if right_date is not None:
+        right = datetime.fromisoformat(str(right_date))
+        conditions.append(ds.field("year") <= right.year)
+        conditions.append(ds.field("datetime") <= pa.scalar(right, pa.timestamp("s")))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    table = read_snapshot("candles", columns, expression, base_dir)
+    return table.to_pandas().sort_values(["ticker", "datetime"], ignore_index=True)
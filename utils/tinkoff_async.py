@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import pickle
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from tinkoff.invest import AsyncClient, CandleInterval
+
+from utils.http_cache import get_cache
+from utils.rate_limit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Адрес gRPC API, по умолчанию боевой; для нагрузочных тестов - локальная заглушка
+TINKOFF_TARGET = os.getenv("TINKOFF_TARGET")
+
+# Квота MarketDataService на unary-запросы (GetCandles) для одного токена
+MARKET_DATA_REQUESTS_PER_MINUTE = 600
+MAX_CONCURRENCY = 16
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Максимальный период одного запроса GetCandles для интервала
+INTERVAL_WINDOWS = {
+    CandleInterval.CANDLE_INTERVAL_1_MIN: timedelta(days=1),
+    CandleInterval.CANDLE_INTERVAL_5_MIN: timedelta(days=1),
+    CandleInterval.CANDLE_INTERVAL_15_MIN: timedelta(days=1),
+    CandleInterval.CANDLE_INTERVAL_HOUR: timedelta(days=7),
+    CandleInterval.CANDLE_INTERVAL_DAY: timedelta(days=365),
+}
+
+
+def client_options():
+    """Аргументы Client/AsyncClient: target, если адрес API переопределен"""
+    return {"target": TINKOFF_TARGET} if TINKOFF_TARGET else {}
+
+
+def split_period(from_, to, window):
+    """Разбивает период на окна, допустимые для одного запроса GetCandles"""
+    start = from_
+    while start < to:
+        end = min(start + window, to)
+        yield start, end
+        start = end
+
+
+def align_period(from_, to):
+    """Период, расширенный до границ суток: окна и их ключи в кэше не зависят
+    от микросекунд utcnow() и совпадают между запусками"""
+    start = from_.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = to.replace(hour=0, minute=0, second=0, microsecond=0)
+    if end < to:
+        end += timedelta(days=1)
+    return start, end
+
+
+def candles_url(figi, start, end, interval):
+    """Условный URL запроса GetCandles - ключ в кэше ответов"""
+    query = urlencode(
+        {"figi": figi, "from": start.isoformat(), "to": end.isoformat(), "interval": int(interval)}
+    )
+    return f"tinkoff://market_data/get_candles?{query}"
+
+
+async def _fetch_window(client, bucket, semaphore, figi, start, end, interval):
+    """Один запрос GetCandles; с HTTP_CACHE=on|offline окно сначала ищется в кэше"""
+    cache = get_cache()
+    if cache is None:
+        return await _request_window(client, bucket, semaphore, figi, start, end, interval)
+    url = candles_url(figi, start, end, interval)
+    body = cache.load(url)
+    if body is not None:
+        return pickle.loads(body)
+    candles = await _request_window(client, bucket, semaphore, figi, start, end, interval)
+    cache.save(url, pickle.dumps(candles))
+    return candles
+
+
+def get_candles(
+    client, figi, from_, to, interval=CandleInterval.CANDLE_INTERVAL_DAY, limiter=None
+):
+    """Свечи за период через синхронный Client, один GetCandles на окно.
+
+    Окна выровнены так же, как у fetch_candles_async, и с HTTP_CACHE=on|offline
+    берутся из того же кэша. limiter - общий TokenBucket квоты API, токен
+    забирается перед каждым запросом в сеть.
+    """
+    cache = get_cache()
+    unique = {}
+    for start, end in split_period(*align_period(from_, to), INTERVAL_WINDOWS[interval]):
+        url = candles_url(figi, start, end, interval)
+        body = cache.load(url) if cache is not None else None
+        if body is not None:
+            candles = pickle.loads(body)
+        else:
+            if limiter is not None:
+                limiter.acquire()
+            candles = client.market_data.get_candles(
+                figi=figi, from_=start, to=end, interval=interval
+            ).candles
+            if cache is not None:
+                cache.save(url, pickle.dumps(candles))
+        unique.update((candle.time, candle) for candle in candles)
+    return [unique[time] for time in sorted(unique)]
+
+
+async def _request_window(client, bucket, semaphore, figi, start, end, interval):
+    """Один запрос GetCandles с ограничением скорости и повторами"""
+    async with semaphore:
+        for attempt in range(MAX_RETRIES):
+            await bucket.acquire()
+            try:
+                response = await client.market_data.get_candles(
+                    figi=figi, from_=start, to=end, interval=interval
+                )
+                return response.candles
+            except Exception as e:
+                logger.warning(
+                    f"Ошибка запроса свечей {figi} {start:%Y-%m-%d}..{end:%Y-%m-%d}: {e}, "
+                    f"попытка {attempt + 1}/{MAX_RETRIES}"
+                )
+                if attempt + 1 == MAX_RETRIES:
+                    raise
+                await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
+
+
+async def fetch_candles_async(
+    jobs,
+    token,
+    interval=CandleInterval.CANDLE_INTERVAL_DAY,
+    max_concurrency: int = MAX_CONCURRENCY,
+    requests_per_minute: int = MARKET_DATA_REQUESTS_PER_MINUTE,
+):
+    """Конкурентная загрузка свечей по списку заданий (key, figi, from_, to).
+
+    Все задания и все окна запросов идут через один канал AsyncClient,
+    не больше max_concurrency одновременно и в пределах квоты API.
+    Возвращает ({key: [HistoricCandle, ...]}, [(key, from_, to, ошибка), ...]).
+    """
+    window = INTERVAL_WINDOWS[interval]
+    bucket = AsyncTokenBucket.per_minute(requests_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with AsyncClient(token, **client_options()) as client:
+        keys, windows, tasks = [], [], []
+        for key, figi, from_, to in jobs:
+            for start, end in split_period(*align_period(from_, to), window):
+                keys.append(key)
+                windows.append((start, end))
+                tasks.append(
+                    _fetch_window(client, bucket, semaphore, figi, start, end, interval)
+                )
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    candles = {}
+    failed = []
+    for key, (start, end), result in zip(keys, windows, results):
+        if isinstance(result, BaseException):
+            failed.append((key, start, end, result))
+            continue
+        candles.setdefault(key, []).extend(result)
+
+    for key, items in candles.items():
+        # Окна соприкасаются границами, поэтому убираем дубли по времени
+        unique = {candle.time: candle for candle in items}
+        candles[key] = [unique[time] for time in sorted(unique)]
+    return candles, failed
+
+
+def fetch_candles(jobs, token, **kwargs):
+    """Синхронная обертка над fetch_candles_async для скриптов без event loop"""
+    return asyncio.run(fetch_candles_async(jobs, token, **kwargs))
@@ -0,0 +1,172 @@
+import io
+
+import pandas as pd
+from sqlalchemy import or_, text
+from sqlalchemy.dialects.postgresql import insert
+
+DEFAULT_BATCH_SIZE = 5000
+
+# (база, индекс), уже найденные в каталоге: повторные update_db не ходят в каталог
+_checked_indexes = set()
+
+
+def ensure_unique_index(conn, table, key_columns, dedupe: bool = False):
+    """Создает уникальный индекс по натуральному ключу, нужный для ON CONFLICT.
+
+    dedupe=True перед созданием индекса удаляет дубли ключа, оставляя последнюю строку.
+    Индекс, найденный в каталоге, запоминается на время процесса. Только что
+    созданный не запоминается: транзакция с ним еще может откатиться.
+    """
+    index_name = f"uq_{table.name}_{'_'.join(key_columns)}"
+    key = (conn.engine.url, index_name)
+    if key in _checked_indexes:
+        return
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": index_name}).scalar():
+        _checked_indexes.add(key)
+        return
+
+    columns = ", ".join(f'"{col}"' for col in key_columns)
+    if dedupe:
+        condition = " AND ".join(f'a."{col}" = b."{col}"' for col in key_columns)
+        conn.execute(
+            text(
+                f'DELETE FROM "{table.name}" a USING "{table.name}" b '
+                f"WHERE a.ctid < b.ctid AND {condition}"
+            )
+        )
+    conn.execute(
+        text(
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{index_name}" '
+            f'ON "{table.name}" ({columns})'
+        )
+    )
+
+
+def _prepare_frame(df, table, key_columns):
+    """Оставляет колонки таблицы, убирает дубли ключа внутри пачки, NaN -> NULL"""
+    columns = [col for col in table.columns.keys() if col in df.columns]
+    frame = df[columns].drop_duplicates(subset=key_columns, keep="last")
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def _update_columns(columns, key_columns, update_columns):
+    if update_columns is None:
+        return [col for col in columns if col not in key_columns]
+    return list(update_columns)
+
+
+def _change_columns(update_columns, only_changed):
+    """Колонки, по которым определяется изменение строки (True - все обновляемые)"""
+    if only_changed is True:
+        return list(update_columns)
+    return list(only_changed or [])
+
+
+def _upsert_insert(conn, table, frame, key_columns, update_columns, only_changed, batch_size):
+    """Многострочный INSERT ... ON CONFLICT DO UPDATE, один запрос на пачку"""
+    records = frame.to_dict(orient="records")
+    change_columns = _change_columns(update_columns, only_changed)
+    affected = 0
+    for start in range(0, len(records), batch_size):
+        stmt = insert(table).values(records[start : start + batch_size])
+        if update_columns:
+            where = None
+            if change_columns:
+                where = or_(
+                    *[table.c[col].is_distinct_from(stmt.excluded[col]) for col in change_columns]
+                )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key_columns,
+                set_={col: stmt.excluded[col] for col in update_columns},
+                where=where,
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=key_columns)
+        affected += conn.execute(stmt).rowcount
+    return affected
+
+
+def merge_sql(target, staging, columns, key_columns, update_columns, only_changed=False):
+    """SQL слияния staging-таблицы в целевую по натуральному ключу"""
+    cols = ", ".join(f'"{col}"' for col in columns)
+    keys = ", ".join(f'"{col}"' for col in key_columns)
+    if not update_columns:
+        return (
+            f'INSERT INTO "{target}" ({cols}) SELECT {cols} FROM "{staging}" '
+            f"ON CONFLICT ({keys}) DO NOTHING"
+        )
+    assignments = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in update_columns)
+    sql = (
+        f'INSERT INTO "{target}" ({cols}) SELECT {cols} FROM "{staging}" '
+        f"ON CONFLICT ({keys}) DO UPDATE SET {assignments}"
+    )
+    change_columns = _change_columns(update_columns, only_changed)
+    if change_columns:
+        sql += " WHERE " + " OR ".join(
+            f'"{target}"."{col}" IS DISTINCT FROM EXCLUDED."{col}"' for col in change_columns
+        )
+    return sql
+
+
+def _upsert_copy(conn, table, frame, key_columns, update_columns, only_changed, batch_size):
+    """COPY во временную таблицу и слияние одним INSERT ... SELECT на пачку"""
+    columns = list(frame.columns)
+    staging = f"tmp_{table.name}_upsert"
+    cols = ", ".join(f'"{col}"' for col in columns)
+    sql = merge_sql(table.name, staging, columns, key_columns, update_columns, only_changed)
+
+    affected = 0
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS "{staging}" '
+            f'(LIKE "{table.name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        for start in range(0, len(frame), batch_size):
+            buffer = io.StringIO()
+            frame.iloc[start : start + batch_size].to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.execute(f'TRUNCATE "{staging}"')
+            cursor.copy_expert(f'COPY "{staging}" ({cols}) FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(sql)
+            affected += cursor.rowcount
+    finally:
+        cursor.close()
+    return affected
+
+
+def upsert_dataframe(
+    df: pd.DataFrame,
+    table,
+    key_columns,
+    conn,
+    method: str = "insert",
+    update_columns=None,
+    only_changed=False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """Пакетный upsert DataFrame в таблицу по натуральному ключу.
+
+    method="insert" - многострочный INSERT ... ON CONFLICT,
+    method="copy" - COPY во временную таблицу и слияние.
+    only_changed=True (или список колонок) обновляет только строки,
+    у которых эти колонки действительно изменились.
+    Должен вызываться внутри транзакции (engine.begin()).
+    Возвращает количество вставленных и обновленных строк.
+    """
+    if df.empty:
+        return 0
+
+    key_columns = list(key_columns)
+    frame = _prepare_frame(df, table, key_columns)
+    update_columns = _update_columns(frame.columns, key_columns, update_columns)
+
+    if method == "insert":
+        return _upsert_insert(
+            conn, table, frame, key_columns, update_columns, only_changed, batch_size
+        )
+    if method == "copy":
+        return _upsert_copy(
+            conn, table, frame, key_columns, update_columns, only_changed, batch_size
+        )
+    raise ValueError(f"Неизвестный метод upsert: {method}")
@@ -1,60 +1,110 @@
-from sqlalchemy import create_engine
 import os
+import threading
+from typing import TYPE_CHECKING
+
 from dotenv import load_dotenv
+from sqlalchemy import MetaData, Table, create_engine
+from sqlalchemy.engine import URL
 
-import pandas as pd
-from stockstats import StockDataFrame
+if TYPE_CHECKING:
+    import pandas as pd
 
 load_dotenv()
 
+# Пул соединений общий на процесс: сервисы пишут редко, но много раз за жизнь
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # секунд, до таймаутов прокси/сервера
 
-def connection():
-    db_params = {
-        "dbname": os.getenv("DB_NAME"),
-        "user": os.getenv("DB_USER"),
-        "password": os.getenv("DB_PASSWORD"),
-        "host": os.getenv("DB_HOST"),
-        "port": os.getenv("DB_PORT"),
-    }
-    conn_str = f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
-    return create_engine(conn_str)
+_engines = {}
+_metadata = {}
+_lock = threading.Lock()
 
 
-def data_from_ticker(
-    ticker: str, left_date: str, right_date: str, conn
-) -> pd.DataFrame:
-    shares = pd.read_sql(
-        f"""
-        SELECT * FROM candles
-        WHERE ticker = '{ticker}'
-        AND datetime >= '{left_date}' AND datetime <= '{right_date}'
-        ORDER BY datetime DESC
-    """,
-        conn,
+def database_url(driver="psycopg2") -> URL:
+    port = os.getenv("DB_PORT")
+    return URL.create(
+        f"postgresql+{driver}",
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=int(port) if port else None,
+        database=os.getenv("DB_NAME"),
     )
 
-    shares = shares.drop_duplicates()
 
-    shares["prev_close"] = shares["close"].shift(1)
-    shares["open_to_prev_close"] = shares["open"] / shares["prev_close"] - 1
-    shares["target"] = shares["close"]
-    shares["delta_open_close"] = shares["open"] - shares["close"]
-    shares["delta_open_close_pct"] = (shares["open"] - shares["close"]) / shares[
-        "close"
-    ]
+def _url_key(url) -> str:
+    return url.render_as_string(hide_password=False)
 
-    stock = StockDataFrame.retype(shares)
 
-    shares["macd"] = stock["macd"]
-    shares["rsi_14"] = stock["rsi_14"]
-    shares["boll_ub"] = stock["boll_ub"]
-    shares["boll_lb"] = stock["boll_lb"]
+def _pool_options():
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": True,  # соединение, оборванное между итерациями сервиса, заменяется молча
+    }
+
+
+def connection():
+    """Engine процесса: создается при первом вызове, дальше переиспользуется
+    вместе с пулом соединений"""
+    key = ("sync", _url_key(database_url()))
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_engine(database_url(), **_pool_options())
+                _engines[key] = engine
+    return engine
 
-    shares = shares.drop(columns=["open", "prev_close", "close"])
 
-    for col in shares.columns:
-        shares[col] = shares[col].ffill()
+def async_connection():
+    """AsyncEngine процесса для asyncio-сборщиков (драйвер asyncpg)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
 
-    shares = shares.dropna().reset_index(drop=True)
+    key = ("async", _url_key(database_url("asyncpg")))
+    engine = _engines.get(key)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = create_async_engine(database_url("asyncpg"), **_pool_options())
+                _engines[key] = engine
+    return engine
+
+
+def reflect_table(name, engine=None) -> Table:
+    """Отраженная таблица из кэша метаданных engine: схема читается из базы
+    один раз на процесс"""
+    engine = engine or connection()
+    with _lock:
+        metadata = _metadata.setdefault(_url_key(engine.url), MetaData())
+        table = metadata.tables.get(name)
+        if table is None:
+            table = Table(name, metadata, autoload_with=engine)
+    return table
+
+
+def dispose_engines():
+    """Закрывает пулы, например в дочернем процессе после fork"""
+    with _lock:
+        for engine in _engines.values():
+            if hasattr(engine, "sync_engine"):
+                engine.sync_engine.dispose(close=False)
+            else:
+                engine.dispose(close=False)
+        _engines.clear()
+        _metadata.clear()
+
+
+def data_from_ticker(
+    ticker: str, left_date: str, right_date: str, conn
+) -> "pd.DataFrame":
+    """Признаки одного тикера, обертка над utils.features.build_features"""
+    # pandas и numpy нужны только здесь: сервисам, которым нужен лишь
+    # connection(), они при импорте не грузятся
+    from utils.features import build_features
 
-    return shares
+    return build_features([ticker], left_date, right_date, conn)